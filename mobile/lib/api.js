@@ -21,6 +21,7 @@ export const API_ENDPOINTS = {
   // Loyalty Cards
   USER_CARDS: '/api/mobile/user/cards',
   SCAN_NFC: '/api/mobile/scan',
+  SCAN_BATCH: '/api/mobile/scan/batch',
   
   // Companies/Programs
   PROGRAMS: '/api/mobile/programs',
@@ -110,8 +111,10 @@ class ApiService {
   }
 
   // Loyalty card methods
-  async getUserCards() {
-    return this.request(API_ENDPOINTS.USER_CARDS);
+  // Pass the cursor from the previous response to get only what changed since then
+  async getUserCards(since) {
+    const query = since ? `?since=${encodeURIComponent(since)}` : '';
+    return this.request(`${API_ENDPOINTS.USER_CARDS}${query}`);
   }
 
   async createUserCard(companyId) {
@@ -134,6 +137,14 @@ class ApiService {
     });
   }
 
+  // Replay taps queued while offline: [{ idempotency_key, company_id, scanned_at }]
+  async syncScans(userId, scans) {
+    return this.request(API_ENDPOINTS.SCAN_BATCH, {
+      method: 'POST',
+      body: JSON.stringify({ user_id: userId, scans }),
+    });
+  }
+
   async redeemReward(cardId) {
     return this.request('/api/mobile/redeem', {
       method: 'POST',
@@ -152,4 +163,15 @@ class ApiService {
 }
 
 export const apiService = new ApiService();
-export default apiService;
\ No newline at end of file
+export default apiService;
+
+// Apply a getUserCards response to the cards already on screen
+export const mergeCardSync = (cards, response) => {
+  if (response.full) {
+    return response.cards;
+  }
+  const changed = new Set(response.cards.map((card) => card.id));
+  const deleted = new Set(response.deleted);
+  const kept = cards.filter((card) => !changed.has(card.id) && !deleted.has(card.id));
+  return [...response.cards, ...kept];
+};
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+asyncio serving mode for the mobile API (/api/mobile/*)
+
+An ASGI app that keeps every phone's keep-alive connection on the event
+loop and only borrows a thread while a request is actually running. Each
+request is handed to the same Flask views as the WSGI server (so the JSON
+contracts are identical) on a bounded thread pool. When the pool and its
+backlog are full the request gets 503 + Retry-After instead of piling up.
+Idle connections cost a socket and a coroutine, not a thread.
+
+Run (uvicorn is an optional dependency):
+    uvicorn asgi_mobile:app --host 0.0.0.0 --port 5002
+    python3 asgi_mobile.py
+Admin and dashboard routes stay on the regular server.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+PREFIXES = tuple(p for p in os.environ.get('ASGI_PREFIXES', '/api/mobile/').split(',') if p)
+THREADS = int(os.environ.get('ASGI_THREADS', 8))            # requests running Flask/SQLite at once
+QUEUE_MAX = int(os.environ.get('ASGI_QUEUE_MAX', 256))      # requests allowed to wait for a thread
+MAX_BODY = int(os.environ.get('ASGI_MAX_BODY', 1024 * 1024))
+RETRY_AFTER = int(os.environ.get('ASGI_RETRY_AFTER', 1))
+
+# One pooled connection per pool thread; must be set before server.py builds its pool
+os.environ.setdefault('DB_POOL_SIZE', str(THREADS))
+# Logins wait on bcrypt in a pool thread; keep one free for everything else
+os.environ.setdefault('PASSWORD_MAX_IN_FLIGHT', str(max(1, THREADS - 1)))
+
+import fastjson
+from server import app as flask_app, load_secret_key
+
+if not load_secret_key():
+    print("⚠️  SECRET_KEY/SECRET_KEY_FILE not set: sessions won't be shared with the main server")
+
+
+def _latin1(text):
+    # WSGI carries paths as bytes-in-str (PEP 3333)
+    return text.encode('utf-8').decode('latin-1')
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(scope.get('root_path', '')),
+        'PATH_INFO': _latin1(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ', ') + value
+        environ[key] = value
+    return environ
+
+
+def call_flask(environ):
+    """Run one request through the Flask app (on a pool thread); returns status, headers, body"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    chunks = flask_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return started['status'], started['headers'], body
+
+
+class MobileASGI:
+    """ASGI entry point serving the mobile routes through a bounded thread pool"""
+
+    def __init__(self, threads=THREADS, queue_max=QUEUE_MAX):
+        self.threads = threads
+        self.queue_max = queue_max
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-flask')
+        self._slots = None  # asyncio.Semaphore, created on the serving loop
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _reply(self, send, status, payload, headers=()):
+        body = fastjson.dumps(payload)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _read_body(self, receive):
+        parts = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY:
+                return False
+            parts.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(parts)
+
+    async def _http(self, scope, receive, send):
+        if not scope['path'].startswith(PREFIXES):
+            await self._reply(send, 404, {'error': 'Not served here; use the main API server'})
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        if body is False:
+            await self._reply(send, 413, {'error': 'Request body too large'})
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.threads + self.queue_max)
+        if self._slots.locked():
+            self.rejected += 1
+            await self._reply(send, 503, {'error': 'Server busy, please retry'},
+                              [(b'retry-after', str(RETRY_AFTER).encode())])
+            return
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            status, headers, payload = await loop.run_in_executor(
+                self._executor, call_flask, build_environ(scope, body)
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+app = MobileASGI()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ uvicorn is not installed: pip install uvicorn")
+        sys.exit(1)
+    uvicorn.run(app, host=os.environ.get('ASGI_HOST', '0.0.0.0'),
+                port=int(os.environ.get('ASGI_PORT', 5002)), log_level='warning')
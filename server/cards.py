@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Card serialization shared by every endpoint that returns loyalty cards
+
+The SELECT column order is fixed here and rows come back as plain tuples,
+so turning a row into the card payload is one unpack plus a dict literal.
+memberSince formatting is memoized because created_at values repeat
+heavily across wallets.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+# Column order is the contract between CARD_SELECT and serialize_card()
+CARD_COLUMNS = (
+    'r.id',
+    'r.score',
+    'r.target_score',
+    'r.visits',
+    'r.rewards_earned',
+    'r.total_saved',
+    'r.cash_per_redeem',
+    'r.card_number',
+    'r.last_scan_at',
+    'r.created_at',
+    'c.id',
+    'c.name',
+    'c.description',
+    'c.program_description',
+    'c.category',
+    'c.color',
+    'r.updated_at',  # sort key for merge_newest_first(); not part of the payload
+)
+
+CARD_SELECT = (
+    'SELECT ' + ', '.join(CARD_COLUMNS) + ' '
+    'FROM rewards r JOIN companies c ON r.company_id = c.id '
+)
+
+
+@lru_cache(maxsize=4096)
+def member_since(created_at):
+    """Format created_at as 'Oct 2025' (memoized)"""
+    if not created_at:
+        return ''
+    try:
+        return datetime.fromisoformat(created_at.replace('Z', '+00:00')).strftime('%b %Y')
+    except ValueError:
+        return created_at[:7]  # fallback to YYYY-MM
+
+
+def serialize_card(row):
+    """Turn a CARD_SELECT row into the card payload the mobile app expects"""
+    (card_id, score, target_score, visits, rewards_earned, total_saved, cash_per_redeem,
+     card_number, last_scan_at, created_at, company_id, company_name, company_description,
+     program_description, category, color, _updated_at) = row
+    return {
+        'id': card_id,
+        'name': company_name,
+        'punches': score,  # score == punches
+        'maxPunches': target_score,  # target_score == maxPunches
+        'color': color or '#6366F1',
+        'visits': visits or 0,
+        'rewards': rewards_earned or 0,
+        'saved': f"${total_saved:.0f}" if total_saved else '$0',
+        'cash_per_redeem': cash_per_redeem or 5.0,
+        'memberSince': member_since(created_at),
+        'cardId': card_number or '',
+        'category': category or '',
+        'progress': (score / target_score) * 100 if target_score > 0 else 0,
+        'last_scan_at': last_scan_at,
+        'created_at': created_at,
+        'company': {
+            'id': company_id,
+            'name': company_name,
+            'description': company_description,
+            'programDescription': program_description,
+            'category': category,
+            'color': color
+        }
+    }
+
+
+def _tuple_cursor(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples; serialize_card indexes by position
+    return cursor
+
+
+def fetch_card_rows(conn, where, params=()):
+    """Run CARD_SELECT with a WHERE/ORDER BY tail; rows stay plain tuples"""
+    return _tuple_cursor(conn).execute(CARD_SELECT + where, params).fetchall()
+
+
+def fetch_cards(conn, where, params=()):
+    """Run CARD_SELECT with a WHERE/ORDER BY tail and serialize every row"""
+    return [serialize_card(row) for row in fetch_card_rows(conn, where, params)]
+
+
+def fetch_card(conn, where, params=()):
+    """Like fetch_cards() for a single card; returns None if there is no match"""
+    row = _tuple_cursor(conn).execute(CARD_SELECT + where, params).fetchone()
+    return serialize_card(row) if row is not None else None
+
+
+def merge_newest_first(row_lists):
+    """
+    Combine CARD_SELECT results from several shards, most recently updated first.
+    Each list is already ordered by its shard; the merge re-sorts on updated_at.
+    """
+    if len(row_lists) == 1:
+        return row_lists[0]
+    rows = [row for row_list in row_lists for row in row_list]
+    rows.sort(key=lambda row: row[-1] or '', reverse=True)
+    return rows
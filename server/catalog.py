@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+In-memory company catalog for /api/mobile/companies
+
+The catalog changes rarely but is fetched on every app launch, so the
+serialized JSON is cached per catalog version (see catalog_version in
+schema.sql). A request costs one primary-key lookup; the table scan and
+JSON encoding only happen after a company write bumps the version.
+"""
+import hashlib
+import threading
+
+import fastjson
+
+COMPANIES_SQL = '''
+    SELECT id, name, description, program_description, category, color, default_target_score
+    FROM companies
+    WHERE is_active = 1
+'''
+
+
+def _read_version(conn):
+    return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+
+
+def _build(rows):
+    """Serialize the catalog once; returns (body bytes, strong ETag)"""
+    companies_data = [{
+        'id': str(c['id']),  # Convert to string for consistency with frontend
+        'name': c['name'],
+        'category': c['category'] or '',
+        'color': c['color'] or '#6366F1',
+        'maxPunches': c['default_target_score'] or 10,
+        'companyDescription': c['description'] or '',
+        'programDescription': c['program_description'] or ''
+    } for c in rows]
+    body = fastjson.dumps({'companies': companies_data})
+    # Hash the bytes rather than using the bare version so a rebuilt DB can't reuse a stale tag
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    return body, etag
+
+
+class CompanyCatalog:
+    """Cached catalog body + ETag, rebuilt when catalog_version moves"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # (version, body, etag)
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self, conn):
+        """Return (version, body, etag) for the current catalog"""
+        version = _read_version(conn)
+        entry = self._entry
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry
+
+        # Read version and rows from one snapshot so the cache key matches its contents
+        conn.execute('BEGIN')
+        try:
+            version = _read_version(conn)
+            rows = conn.execute(COMPANIES_SQL).fetchall()
+        finally:
+            conn.rollback()
+        body, etag = _build(rows)
+        entry = (version, body, etag)
+        with self._lock:
+            # A slower rebuild of an older version must not clobber a newer one
+            if self._entry is None or self._entry[0] <= version:
+                self._entry = entry
+            self.rebuilds += 1
+        return entry
+
+    def stats(self):
+        entry = self._entry
+        return {
+            'version': entry[0] if entry else None,
+            'bytes': len(entry[1]) if entry else 0,
+            'hits': self.hits,
+            'rebuilds': self.rebuilds,
+        }
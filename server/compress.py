@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Response compression negotiated from Accept-Encoding
+
+JSON responses at or above COMPRESS_MIN_BYTES are sent gzip- or
+brotli-encoded (brotli only when the optional `brotli` package is installed
+and the client prefers it at least as much as gzip). Streamed JSON and
+NDJSON (the full /api/users list) is compressed incrementally as it is
+generated, so memory stays flat; their size isn't known up front, so the
+threshold doesn't apply. The dashboard event stream and static files are
+left alone.
+
+Compressing the same catalog for every app launch would waste CPU, so
+bodies with a strong ETag that aren't Cache-Control: private are kept
+compressed in a small LRU keyed by (ETag, encoding). Per-user responses are
+compressed on the fly and never cached.
+
+A compressed response's ETag is made weak, so If-None-Match revalidation
+keeps matching while the bytes differ from the identity encoding.
+
+Environment:
+    COMPRESS                 0 disables compression (default 1)
+    COMPRESS_MIN_BYTES       smallest body worth compressing (default 1024)
+    COMPRESS_LEVEL           gzip level 1-9 (default 6)
+    COMPRESS_BROTLI_QUALITY  brotli quality 0-11 (default 5)
+    COMPRESS_CACHE_ENTRIES   precompressed bodies kept per worker (default 32)
+"""
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+ENABLED = os.environ.get('COMPRESS', '1') != '0'
+MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+CACHE_ENTRIES = int(os.environ.get('COMPRESS_CACHE_ENTRIES', 32))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+STREAMED_TYPES = ('application/json', 'application/x-ndjson')  # never text/event-stream: events must not wait in a buffer
+
+# Preferred first when the client weighs several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings):
+    """Best encoding we support from a parsed Accept-Encoding header, or None"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class _StreamEncoder:
+    """Incremental gzip (zlib with a gzip header) or brotli"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.finish = self._compressor.compress, self._compressor.flush
+
+
+class Compressor:
+    """Compresses eligible responses; keeps cacheable ones precompressed"""
+
+    def __init__(self, min_bytes=MIN_BYTES, cache_entries=CACHE_ENTRIES):
+        self.min_bytes = min_bytes
+        self.cache_entries = cache_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (etag, encoding) -> compressed bytes
+
+        # Metrics
+        self.compressed = 0
+        self.streamed = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _cached(self, key, body, encoding):
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return data
+        data = encode(body, encoding)
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def _encode_stream(self, chunks, encoding):
+        """Compressed chunks of a streamed body; closes the original iterable when done"""
+        encoder = _StreamEncoder(encoding)
+        bytes_in = bytes_out = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                bytes_in += len(chunk)
+                data = encoder.compress(chunk)
+                if data:
+                    bytes_out += len(data)
+                    yield data
+            data = encoder.finish()
+            bytes_out += len(data)
+            yield data
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            with self._lock:
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+
+    def _apply_streamed(self, request, response):
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        response.response = self._encode_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self.compressed += 1
+            self.streamed += 1
+        return response
+
+    def apply(self, request, response):
+        """after_request hook: compress response in place when worthwhile"""
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        if response.is_streamed:
+            if response.mimetype in STREAMED_TYPES:
+                return self._apply_streamed(request, response)
+            return response
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            return response
+
+        # The representation depends on Accept-Encoding from here on, even when we send identity
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag and not weak and 'private' not in response.cache_control:
+            data = self._cached((etag, encoding), body, encoding)
+        else:
+            data = encode(body, encoding)
+        if len(data) >= len(body):
+            return response
+
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(data)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'encodings': list(ENCODINGS),
+                'min_bytes': self.min_bytes,
+                'compressed': self.compressed,
+                'streamed': self.streamed,
+                'cache_entries': len(self._cache),
+                'cache_hits': self.cache_hits,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            }
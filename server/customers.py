@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Keyset-paginated customer list for the merchant dashboard (/api/users)
+
+Customers are ranked by score, then most recent scan, then reward id, which
+matches idx_rewards_company_rank. A page is a single index range seek from
+the previous page's last key, so cost and memory stay flat however deep the
+client pages and however many customers a company has.
+"""
+import base64
+import binascii
+import json
+
+PAGE_DEFAULT = 100
+PAGE_MAX = 1000
+
+# last_scan_at is COALESCEd so never-scanned rows still sort last and the
+# keyset comparison never meets a NULL; the index is built on the same expression
+RANK_SELECT = '''
+    SELECT
+        u.id,
+        u.email,
+        u.phone,
+        u.full_name,
+        r.score,
+        r.target_score,
+        r.last_scan_at,
+        r.created_at,
+        r.id AS reward_id
+    FROM rewards r
+    JOIN users u ON r.user_id = u.id
+    WHERE r.company_id = ? {after}
+    ORDER BY r.score DESC, COALESCE(r.last_scan_at, '') DESC, r.id DESC
+    LIMIT ?
+'''
+FIRST_PAGE_SQL = RANK_SELECT.format(after='')
+NEXT_PAGE_SQL = RANK_SELECT.format(
+    after="AND (r.score, COALESCE(r.last_scan_at, ''), r.id) < (?, ?, ?)"
+)
+CUSTOMER_SQL = RANK_SELECT.format(after='AND r.user_id = ?')
+
+
+class BadCursor(ValueError):
+    """The client sent a cursor we didn't issue"""
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past this row"""
+    key = [row['score'], row['last_scan_at'] or '', row['reward_id']]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        score, last_scan_at, reward_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise BadCursor(cursor)
+    return score, last_scan_at, reward_id
+
+
+def _public(row):
+    """Row as the dashboard sees it (same keys as before pagination existed)"""
+    return {
+        'id': row['id'],
+        'email': row['email'],
+        'phone': row['phone'],
+        'full_name': row['full_name'],
+        'score': row['score'],
+        'target_score': row['target_score'],
+        'last_scan_at': row['last_scan_at'],
+        'created_at': row['created_at']
+    }
+
+
+def fetch_page(conn, company_id, limit=PAGE_DEFAULT, cursor=None):
+    """One page of customers; returns (rows, next_cursor or None)"""
+    limit = max(1, min(int(limit), PAGE_MAX))
+    if cursor:
+        params = (company_id, *decode_cursor(cursor), limit)
+        rows = conn.execute(NEXT_PAGE_SQL, params).fetchall()
+    else:
+        rows = conn.execute(FIRST_PAGE_SQL, (company_id, limit)).fetchall()
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return [_public(r) for r in rows], next_cursor
+
+
+def fetch_customer(conn, company_id, user_id):
+    """One customer's row as it appears in the list (None if they have no card here)"""
+    row = conn.execute(CUSTOMER_SQL, (company_id, user_id, 1)).fetchone()
+    return _public(row) if row is not None else None
+
+
+def iter_customers(conn, company_id, batch=PAGE_MAX):
+    """
+    Yield every customer page by page so only one page is ever in memory.
+    All pages come from one read transaction: a scan committed mid-stream
+    would otherwise move a row across the keyset and repeat or skip it.
+    """
+    cursor = None
+    conn.execute('BEGIN')
+    try:
+        while True:
+            rows, cursor = fetch_page(conn, company_id, batch, cursor)
+            yield from rows
+            if cursor is None:
+                return
+    finally:
+        conn.rollback()
@@ -30,6 +30,34 @@ CREATE TABLE IF NOT EXISTS companies (
 CREATE INDEX IF NOT EXISTS idx_companies_login_email
   ON companies(login_email);
 
+-- Catalog version: bumped by every write that changes what /api/mobile/companies returns,
+-- so the server can cache the catalog and hand out ETags keyed on it
+CREATE TABLE IF NOT EXISTS catalog_version (
+  id      INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS companies_catalog_insert
+AFTER INSERT ON companies
+BEGIN
+  UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS companies_catalog_update
+AFTER UPDATE OF name, description, program_description, category, color,
+                default_target_score, is_active ON companies
+BEGIN
+  UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS companies_catalog_delete
+AFTER DELETE ON companies
+BEGIN
+  UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
 -- Rewards link users <-> companies (user cards)
 CREATE TABLE IF NOT EXISTS rewards (
   id               INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,18 +73,192 @@ CREATE TABLE IF NOT EXISTS rewards (
   last_scan_at     DATETIME,
   created_at       DATETIME DEFAULT CURRENT_TIMESTAMP,
   updated_at       DATETIME DEFAULT CURRENT_TIMESTAMP,
+  version          INTEGER NOT NULL DEFAULT 0, -- sync_clock value of the last write (wallet delta sync)
   FOREIGN KEY (user_id)    REFERENCES users(id)     ON DELETE CASCADE,
   FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE,
   UNIQUE(user_id, company_id)
 );
 
-CREATE TRIGGER IF NOT EXISTS rewards_updated_at
+-- Wallet sync clock: every insert, update and delete on rewards takes the next value and
+-- stamps it on the row (or its tombstone), so ?since=<clock> finds exactly what changed.
+-- updated_at has one-second resolution and mixed formats, so it can't serve as a cursor.
+CREATE TABLE IF NOT EXISTS sync_clock (
+  id      INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO sync_clock (id, version) VALUES (1, 0);
+
+-- Cards removed by delete_user_card, kept so delta syncs can report them
+CREATE TABLE IF NOT EXISTS card_tombstones (
+  card_id    INTEGER PRIMARY KEY,
+  user_id    INTEGER NOT NULL,
+  version    INTEGER NOT NULL,
+  company_id INTEGER             -- NULL for tombstones written before the column existed
+);
+
+CREATE INDEX IF NOT EXISTS idx_card_tombstones_user
+  ON card_tombstones(user_id, version);
+
+-- Dashboard change feed: everything stamped since the last poll (any worker process)
+CREATE INDEX IF NOT EXISTS idx_card_tombstones_version ON card_tombstones(version);
+
+-- Folded into rewards_version_update (one self-update per write instead of two)
+DROP TRIGGER IF EXISTS rewards_updated_at;
+
+CREATE TRIGGER IF NOT EXISTS rewards_version_insert
+AFTER INSERT ON rewards
+BEGIN
+  UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+  UPDATE rewards SET version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.id;
+END;
+
+-- The WHEN skips the trigger's own stamping update
+CREATE TRIGGER IF NOT EXISTS rewards_version_update
 AFTER UPDATE ON rewards
+WHEN NEW.version = OLD.version
+BEGIN
+  UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+  UPDATE rewards SET version = (SELECT version FROM sync_clock WHERE id = 1),
+                     updated_at = CURRENT_TIMESTAMP
+  WHERE id = NEW.id;
+END;
+
+-- Recreated on every start so databases from before card_tombstones.company_id record it
+DROP TRIGGER IF EXISTS rewards_tombstone;
+
+CREATE TRIGGER rewards_tombstone
+AFTER DELETE ON rewards
 BEGIN
-  UPDATE rewards SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+  UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO card_tombstones (card_id, user_id, company_id, version)
+  VALUES (OLD.id, OLD.user_id, OLD.company_id, (SELECT version FROM sync_clock WHERE id = 1));
 END;
 
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_rewards_user    ON rewards(user_id);
-CREATE INDEX IF NOT EXISTS idx_rewards_company ON rewards(company_id);
+-- (user_id, version) serves both "all of a user's cards" and "changed since"
+CREATE INDEX IF NOT EXISTS idx_rewards_user_version ON rewards(user_id, version);
+DROP INDEX IF EXISTS idx_rewards_user;
+CREATE INDEX IF NOT EXISTS idx_rewards_version ON rewards(version);  -- dashboard change feed
 CREATE INDEX IF NOT EXISTS idx_rewards_score   ON rewards(score);
+
+-- Dashboard customer ranking (/api/users keyset pagination); also covers company_id lookups
+CREATE INDEX IF NOT EXISTS idx_rewards_company_rank
+  ON rewards(company_id, score DESC, COALESCE(last_scan_at, '') DESC, id DESC);
+DROP INDEX IF EXISTS idx_rewards_company;
+
+-- Per-company dashboard rollup behind /api/stats, maintained by the triggers
+-- below in the same transaction as every rewards write (reconcile_stats.py rebuilds it)
+CREATE TABLE IF NOT EXISTS company_stats (
+  company_id      INTEGER PRIMARY KEY,
+  total_users     INTEGER NOT NULL DEFAULT 0,   -- reward cards (one per user per company)
+  total_scans     INTEGER NOT NULL DEFAULT 0,   -- SUM(score)
+  close_to_reward INTEGER NOT NULL DEFAULT 0    -- cards with score >= 80% of target
+);
+
+-- Backfill once for databases created before the rollup existed
+INSERT INTO company_stats (company_id, total_users, total_scans, close_to_reward)
+SELECT company_id, COUNT(*), COALESCE(SUM(score), 0),
+       SUM(COALESCE(score >= target_score * 0.8, 0))
+FROM rewards
+WHERE NOT EXISTS (SELECT 1 FROM company_stats)
+GROUP BY company_id;
+
+CREATE TRIGGER IF NOT EXISTS company_stats_insert
+AFTER INSERT ON rewards
+BEGIN
+  INSERT INTO company_stats (company_id, total_users, total_scans, close_to_reward)
+  VALUES (NEW.company_id, 1, COALESCE(NEW.score, 0),
+          COALESCE(NEW.score >= NEW.target_score * 0.8, 0))
+  ON CONFLICT(company_id) DO UPDATE SET
+    total_users     = total_users + 1,
+    total_scans     = total_scans + excluded.total_scans,
+    close_to_reward = close_to_reward + excluded.close_to_reward;
+END;
+
+CREATE TRIGGER IF NOT EXISTS company_stats_update
+AFTER UPDATE OF score, target_score ON rewards
+WHEN OLD.company_id = NEW.company_id
+BEGIN
+  UPDATE company_stats SET
+    total_scans     = total_scans + COALESCE(NEW.score, 0) - COALESCE(OLD.score, 0),
+    close_to_reward = close_to_reward
+                      + COALESCE(NEW.score >= NEW.target_score * 0.8, 0)
+                      - COALESCE(OLD.score >= OLD.target_score * 0.8, 0)
+  WHERE company_id = NEW.company_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS company_stats_move
+AFTER UPDATE OF company_id ON rewards
+WHEN OLD.company_id <> NEW.company_id
+BEGIN
+  UPDATE company_stats SET
+    total_users     = total_users - 1,
+    total_scans     = total_scans - COALESCE(OLD.score, 0),
+    close_to_reward = close_to_reward - COALESCE(OLD.score >= OLD.target_score * 0.8, 0)
+  WHERE company_id = OLD.company_id;
+  INSERT INTO company_stats (company_id, total_users, total_scans, close_to_reward)
+  VALUES (NEW.company_id, 1, COALESCE(NEW.score, 0),
+          COALESCE(NEW.score >= NEW.target_score * 0.8, 0))
+  ON CONFLICT(company_id) DO UPDATE SET
+    total_users     = total_users + 1,
+    total_scans     = total_scans + excluded.total_scans,
+    close_to_reward = close_to_reward + excluded.close_to_reward;
+END;
+
+CREATE TRIGGER IF NOT EXISTS company_stats_delete
+AFTER DELETE ON rewards
+BEGIN
+  UPDATE company_stats SET
+    total_users     = total_users - 1,
+    total_scans     = total_scans - COALESCE(OLD.score, 0),
+    close_to_reward = close_to_reward - COALESCE(OLD.score >= OLD.target_score * 0.8, 0)
+  WHERE company_id = OLD.company_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS company_stats_company_delete
+AFTER DELETE ON companies
+BEGIN
+  DELETE FROM company_stats WHERE company_id = OLD.id;
+END;
+
+-- Append-only ledger of punches, redeems and resets (all integers to stay compact)
+-- kind: 1 = punch, 2 = redeem, 3 = reset; delta = score change; ts = unix seconds
+CREATE TABLE IF NOT EXISTS scan_events (
+  id         INTEGER PRIMARY KEY,
+  company_id INTEGER NOT NULL,
+  user_id    INTEGER NOT NULL,
+  kind       INTEGER NOT NULL,
+  delta      INTEGER NOT NULL,
+  ts         INTEGER NOT NULL
+);
+
+-- Per-company event counts in UTC hourly (3600) and daily (86400) buckets, built by events.roll_up()
+CREATE TABLE IF NOT EXISTS scan_rollups (
+  company_id   INTEGER NOT NULL,
+  bucket_size  INTEGER NOT NULL,
+  bucket_start INTEGER NOT NULL,
+  punches      INTEGER NOT NULL DEFAULT 0,
+  redeems      INTEGER NOT NULL DEFAULT 0,
+  resets       INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (company_id, bucket_size, bucket_start)
+) WITHOUT ROWID;
+
+-- Last scan_events.id folded into scan_rollups
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+  id            INTEGER PRIMARY KEY CHECK (id = 1),
+  last_event_id INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO rollup_watermark (id, last_event_id) VALUES (1, 0);
+
+-- Idempotency receipts for /api/mobile/scan/batch: a replayed offline tap returns its
+-- original result instead of punching again
+CREATE TABLE IF NOT EXISTS scan_receipts (
+  user_id         INTEGER NOT NULL,
+  idempotency_key TEXT NOT NULL,
+  status          INTEGER NOT NULL,   -- HTTP status of the original result
+  result          TEXT NOT NULL,      -- JSON body of the original result
+  created_at      INTEGER NOT NULL,   -- unix seconds
+  PRIMARY KEY (user_id, idempotency_key)
+) WITHOUT ROWID;
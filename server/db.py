@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Pooled SQLite connections for the Flask server
+
+Opening a connection (and re-applying PRAGMAs) on every request is a real
+share of tap latency, so each worker keeps a small pool of ready connections
+and hands one to each request for the life of its app context.
+
+Read-only endpoints draw from a second pool of query_only connections. Under
+WAL they read a snapshot without touching the write lock, and since they
+never wait for a connection held by a tap stuck behind that lock, dashboard
+polls and wallet fetches don't queue behind a burst of scans.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import sqltrace
+
+# Pool sizing (per worker process)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', POOL_SIZE))  # query_only connections for GETs
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0))     # seconds to wait for a free connection
+MAX_CONN_AGE = float(os.environ.get('DB_MAX_CONN_AGE', 3600.0))  # recycle connections older than this
+
+# Per-connection PRAGMAs
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024))
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within POOL_TIMEOUT"""
+
+
+def open_connection(path, attach=None, query_only=False):
+    """
+    Open a connection with WAL and the tuning PRAGMAs applied once.
+    attach: a database to ATTACH read-only as "directory" (company shards, see shards.py);
+    read-only so BEGIN IMMEDIATE doesn't take its write lock too.
+    query_only: refuse every write, so the connection can never hold the write lock.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, uri=True,
+                           factory=sqltrace.CONNECTION_FACTORY)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    if attach:
+        uri = 'file:' + urllib.parse.quote(os.path.abspath(attach)) + '?mode=ro'
+        conn.execute('ATTACH DATABASE ? AS directory', (uri,))
+    if query_only:
+        conn.execute('PRAGMA query_only=ON')
+    return conn
+
+
+# Columns added after their table first shipped. CREATE TABLE IF NOT EXISTS won't add
+# them to an existing database, and the schema script's indexes/triggers need them.
+ADDED_COLUMNS = (
+    ('rewards', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('card_tombstones', 'company_id', 'INTEGER'),
+)
+
+
+def add_missing_columns(conn):
+    """ALTER existing tables up to date before the schema script runs"""
+    for table, column, declaration in ADDED_COLUMNS:
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if columns and column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def apply_schema(path, schema_path='data/schema.sql'):
+    """Run the (idempotent) schema script against the database at path"""
+    conn = open_connection(path)
+    add_missing_columns(conn)
+    with open(schema_path, 'r') as f:
+        conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by one worker's request threads"""
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT, max_age=MAX_CONN_AGE, attach=None,
+                 query_only=False):
+        self.path = path
+        self.attach = attach
+        self.query_only = query_only
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # LIFO so the most recently used connection (warmest page cache) goes out first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._born = {}  # id(conn) -> time.monotonic() when opened
+
+        # Metrics
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.recycled = 0
+
+    def _open(self):
+        conn = open_connection(self.path, self.attach, self.query_only)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def reset_after_fork(self):
+        """
+        Forget connections inherited from the parent process.
+        SQLite connections must not cross a fork, so they are abandoned (not
+        closed, which could disturb the parent's locks) and reopened lazily.
+        """
+        self._reset()
+
+    def acquire(self):
+        """Check out a connection, opening one if the pool is not yet full"""
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._born) < self.size:
+                    conn = self._open()
+            if conn is None:
+                started = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f'no database connection free after {self.timeout}s')
+                with self._lock:
+                    self.waits += 1
+                    self.wait_seconds += time.monotonic() - started
+
+        if time.monotonic() - self._born.get(id(conn), 0) > self.max_age:
+            with self._lock:
+                self._discard(conn)
+                conn = self._open()
+                self.recycled += 1
+
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection, rolling back anything the request left open"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - born for born in self._born.values()]
+            return {
+                'path': self.path,
+                'query_only': self.query_only,
+                'size': self.size,
+                'open': len(ages),
+                'idle': self._idle.qsize(),
+                'in_use': len(ages) - self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'timeouts': self.timeouts,
+                'recycled': self.recycled,
+                'oldest_age_seconds': round(max(ages), 3) if ages else 0,
+                'mean_age_seconds': round(sum(ages) / len(ages), 3) if ages else 0,
+            }
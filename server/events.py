@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Append-only scan event ledger and its time-bucketed rollups
+
+Every punch, redeem and reset appends one integer-only row to scan_events
+inside the same transaction as the rewards write. roll_up() folds new
+events into per-company hourly and daily buckets (scan_rollups), so
+time-series queries read a few hundred bucket rows instead of raw events.
+Buckets are aligned to UTC.
+
+Rollups are written off the request path: each server process runs a
+RollupStage thread every ROLLUP_SECONDS (default 30, 0 = off, e.g. when
+cron runs this file instead), so analytics reads never take the write lock.
+
+Run directly to roll up pending events in every card database:
+python3 events.py [--db PATH]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+import shards
+from db import open_connection
+
+DB_PATH = os.environ.get('DB_PATH', 'data/rewards.db')
+ROLLUP_SECONDS = float(os.environ.get('ROLLUP_SECONDS', 30))
+
+# Event kinds (scan_events.kind)
+PUNCH = 1
+REDEEM = 2
+RESET = 3
+
+HOUR = 3600
+DAY = 86400
+BUCKET_SIZES = (HOUR, DAY)
+
+ROLLUP_BATCH = 100000  # max events folded per roll_up() call
+
+log = logging.getLogger('punchly.events')
+
+ROLLUP_SQL = '''
+    INSERT INTO scan_rollups (company_id, bucket_size, bucket_start, punches, redeems, resets)
+    SELECT company_id, :size, ts - ts % :size,
+           SUM(CASE WHEN kind = 1 THEN delta ELSE 0 END),
+           SUM(kind = 2),
+           SUM(kind = 3)
+    FROM scan_events
+    WHERE id > :lo AND id <= :hi
+    GROUP BY company_id, ts - ts % :size
+    ON CONFLICT(company_id, bucket_size, bucket_start) DO UPDATE SET
+        punches = punches + excluded.punches,
+        redeems = redeems + excluded.redeems,
+        resets  = resets + excluded.resets
+'''
+
+
+def record(conn, company_id, user_id, kind, delta, ts=None):
+    """Append one event; call inside the transaction that changed the reward row"""
+    conn.execute(
+        'INSERT INTO scan_events (company_id, user_id, kind, delta, ts) VALUES (?, ?, ?, ?, ?)',
+        (company_id, user_id, kind, delta, int(ts if ts is not None else time.time()))
+    )
+
+
+def roll_up(conn, batch=ROLLUP_BATCH):
+    """Fold events past the watermark into scan_rollups; returns how many were folded"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        lo = conn.execute('SELECT last_event_id FROM rollup_watermark WHERE id = 1').fetchone()[0]
+        hi, count = conn.execute(
+            'SELECT MAX(id), COUNT(*) FROM (SELECT id FROM scan_events WHERE id > ? ORDER BY id LIMIT ?)',
+            (lo, batch)
+        ).fetchone()
+        if not count:
+            conn.rollback()
+            return 0
+        for size in BUCKET_SIZES:
+            conn.execute(ROLLUP_SQL, {'size': size, 'lo': lo, 'hi': hi})
+        conn.execute('UPDATE rollup_watermark SET last_event_id = ? WHERE id = 1', (hi,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return count
+
+
+def roll_up_all(conn, batch=ROLLUP_BATCH):
+    """Fold every pending event, one batch per transaction so scans can commit in between"""
+    total = 0
+    while True:
+        folded = roll_up(conn, batch)
+        if not folded:
+            return total
+        total += folded
+
+
+def pending(conn):
+    """True if there are events the rollups haven't seen yet"""
+    return conn.execute(
+        'SELECT EXISTS (SELECT 1 FROM scan_events '
+        'WHERE id > (SELECT last_event_id FROM rollup_watermark WHERE id = 1))'
+    ).fetchone()[0] == 1
+
+
+def buckets(conn, company_id, bucket_size, since, until):
+    """Rolled-up buckets for one company in [since, until), oldest first"""
+    return conn.execute('''
+        SELECT bucket_start, punches, redeems, resets
+        FROM scan_rollups
+        WHERE company_id = ? AND bucket_size = ? AND bucket_start >= ? AND bucket_start < ?
+        ORDER BY bucket_start
+    ''', (company_id, bucket_size, since - since % bucket_size, until)).fetchall()
+
+
+class RollupStage:
+    """
+    Background roll_up() of every card database in this process. Runs on its
+    own connections, so it never holds a request's pooled connection. Several
+    worker processes may each run one: roll_up() reads the watermark under the
+    write lock, so every event is still folded exactly once.
+    """
+
+    def __init__(self, paths, interval=ROLLUP_SECONDS):
+        self.paths = list(paths)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Metrics
+        self.passes = 0
+        self.folded = 0
+        self.errors = 0
+
+    def ensure_running(self):
+        """Start the rollup thread unless it is running or disabled (ROLLUP_SECONDS=0)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-rollup', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conns = {}
+        while True:
+            for path in self.paths:
+                try:
+                    conn = conns.get(path)
+                    if conn is None:
+                        conn = conns[path] = open_connection(path)
+                    if pending(conn):
+                        self.folded += roll_up_all(conn)
+                except Exception:
+                    self.errors += 1
+                    log.exception('rollup of %s failed', path)
+                    conn = conns.pop(path, None)
+                    if conn is not None:
+                        conn.close()
+            self.passes += 1
+            time.sleep(self.interval)
+
+    def after_fork(self):
+        """Threads don't survive fork; the worker starts its own"""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def stats(self):
+        return {
+            'interval_seconds': self.interval,
+            'running': self._thread is not None,
+            'passes': self.passes,
+            'folded': self.folded,
+            'errors': self.errors,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Roll up pending scan events')
+    parser.add_argument('--db', default=DB_PATH, help='directory database (default: $DB_PATH)')
+    args = parser.parse_args()
+
+    total = 0
+    for path in shards.all_paths(args.db):
+        conn = open_connection(path)
+        try:
+            folded = roll_up_all(conn)
+        finally:
+            conn.close()
+        print(f"   {path}: {folded} event(s)")
+        total += folded
+    print(f"✅ Rolled up {total} event(s)")
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+JSON encoding to bytes for hot responses
+
+Uses orjson when it is installed (optional dependency) and falls back to
+the stdlib encoder with compact separators otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+
+def dumps(obj):
+    """Serialize obj to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+ENCODER = 'orjson' if orjson is not None else 'json'
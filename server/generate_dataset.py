@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Deterministic large-scale dataset generator for benchmarking
+
+Builds a fresh database with N customers, M companies, their reward cards
+and the scan_events history behind them. Popularity is skewed the way real
+traffic is: company popularity follows a Zipf curve (a few hot merchants
+hold most cards) and cards per customer are Pareto distributed (most people
+carry a couple, power users carry dozens). --cards-per-user rescales that
+curve to a target mean (about 2.2 without it). The same --seed always
+produces the same database.
+
+Loading is done with triggers and secondary indexes dropped, in large
+executemany batches with journaling off. Then schema.sql is re-applied to
+rebuild indexes and triggers (and backfill company_stats), and the event
+rollups are built in one pass.
+
+Usage:
+    python3 generate_dataset.py --users 1000000 --companies 20000 --db data/bench.db
+    python3 generate_dataset.py --users 1000000 --companies 20000 --cards-per-user 12
+    python3 generate_dataset.py --preset small
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+
+import events
+
+SCHEMA_PATH = 'data/schema.sql'
+
+PRESETS = {
+    # (users, companies, cards per user; None = the unscaled Pareto curve)
+    'small': (10000, 200, None),
+    'medium': (200000, 2000, None),
+    'large': (2000000, 20000, 10),  # ~20M cards
+}
+
+CATEGORIES = [
+    'Coffee', 'Grocery', 'Bakeries & Pastry', 'Ice Cream & Gelato', 'Juice & Smoothie Bars',
+    'Pho & Ramen', 'Tacos & Food Trucks', 'Tea Houses', 'Florists', 'Bookstores (Indie)',
+    'Barbers & Hair Salons', 'Nail Salons', 'Yoga & Pilates Studios', 'Climbing & Fitness',
+    'Bike Shops (Service)', 'Dry Cleaners & Tailors', 'Car Wash & Detailing', 'Craft Breweries (To-go cans)',
+]
+NAME_WORDS = [
+    'Maple', 'Harbour', 'Granville', 'Main', 'Cedar', 'Pacific', 'Kits', 'Gastown', 'Commercial',
+    'Fraser', 'Cambie', 'Oak', 'Sunset', 'Alder', 'Raven', 'Salmon', 'Lions', 'Bay', 'North', 'False Creek',
+]
+COLORS = ['#616161', '#86c447', '#FFC72C', '#c48c5c', '#ff9aa2', '#4caf50', '#d4a373', '#f57c00',
+          '#ff7043', '#ad5389', '#6b8e23', '#3f51b5', '#8e24aa', '#455a64', '#26a69a', '#1e88e5']
+TARGETS = [5, 7, 8, 9, 10, 10, 10, 12]
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Diana', 'Evan', 'Fiona', 'George', 'Hannah', 'Ian', 'Julia',
+               'Kai', 'Leah', 'Manny', 'Noor', 'Omar', 'Priya', 'Quinn', 'Ravi', 'Sofia', 'Tomas']
+LAST_NAMES = ['Nguyen', 'Smith', 'Chen', 'Singh', 'Wong', 'Brown', 'Lee', 'Martin', 'Patel', 'Kim']
+
+ZIPF_S = 1.1          # company popularity skew
+PARETO_ALPHA = 1.6    # cards-per-user tail (lower = more power users)
+HISTORY_DAYS = 730    # card creation dates span the last two years
+
+
+def stamp(ts):
+    """Naive UTC datetime for a unix time (keeps output independent of the machine's timezone)"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def chunked(rows, size):
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(conn, sql, rows, batch, label):
+    """executemany in batch-sized transactions; returns rows inserted"""
+    total = 0
+    started = time.perf_counter()
+    for chunk in chunked(rows, batch):
+        conn.execute('BEGIN')
+        conn.executemany(sql, chunk)
+        conn.commit()
+        total += len(chunk)
+        rate = total / max(time.perf_counter() - started, 1e-9)
+        print(f"  ⏳ {label}: {total:,} rows ({rate:,.0f}/s)", end='\r', flush=True)
+    print(f"  ✅ {label}: {total:,} rows in {time.perf_counter() - started:.1f}s      ")
+    return total
+
+
+def strip_schema(conn):
+    """Drop triggers and secondary indexes so the load only writes table b-trees"""
+    objects = conn.execute(
+        "SELECT type, name FROM sqlite_master "
+        "WHERE (type = 'trigger') OR (type = 'index' AND sql IS NOT NULL)"
+    ).fetchall()
+    for kind, name in objects:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+    return len(objects)
+
+
+CARD_SQL = '''
+    INSERT INTO rewards (id, user_id, company_id, score, target_score, visits, rewards_earned,
+                         total_saved, cash_per_redeem, card_number, last_scan_at, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+EVENT_SQL = 'INSERT INTO scan_events (company_id, user_id, kind, delta, ts) VALUES (?, ?, ?, ?, ?)'
+
+
+# ============================================
+# Row generators (all draw from one seeded RNG, in a fixed order)
+# ============================================
+
+def company_rows(rng, count, password_hash, epoch):
+    for i in range(1, count + 1):
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(CATEGORIES).split(' ')[0]} #{i}"
+        created = epoch - timedelta(days=HISTORY_DAYS + rng.randint(0, 365))
+        yield (
+            i, name, f"Benchmark merchant {i}", f"Collect punches at {name}.",
+            rng.choice(CATEGORIES), rng.choice(COLORS), rng.choice(TARGETS),
+            f"merchant{i}@bench.local", password_hash, 1 if rng.random() > 0.02 else 0,
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def user_rows(rng, count, epoch):
+    for i in range(1, count + 1):
+        created = epoch - timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+        yield (
+            i, f"user{i}@bench.local", f"604{rng.randint(1000000, 9999999)}",
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def cards_wanted(rng, companies, cards_per_user):
+    """Companies one customer carries cards at: Pareto, rescaled to a mean when asked"""
+    draw = rng.paretovariate(PARETO_ALPHA)
+    if cards_per_user is None:
+        return min(companies, int(draw))
+    scaled = draw * cards_per_user * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    return min(companies, int(scaled + rng.random()))  # rounded up with probability = fraction, so the mean holds
+
+
+def card_rows(rng, users, companies, targets, cum_weights, epoch, event_sink, cards_per_user=None):
+    """
+    Reward cards in (user_id, company_id) order, which keeps the UNIQUE index
+    append-mostly. Each card's punch/redeem history goes to event_sink.
+    """
+    total_weight = cum_weights[-1]
+    now = epoch.replace(tzinfo=timezone.utc).timestamp()
+    # Hot merchants get drawn repeatedly; extra draws keep a --cards-per-user mean on target
+    draws = 2 if cards_per_user is None else 8
+    card_id = 0
+    for user_id in range(1, users + 1):
+        wanted = cards_wanted(rng, companies, cards_per_user)
+        picked = set()
+        for _ in range(wanted * draws):
+            picked.add(bisect.bisect_left(cum_weights, rng.random() * total_weight) + 1)
+            if len(picked) >= wanted:
+                break
+        # Heavy users scan more often everywhere
+        intensity = min(wanted, 10)
+        for company_id in sorted(picked):
+            card_id += 1
+            target = targets[company_id - 1]
+            cycles = int(rng.expovariate(1.0 / intensity)) // 3
+            score = target if rng.random() < 0.04 else rng.randint(0, target - 1)
+            visits = cycles * target + score
+            cash = float(rng.choice((5, 6, 8, 10, 12, 15, 20)))
+            start = now - rng.randint(3600, HISTORY_DAYS * 86400)
+            last = start + rng.random() * (now - start) if visits else None
+            created_at = stamp(start).strftime('%Y-%m-%d %H:%M:%S')
+            last_scan_at = stamp(last).isoformat() if last else None
+            yield (
+                card_id, user_id, company_id, score, target, visits, cycles, cycles * cash, cash,
+                f"****{rng.randint(1000, 9999)}", last_scan_at, created_at, last_scan_at or created_at,
+            )
+            if event_sink is not None and visits:
+                event_sink.append((company_id, user_id, visits, cycles, target, start, last))
+
+
+def event_rows(rng, histories):
+    """Punch events spread over each card's lifetime, with a redeem after every full card"""
+    for company_id, user_id, visits, cycles, target, start, last in histories:
+        span = max(last - start, 1)
+        times = sorted(int(start + rng.random() * span) for _ in range(visits))
+        for n, ts in enumerate(times, 1):
+            yield (company_id, user_id, events.PUNCH, 1, ts)
+            if n % target == 0 and n // target <= cycles:
+                yield (company_id, user_id, events.REDEEM, -target, ts)
+
+
+def load_cards(conn, rng, args, targets, cum_weights, epoch):
+    """Insert cards and, batch by batch, the event history behind them (keeps memory flat)"""
+    histories = None if args.no_events else []
+    cards = card_rows(rng, args.users, args.companies, targets, cum_weights, epoch, histories,
+                      args.cards_per_user)
+    card_total = event_total = 0
+    started = time.perf_counter()
+    for chunk in chunked(cards, args.batch):
+        conn.execute('BEGIN')
+        conn.executemany(CARD_SQL, chunk)
+        if histories:
+            before = conn.total_changes
+            conn.executemany(EVENT_SQL, event_rows(rng, histories))
+            event_total += conn.total_changes - before
+            histories.clear()
+        conn.commit()
+        card_total += len(chunk)
+        rate = card_total / max(time.perf_counter() - started, 1e-9)
+        print(f"  ⏳ rewards: {card_total:,} cards, {event_total:,} events ({rate:,.0f} cards/s)",
+              end='\r', flush=True)
+    print(f"  ✅ rewards: {card_total:,} cards, {event_total:,} events "
+          f"in {time.perf_counter() - started:.1f}s      ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a large deterministic benchmark database')
+    parser.add_argument('--db', default='data/bench.db', help='output database (default data/bench.db)')
+    parser.add_argument('--preset', choices=sorted(PRESETS), help='size preset')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--companies', type=int, default=1000)
+    parser.add_argument('--cards-per-user', type=float,
+                        help='mean cards per customer (default: unscaled Pareto, about 2.2)')
+    parser.add_argument('--no-events', action='store_true', help='skip scan_events history and rollups')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', type=int, default=200000, help='rows per transaction')
+    parser.add_argument('--force', action='store_true', help='overwrite an existing database')
+    args = parser.parse_args()
+
+    if args.preset:
+        args.users, args.companies, preset_cards = PRESETS[args.preset]
+        if args.cards_per_user is None:
+            args.cards_per_user = preset_cards
+    if args.cards_per_user is not None and args.cards_per_user <= 0:
+        parser.error('--cards-per-user must be positive')
+    if os.path.exists(args.db):
+        if not args.force:
+            print(f"❌ {args.db} already exists (use --force to overwrite)")
+            sys.exit(1)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    rng = random.Random(args.seed)
+    # Fixed reference time so the same seed gives byte-identical data on any day
+    epoch = datetime(2025, 1, 1) + timedelta(days=args.seed % 365)
+    started = time.perf_counter()
+    cards_note = f", ~{args.cards_per_user:g} cards/user" if args.cards_per_user else ''
+    print(f"🏗️  Building {args.db}: {args.users:,} users, {args.companies:,} companies{cards_note} (seed {args.seed})")
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    with open(SCHEMA_PATH, 'r') as f:
+        schema = f.read()
+    conn.executescript(schema)
+    dropped = strip_schema(conn)
+    print(f"  🧹 Dropped {dropped} triggers/indexes for the load")
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA foreign_keys=OFF')
+
+    # One hash for every merchant login (password123); hashing per row is what makes seeding slow
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt()).decode('utf-8')
+
+    companies = list(company_rows(rng, args.companies, password_hash, epoch))
+    targets = [row[6] for row in companies]
+    bulk_insert(conn, '''
+        INSERT INTO companies (id, name, description, program_description, category, color,
+                               default_target_score, login_email, password_hash, is_active, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', companies, args.batch, 'companies')
+    del companies
+
+    bulk_insert(conn, 'INSERT INTO users (id, email, phone, full_name, created_at) VALUES (?, ?, ?, ?, ?)',
+                user_rows(rng, args.users, epoch), args.batch, 'users')
+
+    # Zipf popularity over a shuffled company order so hot merchants aren't just the low ids
+    order = list(range(args.companies))
+    rng.shuffle(order)
+    weights = [0.0] * args.companies
+    for rank, index in enumerate(order):
+        weights[index] = 1.0 / (rank + 1) ** ZIPF_S
+    cum_weights = list(itertools.accumulate(weights))
+
+    load_cards(conn, rng, args, targets, cum_weights, epoch)
+
+    print("  🔧 Rebuilding indexes, triggers and company_stats from schema.sql...")
+    step = time.perf_counter()
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.executescript(schema)
+    conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1')
+    print(f"  ✅ Schema rebuilt in {time.perf_counter() - step:.1f}s")
+
+    if not args.no_events:
+        step = time.perf_counter()
+        hi = conn.execute('SELECT COALESCE(MAX(id), 0) FROM scan_events').fetchone()[0]
+        conn.execute('BEGIN')
+        for size in events.BUCKET_SIZES:
+            conn.execute(events.ROLLUP_SQL, {'size': size, 'lo': 0, 'hi': hi})
+        conn.execute('UPDATE rollup_watermark SET last_event_id = ? WHERE id = 1', (hi,))
+        conn.commit()
+        print(f"  ✅ Rolled up events in {time.perf_counter() - step:.1f}s")
+
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode=WAL')
+    counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+              for t in ('users', 'companies', 'rewards', 'scan_events')}
+    conn.close()
+
+    print("\n" + "=" * 60)
+    print(f"✅ Built {args.db} in {time.perf_counter() - started:.1f}s")
+    print("=" * 60)
+    for table, count in counts.items():
+        print(f"  • {table}: {count:,}")
+    if counts['users']:
+        print(f"  • cards per user: {counts['rewards'] / counts['users']:.2f}")
+    print("\nMerchant logins: merchant<N>@bench.local / password123")
+    print(f"Serve it with: DB_PATH={args.db} python3 server.py")
+
+
+if __name__ == "__main__":
+    main()
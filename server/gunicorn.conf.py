@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for production serving: gunicorn -c gunicorn.conf.py 'server:create_app()'
+
+One process per core, each with a handful of threads. SQLite readers scale
+across processes under WAL while writes serialize on the database lock, so
+more processes help reads and threads mostly cover I/O waits. Every knob
+below can be overridden from the environment.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 20))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks can't accumulate (jitter avoids restarting all at once)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 20000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 2000))
+
+# Import the app once in the master so workers share its memory copy-on-write;
+# post_fork below resets the state that must not cross a fork
+preload_app = True
+
+accesslog = os.environ.get('WEB_ACCESS_LOG')  # off by default; /metrics has per-route counts
+errorlog = '-'
+
+# Workers share /metrics through snapshot files (see metrics.py); must be set before the app is imported
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'punchly-metrics-{os.getpid()}'))
+
+# Per-worker resources sized to the thread count rather than the core count
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('PASSWORD_WORKERS', '1')
+# Logins wait on their bcrypt check; always leave a request thread free for taps
+os.environ.setdefault('PASSWORD_MAX_IN_FLIGHT', str(max(1, threads - 1)))
+# Each dashboard stream holds a thread; keep at least half of them for everything else
+os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads // 2)))
+
+
+def on_starting(server):
+    """Bring the schema (and any shards) up to date once, before any worker starts"""
+    from shards import init_storage
+    import metrics
+    init_storage(os.environ.get('DB_PATH', 'data/rewards.db'))
+    metrics.clear_directory(os.environ['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    """Reopen DB connections and restart background threads in the new worker"""
+    import server as punchly
+    punchly.after_fork()
+
+
+def worker_exit(server, worker):
+    """Final metrics snapshot, so requests since the last flush still count"""
+    import metrics
+    metrics.registry.write_snapshot()
+
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters in the /metrics totals"""
+    import metrics
+    metrics.retire_worker(os.environ['METRICS_DIR'], worker.pid)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Synthetic traffic generator for capacity planning
+
+Simulates many customers and merchants against a running server with a
+realistic mix of app launches (sync-user + wallet + catalog), wallet
+refreshes, NFC scans, redeems and dashboard polling. Each worker thread owns
+a slice of the customers (one cookie session each) and the number of active
+workers follows a ramp profile. Prints throughput and latency percentiles
+per operation at the end.
+
+Usage:
+    python3 loadgen.py --customers 5000 --workers 64 --duration 120 --profile ramp
+    python3 loadgen.py --mix scan=60,wallet=20,launch=10,redeem=5,dashboard=5
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = "http://127.0.0.1:5001"
+
+DEFAULT_MIX = 'scan=50,wallet=25,launch=10,redeem=5,dashboard=10'
+DEFAULT_MERCHANTS = 'greatdane@example.com,ayoub@example.com,fujiya@example.com'
+
+
+# ============================================
+# Ramp profiles: fraction of workers active at time t
+# ============================================
+
+def profile_steady(t, duration, ramp):
+    return 1.0
+
+
+def profile_ramp(t, duration, ramp):
+    """Linear climb over --ramp seconds, then hold"""
+    return min(1.0, max(0.05, t / ramp)) if ramp > 0 else 1.0
+
+
+def profile_step(t, duration, ramp):
+    """Quarter, half, three quarters, full; each step --ramp seconds long"""
+    return min(1.0, 0.25 * (1 + int(t / ramp))) if ramp > 0 else 1.0
+
+
+def profile_spike(t, duration, ramp):
+    """A third of the workers, with the full fleet for the middle --ramp seconds"""
+    middle = duration / 2
+    return 1.0 if abs(t - middle) <= ramp / 2 else 0.33
+
+
+PROFILES = {
+    'steady': profile_steady,
+    'ramp': profile_ramp,
+    'step': profile_step,
+    'spike': profile_spike,
+}
+
+
+# ============================================
+# Results
+# ============================================
+
+class Recorder:
+    """Latency samples and status counts per operation"""
+
+    def __init__(self):
+        self.latencies = {}  # op -> [seconds]
+        self.statuses = {}   # (op, status) -> count
+        self.errors = {}     # op -> count (connection errors, timeouts)
+        self._lock = threading.Lock()
+        self.completed = 0
+
+    def record(self, op, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(op, []).append(seconds)
+            self.statuses[(op, status)] = self.statuses.get((op, status), 0) + 1
+            self.completed += 1
+
+    def error(self, op):
+        with self._lock:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    """Per-operation counts, throughput and latency percentiles (ms)"""
+    summary = {'elapsed_seconds': round(elapsed, 2), 'operations': {}}
+    total = 0
+    for op in sorted(recorder.latencies.keys() | recorder.errors.keys()):
+        samples = sorted(recorder.latencies.get(op, []))
+        total += len(samples)
+        statuses = {str(status): count for (o, status), count in recorder.statuses.items() if o == op}
+        summary['operations'][op] = {
+            'requests': len(samples),
+            'rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+            'errors': recorder.errors.get(op, 0),
+            'statuses': statuses,
+            'p50_ms': round(percentile(samples, 50) * 1000, 2),
+            'p90_ms': round(percentile(samples, 90) * 1000, 2),
+            'p99_ms': round(percentile(samples, 99) * 1000, 2),
+            'max_ms': round(samples[-1] * 1000, 2) if samples else 0,
+        }
+    summary['total_requests'] = total
+    summary['total_rps'] = round(total / elapsed, 1) if elapsed else 0
+    return summary
+
+
+def print_summary(summary):
+    print("\n" + "=" * 96)
+    print(f"{'operation':<16}{'reqs':>9}{'rps':>9}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}"
+          f"{'p99 ms':>10}{'max ms':>10}  statuses")
+    print("-" * 96)
+    for op, s in summary['operations'].items():
+        statuses = ' '.join(f"{k}:{v}" for k, v in sorted(s['statuses'].items()))
+        print(f"{op:<16}{s['requests']:>9}{s['rps']:>9}{s['errors']:>8}{s['p50_ms']:>10}"
+              f"{s['p90_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}  {statuses}")
+    print("-" * 96)
+    print(f"Total: {summary['total_requests']} requests in {summary['elapsed_seconds']}s "
+          f"= {summary['total_rps']} req/s")
+
+
+# ============================================
+# Simulated users
+# ============================================
+
+class Customer:
+    """One app install: its own cookie session and user id"""
+
+    def __init__(self, index, run_id):
+        self.email = f"load-{run_id}-{index}@loadtest.local"
+        self.http = requests.Session()
+        self.user_id = None
+
+
+class Traffic:
+    """Shared state for one load run"""
+
+    def __init__(self, args):
+        self.base_url = args.url.rstrip('/')
+        self.timeout = args.timeout
+        self.recorder = Recorder()
+        self.run_id = args.run_id or format(random.getrandbits(32), 'x')
+        self.merchants = [m for m in args.merchants.split(',') if m]
+        self.merchant_password = args.merchant_password
+        self.companies = []
+        self.company_weights = []
+
+    def call(self, http, op, method, path, **kwargs):
+        """One timed request; returns the response or None on a transport error"""
+        started = time.perf_counter()
+        try:
+            response = http.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.recorder.error(op)
+            return None
+        self.recorder.record(op, time.perf_counter() - started, response.status_code)
+        return response
+
+    def load_companies(self):
+        response = requests.get(self.base_url + '/api/mobile/companies', timeout=self.timeout)
+        response.raise_for_status()
+        self.companies = [c['id'] for c in response.json()['companies']]
+        random.shuffle(self.companies)
+        # A few popular shops get most of the taps (roughly Zipf)
+        self.company_weights = [1 / (rank + 1) for rank in range(len(self.companies))]
+
+    def pick_company(self, rng):
+        return rng.choices(self.companies, weights=self.company_weights)[0]
+
+    # Customer actions
+
+    def launch(self, customer, rng):
+        """App start: sync-user, then wallet and catalog"""
+        response = self.call(customer.http, 'sync-user', 'POST', '/api/mobile/auth/sync-user',
+                             json={'email': customer.email, 'full_name': 'Load Test'})
+        if response is None or response.status_code != 200:
+            return
+        customer.user_id = response.json()['user']['id']
+        self.call(customer.http, 'wallet', 'GET', '/api/mobile/user/cards')
+        self.call(customer.http, 'companies', 'GET', '/api/mobile/companies')
+
+    def wallet(self, customer, rng):
+        self.call(customer.http, 'wallet', 'GET', '/api/mobile/user/cards')
+
+    def scan(self, customer, rng):
+        self.call(customer.http, 'scan', 'POST', '/api/mobile/scan',
+                  json={'user_id': customer.user_id, 'company_id': self.pick_company(rng)})
+
+    def redeem(self, customer, rng):
+        """Redeem a full card if the wallet has one"""
+        response = self.call(customer.http, 'wallet', 'GET', '/api/mobile/user/cards')
+        if response is None or response.status_code != 200:
+            return
+        full = [c for c in response.json().get('cards', []) if c['punches'] >= c['maxPunches']]
+        if full:
+            self.call(customer.http, 'redeem', 'POST', '/api/mobile/redeem',
+                      json={'card_id': rng.choice(full)['id']})
+
+    def dashboard(self, merchant, rng):
+        """Merchant dashboard refresh: stats tile plus the first customer page"""
+        self.call(merchant, 'stats', 'GET', '/api/stats')
+        self.call(merchant, 'users', 'GET', '/api/users?limit=100')
+
+    def merchant_session(self, rng):
+        http = requests.Session()
+        email = rng.choice(self.merchants)
+        self.call(http, 'merchant-login', 'POST', '/api/auth/login',
+                  json={'email': email, 'password': self.merchant_password})
+        return http
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ('scan', 'wallet', 'launch', 'redeem', 'dashboard'):
+            raise SystemExit(f"❌ Unknown operation in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def worker(traffic, index, args, mix, profile, started, stop):
+    """Drive this worker's customers until the run ends"""
+    rng = random.Random(args.seed * 100003 + index if args.seed is not None else None)
+    customers = [Customer(i, traffic.run_id) for i in range(index, args.customers, args.workers)]
+    merchant = None
+    ops = list(mix.keys())
+    weights = list(mix.values())
+
+    while not stop.is_set():
+        elapsed = time.monotonic() - started
+        if elapsed >= args.duration:
+            break
+        # Workers above the profile's current level sit out
+        if index >= max(1, int(profile(elapsed, args.duration, args.ramp) * args.workers)):
+            time.sleep(0.05)
+            continue
+
+        op = rng.choices(ops, weights=weights)[0]
+        if op == 'dashboard':
+            if merchant is None:
+                merchant = traffic.merchant_session(rng)
+            traffic.dashboard(merchant, rng)
+        elif customers:
+            customer = rng.choice(customers)
+            if customer.user_id is None or op == 'launch':
+                traffic.launch(customer, rng)
+            else:
+                getattr(traffic, op)(customer, rng)
+
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+
+
+def report_progress(traffic, started, stop, interval):
+    last = 0
+    while not stop.wait(interval):
+        done = traffic.recorder.completed
+        print(f"  ⏱️  {time.monotonic() - started:6.1f}s  {(done - last) / interval:8.1f} req/s  ({done} total)")
+        last = done
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Punchly traffic')
+    parser.add_argument('--url', default=BASE_URL)
+    parser.add_argument('--customers', type=int, default=1000, help='distinct simulated app users')
+    parser.add_argument('--workers', type=int, default=32, help='max concurrent in-flight journeys')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='ramp')
+    parser.add_argument('--ramp', type=float, default=15, help='seconds per ramp/step/spike phase')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weights, e.g. ' + DEFAULT_MIX)
+    parser.add_argument('--think-ms', type=float, default=0, help='mean pause between actions per worker')
+    parser.add_argument('--merchants', default=DEFAULT_MERCHANTS, help='comma-separated merchant login emails')
+    parser.add_argument('--merchant-password', default='password123')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int, help='make operation choices reproducible')
+    parser.add_argument('--run-id', help='customer email prefix (reuse to hit existing users)')
+    parser.add_argument('--json', metavar='PATH', help='also write the summary as JSON')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    traffic = Traffic(args)
+    try:
+        traffic.load_companies()
+    except requests.RequestException as e:
+        print(f"❌ Could not reach {args.url}: {e}")
+        sys.exit(1)
+    if not traffic.companies:
+        print("❌ No active companies to scan at. Seed the database first.")
+        sys.exit(1)
+
+    print(f"🚀 {args.workers} workers, {args.customers} customers, {args.duration:.0f}s {args.profile} "
+          f"profile against {args.url} (run id {traffic.run_id})")
+    started = time.monotonic()
+    stop = threading.Event()
+    progress = threading.Thread(target=report_progress, args=(traffic, started, stop, 5), daemon=True)
+    progress.start()
+
+    profile = PROFILES[args.profile]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(worker, traffic, i, args, mix, profile, started, stop)
+                   for i in range(args.workers)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            print("\n⚠️  Interrupted, finishing in-flight requests...")
+            stop.set()
+    stop.set()
+
+    summary = summarize(traffic.recorder, time.monotonic() - started)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"✅ Summary written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Non-blocking structured logging for the server
+
+Request threads only format the message and drop the record on an
+in-memory queue; a background listener thread does the actual I/O. When the
+queue is full the record is dropped (and counted) instead of blocking a
+scan. DEBUG records can be sampled so verbose tracing stays affordable
+under load.
+
+Environment:
+    LOG_LEVEL          root level (default INFO)
+    LOG_LEVELS         per-logger levels, e.g. "punchly.scan=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT         json or text (default text)
+    LOG_DEBUG_SAMPLE   fraction of DEBUG records kept, 0..1 (default 1)
+    LOG_QUEUE_MAX      records buffered before dropping (default 10000)
+    LOG_FILE           write here instead of stderr
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+import fastjson
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+DEBUG_SAMPLE = float(os.environ.get('LOG_DEBUG_SAMPLE', 1.0))
+QUEUE_MAX = int(os.environ.get('LOG_QUEUE_MAX', 10000))
+LOG_FILE = os.environ.get('LOG_FILE')
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any extra= fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                  + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return fastjson.dumps(entry).decode('utf-8')
+
+
+class DebugSampler(logging.Filter):
+    """Keep only a fraction of DEBUG records; everything else passes"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message now (args may change after we return) but skip
+        # the full format; the listener thread does that
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup():
+    """Route all logging through the background queue; safe to call more than once"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    if LOG_FILE:
+        output = logging.FileHandler(LOG_FILE)
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    _handler = DroppingQueueHandler(queue.Queue(QUEUE_MAX))
+    if DEBUG_SAMPLE < 1:
+        _handler.addFilter(DebugSampler(DEBUG_SAMPLE))
+
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def after_fork():
+    """Restart the listener in a forked worker (the parent's thread doesn't survive fork)"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener = None
+    _handler = None
+    setup()
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    """Queue depth and dropped-record count"""
+    if _handler is None:
+        return {'enabled': False}
+    return {
+        'enabled': True,
+        'queue_depth': _handler.queue.qsize(),
+        'queue_max': QUEUE_MAX,
+        'dropped': _handler.dropped,
+        'debug_sample': DEBUG_SAMPLE,
+    }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Low-overhead request metrics exported in Prometheus text format
+
+Every thread records into its own shard (a plain dict), so the hot path
+never takes a lock or contends with other request threads. /metrics merges
+the shards at scrape time. Shards of threads that have exited are folded
+into a retired total whenever a new thread registers (and on scrapes), so
+per-request threads don't leak memory even if nothing ever scrapes.
+
+Under gunicorn every worker is a separate process and /metrics is answered
+by whichever one accepts the scrape, so with METRICS_DIR set each worker
+writes a snapshot file there every METRICS_FLUSH_SECONDS (and on exit), and
+a scrape sums every worker's file. When a worker exits the master folds its
+counters and histograms into retired.json (gauges are dropped), so totals
+stay monotonic across worker restarts. Other workers' numbers are at most
+one flush interval old.
+
+Environment:
+    METRICS_DIR            shared snapshot directory (gunicorn.conf.py sets one)
+    METRICS_FLUSH_SECONDS  snapshot interval per worker (default 5)
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+RETIRED_FILE = 'retired.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Counters, gauges and histograms sharded per thread"""
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._file = None  # this process's snapshot file name
+        self._meta = {}  # name -> (type, help, buckets)
+        self._local = threading.local()
+        self._shards = []  # (thread, shard)
+        self._retired = {}
+        self._lock = threading.Lock()  # only for shard registration and scrapes
+        self._collectors = []
+
+    def after_fork(self):
+        """Start a forked worker from zero, flushing snapshots when metrics are shared"""
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if self.directory:
+            threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True).start()
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text, None)
+
+    def gauge(self, name, help_text):
+        self._meta[name] = ('gauge', help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self._meta[name] = ('histogram', help_text, tuple(buckets))
+
+    def collector(self, fn):
+        """Register fn() -> iterable of (name, type, help, [(labels, value), ...]) evaluated per scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                # Fold exited threads here too: the dev server starts a thread per
+                # request, so waiting for a scrape would let shards pile up
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    # Hot path: thread-local dict updates only
+
+    def inc(self, name, labels=(), value=1):
+        """Add to a counter, or move a gauge up/down"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Record one histogram observation"""
+        shard = self._shard()
+        key = (name, labels)
+        slots = shard.get(key)
+        buckets = self._meta[name][2]
+        if slots is None:
+            # per-bucket counts, then +Inf, sum, count
+            slots = shard[key] = [0] * (len(buckets) + 3)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                slots[i] += 1
+                break
+        else:
+            slots[len(buckets)] += 1
+        slots[-2] += value
+        slots[-1] += 1
+
+    # Scrape path
+
+    @staticmethod
+    def _merge(into, shard):
+        for key, value in shard.items():
+            if isinstance(value, list):
+                current = into.get(key)
+                if current is None:
+                    into[key] = list(value)
+                else:
+                    for i, v in enumerate(value):
+                        current[i] += v
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def _retire_dead(self):
+        """Fold shards of exited threads into the retired total (caller holds _lock)"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard.copy())
+        self._shards = alive
+
+    def snapshot(self):
+        """Merge every shard into one {(name, labels): value} dict"""
+        with self._lock:
+            self._retire_dead()
+            merged = {}
+            self._merge(merged, self._retired)
+            for _, shard in self._shards:
+                # dict.copy() is atomic under the GIL, so a concurrent insert can't break iteration
+                self._merge(merged, shard.copy())
+        return merged
+
+    def collect(self):
+        """This process's metrics, collectors included: (meta, {(name, labels): value})"""
+        meta = dict(self._meta)
+        merged = self.snapshot()
+        for fn in self._collectors:
+            for name, kind, help_text, samples in fn():
+                meta[name] = (kind, help_text, None)
+                for labels, value in samples:
+                    key = (name, tuple(labels))
+                    merged[key] = merged.get(key, 0) + value
+        return meta, merged
+
+    # Sharing between worker processes
+
+    def write_snapshot(self):
+        """Write this process's totals to METRICS_DIR (atomically)"""
+        if self._file is None:
+            # The start time keeps a reused pid from being mistaken for a retired worker
+            self._file = f'worker-{os.getpid()}-{time.time_ns()}.json'
+        meta, merged = self.collect()
+        _write_file(os.path.join(self.directory, self._file), meta, merged)
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass  # directory removed on shutdown; the next flush retries
+
+    def collect_all(self):
+        """Sum of every worker's latest snapshot (this one fresh) plus exited workers"""
+        self.write_snapshot()
+        retired_meta, retired, names = _read_file(os.path.join(self.directory, RETIRED_FILE))
+        meta, merged = dict(retired_meta), {}
+        self._merge(merged, retired)
+        for path in glob.glob(os.path.join(self.directory, 'worker-*.json')):
+            if os.path.basename(path) in names:
+                continue  # already folded into retired.json, file not yet removed
+            try:
+                worker_meta, samples, _ = _read_file(path)
+            except OSError:
+                continue  # retired between glob and open
+            meta.update(worker_meta)
+            self._merge(merged, samples)
+        return meta, merged
+
+    def render(self):
+        """Everything in Prometheus text exposition format"""
+        meta, merged = self.collect_all() if self.directory else self.collect()
+        by_name = {}
+        for (name, labels), value in merged.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(meta):
+            kind, help_text, buckets = meta[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name.get(name, ()), key=lambda item: item[0]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _write_file(path, meta, merged, names=()):
+    data = {
+        'meta': {name: list(entry) for name, entry in meta.items()},
+        'samples': [[name, [list(pair) for pair in labels], value] for (name, labels), value in merged.items()],
+        'retired': sorted(names),
+    }
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_file(path):
+    """(meta, {(name, labels): value}, retired file names); empty if retired.json doesn't exist yet"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        if os.path.basename(path) == RETIRED_FILE:
+            return {}, {}, set()
+        raise
+    meta = {name: (kind, help_text, tuple(buckets) if buckets else None)
+            for name, (kind, help_text, buckets) in data['meta'].items()}
+    samples = {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in data['samples']}
+    return meta, samples, set(data['retired'])
+
+
+def clear_directory(directory):
+    """Drop every snapshot (master, before starting workers)"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def retire_worker(directory, pid):
+    """
+    Fold an exited worker's counters and histograms into retired.json (master,
+    from gunicorn's child_exit) so totals don't drop when a worker restarts
+    """
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    for path in glob.glob(os.path.join(directory, f'worker-{pid}-*.json')):
+        try:
+            meta, samples, _ = _read_file(path)
+        except (OSError, ValueError):
+            continue
+        retired_meta, retired, names = _read_file(retired_path)
+        retired_meta.update({name: entry for name, entry in meta.items() if entry[0] != 'gauge'})
+        Registry._merge(retired, {key: value for key, value in samples.items() if meta[key[0]][0] != 'gauge'})
+        _write_file(retired_path, retired_meta, retired, names | {os.path.basename(path)})
+        os.remove(path)
+
+
+registry = Registry()
+
+registry.counter('punchly_http_requests_total', 'HTTP requests by route, method and status')
+registry.gauge('punchly_http_requests_in_flight', 'HTTP requests currently being served')
+registry.histogram('punchly_http_request_duration_seconds', 'Time to produce a response', LATENCY_BUCKETS)
+registry.histogram('punchly_http_request_size_bytes', 'Request body size', SIZE_BUCKETS)
+registry.histogram('punchly_http_response_size_bytes', 'Response body size (unstreamed responses)', SIZE_BUCKETS)
+registry.counter('punchly_sql_statements_total', 'SQL statements run per route (only with SQL_TRACE=1)')
+registry.counter('punchly_sql_seconds_total', 'Time spent in SQL per route (only with SQL_TRACE=1)')
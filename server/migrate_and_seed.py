@@ -2,7 +2,9 @@
 """
 Migrate database to new schema and seed with mock data
 """
+import argparse
 import sqlite3
+import time
 import bcrypt
 from datetime import datetime
 import random
@@ -311,150 +313,125 @@ def migrate_database():
     conn.close()
     print("✅ Migration complete!\n")
 
-def seed_mock_data():
-    """Seed database with mock companies and user cards"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+COMPANY_UPSERT_SQL = '''
+    INSERT INTO companies (
+        name, description, program_description, category, color,
+        default_target_score, login_email, password_hash, is_active
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT(login_email) DO UPDATE SET
+        name = excluded.name,
+        description = excluded.description,
+        program_description = excluded.program_description,
+        category = excluded.category,
+        color = excluded.color,
+        default_target_score = excluded.default_target_score,
+        password_hash = excluded.password_hash,
+        is_active = 1
+'''
+
+CARD_UPSERT_SQL = '''
+    INSERT INTO rewards (
+        user_id, company_id, score, target_score, visits,
+        rewards_earned, total_saved, cash_per_redeem, card_number,
+        last_scan_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, company_id) DO UPDATE SET
+        score = excluded.score,
+        target_score = excluded.target_score,
+        visits = excluded.visits,
+        rewards_earned = excluded.rewards_earned,
+        total_saved = excluded.total_saved,
+        cash_per_redeem = excluded.cash_per_redeem,
+        card_number = excluded.card_number,
+        updated_at = excluded.updated_at
+'''
+
+
+def scaled_companies(scale):
+    """MOCK_COMPANIES, plus (scale - 1) numbered copies of each for bigger fixtures"""
+    companies = list(MOCK_COMPANIES)
+    for copy in range(2, scale + 1):
+        for company in MOCK_COMPANIES:
+            local, domain = company['login_email'].split('@')
+            companies.append({
+                **company,
+                'name': f"{company['name']} #{copy}",
+                'login_email': f"{local}-{copy}@{domain}",
+            })
+    return companies
+
+
+def seed_mock_data(scale=1, user_id=1):
+    """Seed database with mock companies and user cards (one transaction, set-based upserts)"""
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
     cursor = conn.cursor()
     
     print("🌱 Seeding mock data...")
     
-    # Check if user 1 exists
-    user = cursor.execute('SELECT id FROM users WHERE id = 1').fetchone()
+    # Check if the user exists
+    user = cursor.execute('SELECT id FROM users WHERE id = ?', (user_id,)).fetchone()
     if not user:
-        print("❌ User with id=1 not found. Please register first.")
+        print(f"❌ User with id={user_id} not found. Please register first.")
         conn.close()
         return
     
-    print("✅ Found user with id=1\n")
+    print(f"✅ Found user with id={user_id}\n")
     
-    # Add mock companies
-    company_ids = []
-    for company_data in MOCK_COMPANIES:
-        # Check if company exists
-        existing = cursor.execute(
-            'SELECT id FROM companies WHERE name = ?',
-            (company_data['name'],)
-        ).fetchone()
-        
-        if existing:
-            company_id = existing['id']
-            # Update existing company with new fields including login credentials
-            password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt()).decode('utf-8')
-            cursor.execute('''
-                UPDATE companies 
-                SET description = ?,
-                    program_description = ?,
-                    category = ?,
-                    color = ?,
-                    default_target_score = ?,
-                    login_email = ?,
-                    password_hash = ?,
-                    is_active = 1
-                WHERE id = ?
-            ''', (
-                company_data['description'],
-                company_data['program_description'],
-                company_data['category'],
-                company_data['color'],
-                company_data['target_score'],
-                company_data['login_email'],
-                password_hash,
-                company_id
-            ))
-            print(f"  ✅ Updated company: {company_data['name']} (id={company_id})")
-        else:
-            # Create new company
-            password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt()).decode('utf-8')
-            cursor.execute('''
-                INSERT INTO companies (
-                    name, description, program_description, category, color,
-                    default_target_score, login_email, password_hash, is_active
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                company_data['name'],
-                company_data['description'],
-                company_data['program_description'],
-                company_data['category'],
-                company_data['color'],
-                company_data['target_score'],
-                company_data['login_email'],
-                password_hash,
-                1
-            ))
-            company_id = cursor.lastrowid
-            print(f"  ✅ Created company: {company_data['name']} (id={company_id})")
-        
-        company_ids.append((company_id, company_data))
+    companies = scaled_companies(scale)
     
-    print()
+    # Every mock company shares one password, so hash it once instead of per row
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt()).decode('utf-8')
     
-    # Add user cards (rewards) for user 1
-    for company_id, company_data in company_ids:
-        # Check if reward already exists
-        existing = cursor.execute(
-            'SELECT id FROM rewards WHERE user_id = 1 AND company_id = ?',
-            (company_id,)
-        ).fetchone()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.executemany(COMPANY_UPSERT_SQL, [(
+            c['name'],
+            c['description'],
+            c['program_description'],
+            c['category'],
+            c['color'],
+            c['target_score'],
+            c['login_email'],
+            password_hash
+        ) for c in companies])
         
-        # Generate random progress
-        score = random.randint(0, company_data['target_score'] - 1)
-        visits = random.randint(score, score + 5)
-        rewards_earned = random.randint(0, 3)
-        total_saved = rewards_earned * company_data['cash_per_redeem']
-        card_number = f"****{random.randint(1000, 9999)}"
+        # Map login emails back to ids in one pass (temp table avoids a huge IN list)
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS seed_logins (login_email TEXT PRIMARY KEY)')
+        cursor.execute('DELETE FROM seed_logins')
+        cursor.executemany('INSERT INTO seed_logins VALUES (?)', [(c['login_email'],) for c in companies])
+        company_ids = dict(cursor.execute(
+            'SELECT c.login_email, c.id FROM companies c JOIN seed_logins s USING (login_email)'
+        ).fetchall())
         
+        # Random progress on a card at every company for the user
         now_iso = datetime.now().isoformat()
-        
-        if existing:
-            # Update existing reward
-            cursor.execute('''
-                UPDATE rewards 
-                SET score = ?,
-                    target_score = ?,
-                    visits = ?,
-                    rewards_earned = ?,
-                    total_saved = ?,
-                    cash_per_redeem = ?,
-                    card_number = ?,
-                    updated_at = ?
-                WHERE id = ?
-            ''', (
+        cards = []
+        for c in companies:
+            score = random.randint(0, c['target_score'] - 1)
+            rewards_earned = random.randint(0, 3)
+            cards.append((
+                user_id,
+                company_ids[c['login_email']],
                 score,
-                company_data['target_score'],
-                visits,
+                c['target_score'],
+                random.randint(score, score + 5),
                 rewards_earned,
-                total_saved,
-                company_data['cash_per_redeem'],
-                card_number,
+                rewards_earned * c['cash_per_redeem'],
+                c['cash_per_redeem'],
+                f"****{random.randint(1000, 9999)}",
                 now_iso,
-                existing['id']
-            ))
-            print(f"  ✅ Updated card: {company_data['name']} - {score}/{company_data['target_score']} punches")
-        else:
-            # Create new reward
-            cursor.execute('''
-                INSERT INTO rewards (
-                    user_id, company_id, score, target_score, visits,
-                    rewards_earned, total_saved, cash_per_redeem, card_number,
-                    last_scan_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                1,
-                company_id,
-                score,
-                company_data['target_score'],
-                visits,
-                rewards_earned,
-                total_saved,
-                company_data['cash_per_redeem'],
-                card_number,
                 now_iso
             ))
-            print(f"  ✅ Created card: {company_data['name']} - {score}/{company_data['target_score']} punches")
+        cursor.executemany(CARD_UPSERT_SQL, cards)
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
     
-    conn.commit()
-    conn.close()
+    print(f"  ✅ Upserted {len(companies)} companies")
+    print(f"  ✅ Upserted {len(cards)} cards for user {user_id}")
     
     print("\n" + "="*60)
     print("✅ Mock data seeding complete!")
@@ -465,9 +442,16 @@ def seed_mock_data():
     print("  • Start server: python3 server.py")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate the schema and seed mock companies and cards')
+    parser.add_argument('--scale', type=int, default=1,
+                        help=f'multiply the {len(MOCK_COMPANIES)} mock companies (e.g. 200 for {len(MOCK_COMPANIES) * 200} merchants)')
+    parser.add_argument('--user-id', type=int, default=1, help='customer who gets the cards (default 1)')
+    args = parser.parse_args()
     try:
+        started = time.perf_counter()
         migrate_database()
-        seed_mock_data()
+        seed_mock_data(scale=max(1, args.scale), user_id=args.user_id)
+        print(f"\n⏱️  Done in {time.perf_counter() - started:.2f}s")
     except Exception as e:
         print(f"❌ Error: {e}")
         import traceback
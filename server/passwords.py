@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+bcrypt verification off the request path
+
+bcrypt.checkpw burns hundreds of milliseconds of CPU. Running it inline lets
+a burst of logins starve scan requests, so checks go to a small dedicated
+pool with a bounded backlog. The request thread still waits for its
+check, so the number of checks in flight (running or queued) is capped
+below the request-thread count: at least one thread per worker stays free
+for taps. Past the cap the caller gets PasswordPoolBusy immediately (the
+server turns that into 503 + Retry-After) instead of queueing behind
+everyone else.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+# 'thread' relies on bcrypt releasing the GIL; 'process' isolates the CPU entirely
+POOL_KIND = os.environ.get('PASSWORD_POOL', 'thread')
+WORKERS = int(os.environ.get('PASSWORD_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Checks running or waiting at once; default leaves one of WEB_THREADS request threads free
+MAX_IN_FLIGHT = int(os.environ.get('PASSWORD_MAX_IN_FLIGHT', max(1, int(os.environ.get('WEB_THREADS', 4)) - 1)))
+RETRY_AFTER = int(os.environ.get('PASSWORD_RETRY_AFTER', 2))
+
+# Upper bounds (seconds) of the hash latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PasswordPoolBusy(Exception):
+    """Too many password checks already queued"""
+
+
+def _checkpw(password, password_hash):
+    """Runs on a pool worker; returns (matched, seconds spent hashing)"""
+    started = time.perf_counter()
+    ok = bcrypt.checkpw(password, password_hash)
+    return ok, time.perf_counter() - started
+
+
+class PasswordVerifier:
+    """Size-capped bcrypt pool with a bounded queue and latency metrics"""
+
+    def __init__(self, kind=POOL_KIND, workers=WORKERS, max_in_flight=MAX_IN_FLIGHT):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'unknown password pool kind: {kind}')
+        self.kind = kind
+        self.workers = min(workers, max_in_flight)  # more hashers than admitted checks would sit idle
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._executor = None
+
+        # Metrics
+        self.pending = 0
+        self.checks = 0
+        self.rejected = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot = +Inf
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix='bcrypt'
+                        )
+        return self._executor
+
+    def check(self, password, password_hash):
+        """True if password matches the stored bcrypt hash; raises PasswordPoolBusy when saturated"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy()
+
+        submitted = time.perf_counter()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(
+                _checkpw, password.encode('utf-8'), password_hash.encode('utf-8')
+            )
+            ok, hash_seconds = future.result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+        total = time.perf_counter() - submitted
+        with self._lock:
+            self.checks += 1
+            self.hash_seconds += hash_seconds
+            self.wait_seconds += max(0.0, total - hash_seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if hash_seconds <= bound:
+                    self.latency_counts[i] += 1
+                    break
+            else:
+                self.latency_counts[-1] += 1
+        return ok
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'workers': self.workers,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.pending,
+                'queue_depth': max(0, self.pending - self.workers),
+                'checks': self.checks,
+                'rejected': self.rejected,
+                'hash_seconds_total': round(self.hash_seconds, 6),
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'hash_latency_buckets': dict(zip(
+                    [str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.latency_counts
+                )),
+            }
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+In-process pub/sub behind the dashboard event stream (/api/stream)
+
+Every open dashboard subscribes to its company's channel and gets events
+on a small bounded queue that its Server-Sent Events response drains. A
+subscriber that falls behind is not allowed to block publishers: its queue
+is cleared and it is told to resync (refetch everything once) instead.
+
+Writes can land in any worker process, so events don't come from the
+request that wrote: while a worker has open streams, its ChangeFeed thread
+polls the database for rows stamped since the last poll (see sync_clock in
+schema.sql) and publishes them. That costs one primary-key read per card
+database per SSE_POLL_SECONDS, and nothing when no dashboard is open.
+
+Each open stream holds one server thread, so a worker accepts at most
+SSE_MAX_STREAMS at once (503 above that) and streams end after
+SSE_MAX_SECONDS; the browser's EventSource reconnects on its own.
+
+Environment:
+    SSE_QUEUE_MAX          events buffered per subscriber (default 256)
+    SSE_HEARTBEAT_SECONDS  keep-alive comment interval (default 15)
+    SSE_MAX_SECONDS        stream lifetime before the client reconnects (default 300)
+    SSE_MAX_STREAMS        open streams per worker process (default 2)
+    SSE_POLL_SECONDS       change feed poll interval (default 1)
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+import fastjson
+
+QUEUE_MAX = int(os.environ.get('SSE_QUEUE_MAX', 256))
+HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+MAX_SECONDS = float(os.environ.get('SSE_MAX_SECONDS', 300))
+MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 2))
+POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', 1))
+RETRY_MS = 3000  # EventSource reconnect delay
+
+log = logging.getLogger('punchly.sse')
+
+
+class StreamsFull(Exception):
+    """This worker already holds SSE_MAX_STREAMS open streams"""
+
+PING = b': ping\n\n'
+
+
+def frame(event, data):
+    """One SSE message as bytes"""
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + fastjson.dumps(data) + b'\n\n'
+
+
+class Subscription:
+    __slots__ = ('channel', 'queue', 'lagged')
+
+    def __init__(self, channel, queue_max):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=queue_max)
+        self.lagged = False
+
+
+class Broker:
+    """Channel -> subscriber queues; publish never blocks"""
+
+    def __init__(self, queue_max=QUEUE_MAX, max_streams=MAX_STREAMS):
+        self.queue_max = queue_max
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._channels = {}  # channel -> set of Subscription
+        self._count = 0
+
+        # Metrics
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def subscribe(self, channel):
+        """Reserve a stream slot; raises StreamsFull when max_streams are open"""
+        sub = Subscription(channel, self.queue_max)
+        with self._lock:
+            if self._count >= self.max_streams:
+                self.rejected += 1
+                raise StreamsFull()
+            self._channels.setdefault(channel, set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub):
+        """Release a subscription (safe to call more than once)"""
+        with self._lock:
+            subs = self._channels.get(sub.channel)
+            if subs is None or sub not in subs:
+                return
+            subs.discard(sub)
+            self._count -= 1
+            if not subs:
+                del self._channels[sub.channel]
+
+    def has_subscribers(self, channel=None):
+        """Cheap check so publishers can skip building an event nobody will see (any channel if None)"""
+        if channel is None:
+            return bool(self._channels)
+        return channel in self._channels
+
+    def publish(self, channel, event, data):
+        """Encode once and queue for every subscriber of channel; returns how many got it"""
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+            self.published += 1
+        if not subs:
+            return 0
+        message = frame(event, data)
+        delivered = 0
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                sub.lagged = True
+        with self._lock:
+            self.delivered += delivered
+            self.dropped += len(subs) - delivered
+        return delivered
+
+    def stream(self, sub, heartbeat=HEARTBEAT_SECONDS, max_seconds=MAX_SECONDS):
+        """
+        Generator of SSE bytes for one subscription: a ready event, then queued
+        events, keep-alive pings and resync notices until max_seconds pass or
+        the client goes away. Unsubscribes when it ends; the caller should also
+        unsubscribe when the response closes, in case it never started.
+        """
+        channel = sub.channel
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f'retry: {RETRY_MS}\n'.encode('ascii') + frame('ready', {'channel': channel})
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    message = sub.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield PING
+                    continue
+                if sub.lagged:
+                    while True:
+                        try:
+                            sub.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                    sub.lagged = False
+                    yield frame('resync', {'channel': channel})
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscribers': self._count,
+                'max_streams': self.max_streams,
+                'rejected': self.rejected,
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+            }
+
+
+class ChangeFeed:
+    """
+    Publishes writes made by any worker process. While the broker has
+    subscribers, a thread calls read_changes(since) every interval; it
+    returns ([(channel, event, data), ...], new since). read_position()
+    gives the starting point and must be taken before a new subscriber is
+    told it is ready, so nothing committed after its first fetch is missed.
+    """
+
+    def __init__(self, broker, read_position, read_changes, interval=POLL_SECONDS):
+        self.broker = broker
+        self.read_position = read_position
+        self.read_changes = read_changes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._since = None
+
+        # Metrics
+        self.polls = 0
+        self.errors = 0
+
+    def ensure_running(self):
+        """Start polling (after subscribing, before the ready event)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._since = self.read_position()
+            self._thread = threading.Thread(target=self._run, name='sse-change-feed', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.broker.has_subscribers():
+                    self._thread = None  # the next stream starts over from a fresh position
+                    return
+            try:
+                events, self._since = self.read_changes(self._since)
+            except Exception:
+                self.errors += 1
+                log.exception('change feed poll failed')
+                continue
+            self.polls += 1
+            for channel, event, data in events:
+                self.broker.publish(channel, event, data)
+
+    def after_fork(self):
+        """Threads don't survive fork; the first stream in the child starts a new one"""
+        self._lock = threading.Lock()
+        self._thread = None
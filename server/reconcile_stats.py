@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Rebuild the company_stats rollup from rewards and report any drift
+
+company_stats is kept current by triggers, so drift should only show up
+after out-of-band edits (e.g. a bulk load with triggers dropped).
+With SHARD_COUNT > 1 every shard is reconciled on its own.
+Usage: python3 reconcile_stats.py [--check] [--db PATH]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+import shards
+
+DB_PATH = os.environ.get('DB_PATH', 'data/rewards.db')
+
+EXPECTED_SQL = '''
+    SELECT company_id, COUNT(*), COALESCE(SUM(score), 0),
+           SUM(COALESCE(score >= target_score * 0.8, 0))
+    FROM rewards
+    GROUP BY company_id
+'''
+
+COLUMNS = ('total_users', 'total_scans', 'close_to_reward')
+
+
+def reconcile(conn, fix=True):
+    """
+    Compare company_stats with a fresh aggregate over rewards.
+    Returns a list of (company_id, column, stored, expected); rewrites the rollup if fix.
+    """
+    # IMMEDIATE so no scan can land between the aggregate and the rewrite
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        expected = {row[0]: tuple(row[1:]) for row in conn.execute(EXPECTED_SQL)}
+        stored = {
+            row[0]: tuple(row[1:])
+            for row in conn.execute(
+                'SELECT company_id, total_users, total_scans, close_to_reward FROM company_stats'
+            )
+        }
+
+        drift = []
+        for company_id in sorted(expected.keys() | stored.keys()):
+            want = expected.get(company_id, (0, 0, 0))
+            have = stored.get(company_id)
+            if have is None:
+                if want != (0, 0, 0):
+                    drift.append((company_id, 'missing', None, want))
+                continue
+            for column, h, w in zip(COLUMNS, have, want):
+                if h != w:
+                    drift.append((company_id, column, h, w))
+
+        if fix and drift:
+            conn.execute('DELETE FROM company_stats')
+            conn.executemany(
+                'INSERT INTO company_stats (company_id, total_users, total_scans, close_to_reward) '
+                'VALUES (?, ?, ?, ?)',
+                [(company_id, *values) for company_id, values in expected.items()]
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check (and rebuild) company_stats against rewards')
+    parser.add_argument('--check', action='store_true', help='report drift only; exit 1 if any')
+    parser.add_argument('--db', default=DB_PATH, help='directory database (default: $DB_PATH)')
+    args = parser.parse_args()
+
+    drift = []
+    for path in shards.all_paths(args.db):
+        conn = sqlite3.connect(path)
+        try:
+            drift += [(path, *row) for row in reconcile(conn, fix=not args.check)]
+        finally:
+            conn.close()
+
+    if not drift:
+        print("✅ company_stats matches rewards")
+        sys.exit(0)
+
+    print(f"⚠️  Found {len(drift)} drifted value(s):")
+    for path, company_id, column, stored, expected in drift:
+        print(f"  • {path} company {company_id}: {column} stored={stored} expected={expected}")
+    if args.check:
+        sys.exit(1)
+    print("✅ company_stats rebuilt from rewards")
@@ -2,9 +2,12 @@
 """
 Reset the database and seed it with data from seed.sql
 """
+import argparse
 import os
 import sqlite3
 
+import snapshot
+
 DB_PATH = 'data/rewards.db'
 SCHEMA_PATH = 'data/schema.sql'
 SEED_PATH = 'data/seed.sql'
@@ -56,8 +59,18 @@ def reset_and_seed():
     print("  • Or any other company email from seed.sql")
 
 if __name__ == "__main__":
-    confirm = input("⚠️  This will DELETE all data in the database. Continue? (yes/no): ")
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--snapshot', action='store_true',
+                        help='restore a cached template (rebuilt only when schema.sql/seed.sql change) instead of replaying SQL')
+    parser.add_argument('--yes', '-y', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    confirm = 'yes' if args.yes else input("⚠️  This will DELETE all data in the database. Continue? (yes/no): ")
     if confirm.lower() in ['yes', 'y']:
-        reset_and_seed()
+        if args.snapshot:
+            elapsed = snapshot.reset_from_template(DB_PATH, seed=True)
+            print(f"✅ Database reset and seeded from template in {elapsed * 1000:.1f} ms")
+        else:
+            reset_and_seed()
     else:
         print("❌ Cancelled")
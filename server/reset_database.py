@@ -2,9 +2,12 @@
 """
 Reset the database - deletes the old database and creates a fresh one
 """
+import argparse
 import os
 import sqlite3
 
+import snapshot
+
 DB_PATH = 'data/rewards.db'
 SCHEMA_PATH = 'data/schema.sql'
 
@@ -41,8 +44,18 @@ def reset_database():
     print("  • Register new users via the API")
 
 if __name__ == "__main__":
-    confirm = input("⚠️  This will DELETE all data in the database. Continue? (yes/no): ")
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--snapshot', action='store_true',
+                        help='restore a cached template (rebuilt only when schema.sql changes) instead of replaying SQL')
+    parser.add_argument('--yes', '-y', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    confirm = 'yes' if args.yes else input("⚠️  This will DELETE all data in the database. Continue? (yes/no): ")
     if confirm.lower() in ['yes', 'y']:
-        reset_database()
+        if args.snapshot:
+            elapsed = snapshot.reset_from_template(DB_PATH, seed=False)
+            print(f"✅ Database reset from template in {elapsed * 1000:.1f} ms")
+        else:
+            reset_database()
     else:
         print("❌ Cancelled")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Write-behind group commit for scan ingestion
+
+In batched mode request threads don't commit their own scans. They enqueue
+the tap and wait on a future while a single writer thread applies whatever
+has queued up in one BEGIN IMMEDIATE transaction, so one fsync covers the
+whole batch and write throughput grows with batch size instead of fsync rate.
+
+A request that gives up waiting gets WriterUnavailable (503). Its scan is
+withdrawn if it hasn't reached a batch yet, so a retry can't punch twice.
+A batch whose transaction fails (e.g. the write lock stays busy past
+busy_timeout) is rolled back and its scans get WriterUnavailable. If the
+writer can't open its database, or a batch fails outside the
+transaction, that batch fails the same way and the next batch
+reconnects; if the thread dies anyway, queued scans are failed and the
+next submit starts a new one.
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+
+from db import open_connection
+from scans import ScanError, punch
+
+# 'direct' = every request commits its own scan, 'batched' = group commit via ScanWriter
+SCAN_INGEST_MODE = os.environ.get('SCAN_INGEST_MODE', 'direct')
+
+# Flush policy: 'timed' waits up to BATCH_MAX_DELAY_MS for the batch to fill,
+# 'eager' flushes whatever queued while the previous commit was in flight
+FLUSH_POLICY = os.environ.get('SCAN_FLUSH_POLICY', 'timed')
+BATCH_MAX_SIZE = int(os.environ.get('SCAN_BATCH_MAX_SIZE', 256))
+BATCH_MAX_DELAY_MS = float(os.environ.get('SCAN_BATCH_MAX_DELAY_MS', 5))
+QUEUE_MAX = int(os.environ.get('SCAN_QUEUE_MAX', 10000))
+RESULT_TIMEOUT = float(os.environ.get('SCAN_RESULT_TIMEOUT', 10))
+
+_STOP = object()
+
+log = logging.getLogger('punchly.scan')
+
+
+class WriterUnavailable(Exception):
+    """The scan queue is full, the writer is failing or shutting down, or a scan timed out"""
+
+
+class _PendingScan:
+    __slots__ = ('user_id', 'company_id', 'now', 'future')
+
+    def __init__(self, user_id, company_id, now):
+        self.user_id = user_id
+        self.company_id = company_id
+        self.now = now
+        self.future = Future()
+
+
+class ScanWriter:
+    """Single writer thread that applies queued scans in batched transactions"""
+
+    def __init__(self, path, policy=FLUSH_POLICY, max_batch=BATCH_MAX_SIZE,
+                 max_delay_ms=BATCH_MAX_DELAY_MS, queue_max=QUEUE_MAX, attach=None):
+        if policy not in ('timed', 'eager'):
+            raise ValueError(f'unknown flush policy: {policy}')
+        self.path = path
+        self.attach = attach
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # Metrics
+        self.batches = 0
+        self.scans = 0
+        self.failed_batches = 0
+        self.writer_errors = 0
+        self.timeouts = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='scan-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, user_id, company_id):
+        """Queue a scan; the returned future resolves to the scan payload or ScanError"""
+        if self._closed:
+            raise WriterUnavailable('scan writer is shutting down')
+        self._ensure_started()
+        item = _PendingScan(user_id, company_id, datetime.now().isoformat())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            raise WriterUnavailable('scan queue is full')
+        return item.future
+
+    def scan(self, user_id, company_id, timeout=RESULT_TIMEOUT):
+        """Queue a scan and wait for its payload (raises ScanError, or WriterUnavailable on timeout)"""
+        future = self.submit(user_id, company_id)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            pass
+        with self._lock:
+            self.timeouts += 1
+        # Still queued: withdraw it so the client's retry is the only punch
+        if future.cancel():
+            raise WriterUnavailable('scan timed out in the queue')
+        # Already in a batch that is committing: its outcome is what the client must see
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise WriterUnavailable('scan commit timed out')
+
+    def close(self, timeout=30):
+        """Stop accepting scans and drain everything already queued"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Block for the first scan, then gather more according to the flush policy"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                if self.policy == 'eager':
+                    item = self._queue.get_nowait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = None
+        stopping = False
+        try:
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if not batch:
+                    continue
+                try:
+                    if conn is None:
+                        conn = open_connection(self.path, self.attach)
+                    self._apply(conn, batch)
+                except Exception as e:
+                    # Couldn't open the database, or the batch broke outside its transaction
+                    log.exception('scan writer for %s failed', self.path)
+                    with self._lock:
+                        self.failed_batches += 1
+                        self.writer_errors += 1
+                    self._fail(batch, WriterUnavailable(f'scan writer failed: {e}'))
+                    if conn is not None:
+                        conn.close()
+                        conn = None  # reconnect for the next batch
+        finally:
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self._thread = None  # the next submit starts a fresh writer
+            if not stopping:
+                self._fail(self._drain(), WriterUnavailable('scan writer stopped'))
+
+    def _drain(self):
+        """Everything still queued (the writer thread is gone)"""
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    @staticmethod
+    def _fail(items, error):
+        for item in items:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    def _apply(self, conn, batch):
+        # Scans whose request already gave up were cancelled; the rest can no longer be
+        batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.monotonic()
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for item in batch:
+                try:
+                    outcomes.append((item.future, punch(conn, item.user_id, item.company_id, item.now), None))
+                except ScanError as e:
+                    outcomes.append((item.future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            with self._lock:
+                self.failed_batches += 1
+            # e.g. 'database is locked' past busy_timeout: the client should retry, not see a 500
+            error = WriterUnavailable(f'scan batch failed: {e}')
+            error.__cause__ = e
+            for item in batch:
+                item.future.set_exception(error)
+            return
+
+        # Only resolve futures once the batch is durable
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self._lock:
+            self.batches += 1
+            self.scans += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_seconds += time.monotonic() - started
+
+    def stats(self):
+        """Snapshot of writer metrics"""
+        with self._lock:
+            return {
+                'policy': self.policy,
+                'max_batch': self.max_batch,
+                'max_delay_ms': self.max_delay * 1000,
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'scans': self.scans,
+                'failed_batches': self.failed_batches,
+                'writer_errors': self.writer_errors,
+                'timeouts': self.timeouts,
+                'largest_batch': self.largest_batch,
+                'mean_batch': round(self.scans / self.batches, 2) if self.batches else 0,
+                'commit_seconds_total': round(self.commit_seconds, 6),
+            }
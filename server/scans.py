@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Shared scan engine for /api/mobile/scan and /api/rewards/scan
+
+A punch is a single upsert inside BEGIN IMMEDIATE. The user/company checks,
+the cap at target_score and the visits bump all live in the statement, so a
+tap costs one write round trip and concurrent taps on the same card serialize
+on the write lock instead of racing a read-modify-write. The punch is also
+appended to the scan_events ledger in the same transaction.
+"""
+import json
+import time
+from datetime import datetime
+
+import events
+
+BATCH_MAX_ITEMS = 500
+IDEMPOTENCY_KEY_MAX = 128
+
+PUNCH_SQL = '''
+    INSERT INTO rewards (user_id, company_id, score, target_score, visits, last_scan_at, updated_at)
+    SELECT u.id, c.id, 1, COALESCE(c.default_target_score, 10), 1, :now, :now
+    FROM users u, companies c
+    WHERE u.id = :user_id AND c.id = :company_id AND c.is_active = 1
+    ON CONFLICT(user_id, company_id) DO UPDATE SET
+        score = score + 1,
+        visits = visits + 1,
+        last_scan_at = excluded.last_scan_at,
+        updated_at = excluded.updated_at
+    WHERE score < target_score
+    RETURNING score, target_score, (SELECT name FROM companies WHERE id = company_id),
+              user_id, company_id
+'''
+
+
+class ScanError(Exception):
+    """A scan that was rejected; carries the HTTP status and JSON body"""
+
+    def __init__(self, status, body):
+        super().__init__(body.get('error'))
+        self.status = status
+        self.body = body
+
+
+def _rejection(conn, user_id, company_id):
+    """Work out why the upsert touched no row (only runs on the failure path)"""
+    if not conn.execute('SELECT 1 FROM users WHERE id = ?', (user_id,)).fetchone():
+        return ScanError(404, {'error': 'User not found'})
+    if not conn.execute(
+        'SELECT 1 FROM companies WHERE id = ? AND is_active = 1', (company_id,)
+    ).fetchone():
+        return ScanError(404, {'error': 'Company not found or inactive'})
+
+    card = conn.execute(
+        'SELECT score, target_score FROM rewards WHERE user_id = ? AND company_id = ?',
+        (user_id, company_id)
+    ).fetchone()
+    score, target_score = card[0], card[1]
+    return ScanError(400, {
+        'error': 'Card is full',
+        'message': f'Your card is already at maximum ({target_score}/{target_score}). Please redeem your reward first.',
+        'current_score': score,
+        'target_score': target_score
+    })
+
+
+def punch(conn, user_id, company_id, now=None):
+    """
+    Apply one punch inside the caller's open write transaction.
+    Returns the scan response payload or raises ScanError.
+    """
+    now = now or datetime.now().isoformat()
+    row = conn.execute(PUNCH_SQL, {
+        'user_id': user_id,
+        'company_id': company_id,
+        'now': now
+    }).fetchone()
+    if row is None:
+        raise _rejection(conn, user_id, company_id)
+
+    new_score, target_score, company_name = row[0], row[1], row[2]
+    events.record(conn, row[4], row[3], events.PUNCH, 1, datetime.fromisoformat(now).timestamp())
+    reward_earned = new_score >= target_score
+
+    response = {
+        'success': True,
+        'user_id': user_id,
+        'company_id': company_id,
+        'company_name': company_name,
+        'previous_score': new_score - 1,
+        'new_score': new_score,
+        'target_score': target_score,
+        'reward_earned': reward_earned,
+        'progress_percentage': int((new_score / target_score) * 100),
+        'scans_until_reward': max(0, target_score - new_score)
+    }
+    if reward_earned:
+        response['reward_message'] = f"🎉 Congratulations! You earned a reward at {company_name}!"
+    return response
+
+
+def apply_scan(conn, user_id, company_id):
+    """Run one punch in its own BEGIN IMMEDIATE transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = punch(conn, user_id, company_id)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return result
+
+
+def _tap_time(scanned_at):
+    """Normalize a client timestamp to the server's local-time ISO format (never in the future)"""
+    now = datetime.now()
+    if not scanned_at:
+        return now.isoformat()
+    dt = datetime.fromisoformat(str(scanned_at).replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return min(dt, now).isoformat()
+
+
+def apply_batch(conn, user_id, items):
+    """
+    Apply queued offline taps in one BEGIN IMMEDIATE transaction.
+    Each item needs an idempotency_key and company_id (scanned_at optional).
+    Keys already seen for this user replay their stored result instead of punching again.
+    Returns one result dict per item, in order.
+    """
+    results = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for item in items:
+            key = item.get('idempotency_key') if isinstance(item, dict) else None
+            company_id = item.get('company_id') if isinstance(item, dict) else None
+            if not key or not isinstance(key, str) or len(key) > IDEMPOTENCY_KEY_MAX:
+                results.append({'idempotency_key': key, 'status': 400,
+                                'result': {'error': 'idempotency_key required'}})
+                continue
+            if not company_id:
+                results.append({'idempotency_key': key, 'status': 400,
+                                'result': {'error': 'company_id required'}})
+                continue
+
+            receipt = conn.execute(
+                'SELECT status, result FROM scan_receipts WHERE user_id = ? AND idempotency_key = ?',
+                (user_id, key)
+            ).fetchone()
+            if receipt is not None:
+                results.append({'idempotency_key': key, 'status': receipt[0],
+                                'result': json.loads(receipt[1]), 'duplicate': True})
+                continue
+
+            try:
+                now = _tap_time(item.get('scanned_at'))
+            except (TypeError, ValueError):
+                results.append({'idempotency_key': key, 'status': 400,
+                                'result': {'error': 'scanned_at must be an ISO 8601 timestamp'}})
+                continue
+
+            try:
+                status, body = 200, punch(conn, user_id, company_id, now)
+            except ScanError as e:
+                status, body = e.status, e.body
+            conn.execute(
+                'INSERT INTO scan_receipts (user_id, idempotency_key, status, result, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (user_id, key, status, json.dumps(body), int(time.time()))
+            )
+            results.append({'idempotency_key': key, 'status': status, 'result': body, 'duplicate': False})
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return results
@@ -2,25 +2,57 @@
 """
 Flask server for SQLite-based loyalty rewards with authentication (email-only)
 """
+import hmac
+import logging
 import os
 import sqlite3
 import bcrypt
 import secrets
 import random
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_from_directory, session
+import time
+from datetime import datetime, timedelta, timezone
+from flask import Flask, g, jsonify, request, send_from_directory, session, stream_with_context
 from flask_cors import CORS
+from db import READ_POOL_SIZE, ConnectionPool, PoolTimeout
+from scans import BATCH_MAX_ITEMS, ScanError, apply_batch, apply_scan
+from catalog import CompanyCatalog
+import compress
+from cards import fetch_card
+from customers import PAGE_DEFAULT, fetch_customer, fetch_page, iter_customers
+import events
+from passwords import RETRY_AFTER, PasswordPoolBusy, PasswordVerifier
+from pubsub import Broker, ChangeFeed, StreamsFull
+import fastjson
+import logconfig
+import metrics
+import shards
+import sqltrace
+import wallet
+from scan_writer import RESULT_TIMEOUT, SCAN_INGEST_MODE, ScanWriter, WriterUnavailable
 
 # ----------------------------------
 # App & session cookie configuration
 # ----------------------------------
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32) #stable = persistant sessions 
+logconfig.setup()
+scan_log = logging.getLogger('punchly.scan')
+auth_log = logging.getLogger('punchly.auth')
+
+def load_secret_key():
+    """Session signing key from SECRET_KEY or SECRET_KEY_FILE (None if neither is set)"""
+    key = os.environ.get('SECRET_KEY')
+    if not key and os.environ.get('SECRET_KEY_FILE'):
+        with open(os.environ['SECRET_KEY_FILE'], 'r') as f:
+            key = f.read().strip()
+    return key or None
+
+# Every worker must sign sessions with the same key; the random fallback is for `python3 server.py` only
+app.secret_key = load_secret_key() or secrets.token_hex(32)
 
 # Same-origin local dev over HTTP:
 app.config.update(
     SESSION_COOKIE_SAMESITE="Lax",  # good for same-origin calls
-    SESSION_COOKIE_SECURE=False,# true for HTTPS
+    SESSION_COOKIE_SECURE=os.environ.get('SESSION_COOKIE_SECURE') == '1',  # set to 1 behind HTTPS
     PERMANENT_SESSION_LIFETIME=timedelta(days=7),
 )
 
@@ -43,23 +75,360 @@ CORS(app, supports_credentials=True, resources={
     }
 })
 
-DB_PATH = 'data/rewards.db'
-
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+DB_PATH = os.environ.get('DB_PATH', 'data/rewards.db')
+
+# One pool per worker; connections are opened lazily on first checkout.
+# Writes use the read-write pool; read-only endpoints use the query_only readers.
+db_pool = ConnectionPool(DB_PATH)
+read_pool = ConnectionPool(DB_PATH, size=READ_POOL_SIZE, query_only=True)
+
+# Optional company shards (SHARD_COUNT > 1, see shards.py): cards, scans and stats live in
+# per-company shard files; users and companies stay in DB_PATH, attached read-only
+shard_paths = [shards.shard_path(index) for index in range(shards.SHARD_COUNT)] if shards.ENABLED else []
+shard_pools = [ConnectionPool(path, attach=DB_PATH) for path in shard_paths]
+shard_read_pools = [
+    ConnectionPool(path, size=READ_POOL_SIZE, attach=DB_PATH, query_only=True) for path in shard_paths
+]
+
+def checkout(pool):
+    """This request's connection from pool (acquired on first use, released at teardown)"""
+    conns = g.setdefault('db_conns', {})
+    conn = conns.get(pool)
+    if conn is None:
+        conn = conns[pool] = pool.acquire()
+        if sqltrace.ENABLED:
+            g.sql_trace = sqltrace.attach(conn, g.get('sql_trace'))
     return conn
 
+def get_db(read=False):
+    """Get this request's connection for users, companies and sessions (read=True: query_only)"""
+    return checkout(read_pool if read else db_pool)
+
+def get_shard_db(index, read=False):
+    """Get this request's connection to one shard"""
+    return checkout((shard_read_pools if read else shard_pools)[index])
+
+def company_db(company_id, read=False):
+    """Connection holding a company's cards, scan events and stats"""
+    if not shards.ENABLED:
+        return get_db(read)
+    return get_shard_db(shards.company_shard(company_id), read)
+
+def card_db(card_id, read=False):
+    """Connection holding a card, or None if no shard could have issued its id"""
+    if not shards.ENABLED:
+        return get_db(read)
+    index = shards.card_shard(card_id)
+    return get_shard_db(index, read) if index is not None else None
+
+def all_card_dbs(read=False):
+    """Every connection a user's cards can live on (one per shard)"""
+    if not shards.ENABLED:
+        return [get_db(read)]
+    return [get_shard_db(index, read) for index in range(shards.SHARD_COUNT)]
+
+@app.teardown_appcontext
+def release_db(exc):
+    """Hand the request's connections back to their pools"""
+    conns = g.pop('db_conns', {})
+    trace = g.pop('sql_trace', None)
+    if trace is not None and conns:
+        # Slow statements are explained on a shard when there is one: it sees every table
+        explain_pool = next((pool for pool in conns if pool.attach), next(iter(conns)))
+        for pool, conn in conns.items():
+            if pool is not explain_pool:
+                sqltrace.unhook(conn)
+        sqltrace.detach(conns[explain_pool], trace, g.get('route', '?'))
+    for pool, conn in conns.items():
+        pool.release(conn)
+
+@app.errorhandler(PoolTimeout)
+def db_pool_exhausted(e):
+    return jsonify({'error': 'Server busy, please retry'}), 503
+
+# Serialized company catalog, rebuilt only when catalog_version changes
+company_catalog = CompanyCatalog()
+
+# Optional write-behind group commit for scans (SCAN_INGEST_MODE=batched), one writer per shard
+if SCAN_INGEST_MODE != 'batched':
+    scan_writers = []
+elif shards.ENABLED:
+    scan_writers = [ScanWriter(pool.path, attach=DB_PATH) for pool in shard_pools]
+else:
+    scan_writers = [ScanWriter(DB_PATH)]
+
+def run_scan(user_id, company_id):
+    """Apply a scan in its own transaction, or hand it to the group-commit writer"""
+    if not scan_writers:
+        return apply_scan(company_db(company_id), user_id, company_id)
+    writer = scan_writers[shards.company_shard(company_id)] if shards.ENABLED else scan_writers[0]
+    return writer.scan(user_id, company_id, timeout=RESULT_TIMEOUT)
+
+def run_batch(user_id, items):
+    """Apply offline taps; with shards, one transaction per shard touched"""
+    if not shards.ENABLED:
+        return apply_batch(get_db(), user_id, items)
+    results = [None] * len(items)
+    for index, positions in shards.group_by_shard(items).items():
+        applied = apply_batch(get_shard_db(index), user_id, [items[p] for p in positions])
+        for position, result in zip(positions, applied):
+            results[position] = result
+    return results
+
+def scan_writer_totals():
+    """Writer counters summed over every shard's writer"""
+    totals = dict.fromkeys(('queue_depth', 'batches', 'scans', 'failed_batches', 'timeouts'), 0)
+    for writer in scan_writers:
+        stats = writer.stats()
+        for key in totals:
+            totals[key] += stats[key]
+    return totals
+
+# Scan event rollups (see events.py), folded by a background thread in each process
+rollup_stage = events.RollupStage(shards.all_paths(DB_PATH))
+
+# Live dashboard updates (GET /api/stream, see pubsub.py): one channel per company,
+# fed by polling the card databases so writes from every worker process show up
+dashboard_events = Broker()
+
+# Customers whose card was written or deleted in (since, clock]
+CHANGED_CUSTOMERS_SQL = (
+    'SELECT company_id, user_id FROM rewards WHERE version > :since AND version <= :clock '
+    'UNION SELECT company_id, user_id FROM card_tombstones '
+    'WHERE version > :since AND version <= :clock AND company_id IS NOT NULL'
+)
+
+def card_read_pools():
+    """Reader pools of every database holding cards (one per shard)"""
+    return shard_read_pools if shards.ENABLED else [read_pool]
+
+def read_company_stats(conn, company_id):
+    """Dashboard totals, maintained by triggers on rewards (see company_stats in schema.sql)"""
+    stats = conn.execute(
+        'SELECT total_users, total_scans, close_to_reward FROM company_stats WHERE company_id = ?',
+        (company_id,)
+    ).fetchone()
+    total_users, total_scans, close_to_reward = tuple(stats) if stats else (0, 0, 0)
+    return {
+        'total_users': total_users,
+        'total_scans': total_scans,
+        'close_to_reward': close_to_reward
+    }
+
+def read_change_clocks():
+    """Current sync_clock of every card database: where the change feed starts"""
+    clocks = []
+    for pool in card_read_pools():
+        conn = pool.acquire()
+        try:
+            clocks.append(wallet.read_clock(conn))
+        finally:
+            pool.release(conn)
+    return clocks
+
+def read_dashboard_changes(since):
+    """
+    change events ({user_id, customer, stats}; customer is None once the card is gone)
+    for writes stamped after since, for companies with an open dashboard
+    """
+    changes, clocks = [], []
+    for pool, version in zip(card_read_pools(), since):
+        conn = pool.acquire()
+        try:
+            # Writes serialize on the database lock, so everything stamped <= clock has committed
+            clock = wallet.read_clock(conn)
+            clocks.append(clock)
+            if clock == version:
+                continue
+            for company_id, user_id in conn.execute(CHANGED_CUSTOMERS_SQL, {'since': version, 'clock': clock}):
+                if not dashboard_events.has_subscribers(company_id):
+                    continue
+                changes.append((company_id, 'change', {
+                    'user_id': user_id,
+                    'customer': fetch_customer(conn, company_id, user_id),
+                    'stats': read_company_stats(conn, company_id)
+                }))
+        finally:
+            pool.release(conn)
+    return changes, clocks
+
+dashboard_feed = ChangeFeed(dashboard_events, read_change_clocks, read_dashboard_changes)
+
+@app.errorhandler(StreamsFull)
+def dashboard_streams_full(e):
+    response = jsonify({'error': 'Too many open dashboards, please retry'})
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+@app.errorhandler(WriterUnavailable)
+def scan_writer_unavailable(e):
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def json_response(payload, status=200):
+    """JSON response encoded with the fast encoder (orjson when installed)"""
+    return app.response_class(fastjson.dumps(payload), status=status, mimetype='application/json')
+
+def tagged(build, etag, weak=False):
+    """
+    Per-user response validated by etag: an empty 304 if If-None-Match already
+    has it, otherwise build() (only called on a miss) with the tag attached
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=weak)
+    response.headers['Cache-Control'] = 'private, no-cache'  # always revalidate, never share between users
+    return response
+
+# bcrypt checks run on a dedicated, size-capped pool (see passwords.py)
+password_verifier = PasswordVerifier()
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    response = jsonify({'error': 'Too many login attempts in progress, please retry'})
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response, 503
+
+# Per-route request metrics, scraped at /metrics (see metrics.py)
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    metrics.registry.inc('punchly_http_requests_in_flight')
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # Templated rule, not the raw path, so card ids don't explode label cardinality
+    route = g.route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (('route', route), ('method', request.method))
+    registry = metrics.registry
+    registry.inc('punchly_http_requests_in_flight', value=-1)
+    registry.inc('punchly_http_requests_total', labels + (('status', str(response.status_code)),))
+    registry.observe('punchly_http_request_duration_seconds', labels, elapsed)
+    registry.observe('punchly_http_request_size_bytes', labels, request.content_length or 0)
+    if not response.is_streamed:
+        registry.observe('punchly_http_response_size_bytes', labels, response.calculate_content_length() or 0)
+
+    trace = g.get('sql_trace')
+    if trace is not None:
+        trace.finish()
+        response.headers['Server-Timing'] = sqltrace.server_timing(trace, elapsed)
+        registry.inc('punchly_sql_statements_total', (('route', route),), trace.statements)
+        registry.inc('punchly_sql_seconds_total', (('route', route),), trace.seconds)
+    return response
+
+# Negotiated gzip/brotli for JSON responses (see compress.py). Registered after the
+# metrics hook so it runs first and response sizes are recorded as sent.
+response_compressor = compress.Compressor()
+
+@app.after_request
+def compress_response(response):
+    if not compress.ENABLED:
+        return response
+    return response_compressor.apply(request, response)
+
+@metrics.registry.collector
+def component_metrics():
+    """Pool, writer, bcrypt, logging, compression and catalog stats as gauges/counters at scrape time"""
+    pool = db_pool.stats()
+    yield 'punchly_db_pool_connections', 'gauge', 'Pooled connections by state', [
+        ((('state', 'idle'),), pool['idle']), ((('state', 'in_use'),), pool['in_use'])
+    ]
+    yield 'punchly_db_pool_checkouts_total', 'counter', 'Connection checkouts', [((), pool['checkouts'])]
+    yield 'punchly_db_pool_waits_total', 'counter', 'Checkouts that had to wait', [((), pool['waits'])]
+    yield 'punchly_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection', [((), pool['wait_seconds_total'])]
+    yield 'punchly_db_pool_timeouts_total', 'counter', 'Checkouts that timed out', [((), pool['timeouts'])]
+
+    readers = read_pool.stats()
+    yield 'punchly_db_read_pool_connections', 'gauge', 'Pooled query_only connections by state', [
+        ((('state', 'idle'),), readers['idle']), ((('state', 'in_use'),), readers['in_use'])
+    ]
+    yield 'punchly_db_read_pool_waits_total', 'counter', 'Reader checkouts that had to wait', [((), readers['waits'])]
+
+    if shard_pools:
+        shard_stats = [(str(index), pool.stats()) for index, pool in enumerate(shard_pools)]
+        yield 'punchly_db_shard_pool_in_use', 'gauge', 'Checked-out shard connections', [
+            ((('shard', index),), stats['in_use']) for index, stats in shard_stats
+        ]
+        yield 'punchly_db_shard_pool_waits_total', 'counter', 'Shard checkouts that had to wait', [
+            ((('shard', index),), stats['waits']) for index, stats in shard_stats
+        ]
+
+    pw = password_verifier.stats()
+    yield 'punchly_password_checks_total', 'counter', 'bcrypt checks completed', [((), pw['checks'])]
+    yield 'punchly_password_rejected_total', 'counter', 'bcrypt checks shed with 503', [((), pw['rejected'])]
+    yield 'punchly_password_queue_depth', 'gauge', 'bcrypt checks waiting for a worker', [((), pw['queue_depth'])]
+    yield 'punchly_password_hash_seconds_total', 'counter', 'Time spent in bcrypt', [((), pw['hash_seconds_total'])]
+
+    logs = logconfig.stats()
+    if logs['enabled']:
+        yield 'punchly_log_dropped_total', 'counter', 'Log records dropped because the queue was full', [((), logs['dropped'])]
+        yield 'punchly_log_queue_depth', 'gauge', 'Log records waiting for the writer thread', [((), logs['queue_depth'])]
+
+    live = dashboard_events.stats()
+    yield 'punchly_sse_subscribers', 'gauge', 'Open dashboard event streams', [((), live['subscribers'])]
+    yield 'punchly_sse_events_total', 'counter', 'Dashboard events queued for subscribers', [((), live['delivered'])]
+    yield 'punchly_sse_dropped_total', 'counter', 'Dashboard events dropped for slow subscribers', [((), live['dropped'])]
+    yield 'punchly_sse_rejected_total', 'counter', 'Dashboard streams refused at SSE_MAX_STREAMS', [((), live['rejected'])]
+
+    compression = response_compressor.stats()
+    yield 'punchly_compressed_responses_total', 'counter', 'Responses sent gzip/brotli encoded', [((), compression['compressed'])]
+    yield 'punchly_compressed_streams_total', 'counter', 'Streamed responses compressed incrementally', [((), compression['streamed'])]
+    yield 'punchly_compression_cache_hits_total', 'counter', 'Responses served from precompressed bytes', [((), compression['cache_hits'])]
+    yield 'punchly_compression_bytes_total', 'counter', 'Bytes before and after compression', [
+        ((('stage', 'in'),), compression['bytes_in']), ((('stage', 'out'),), compression['bytes_out'])
+    ]
+
+    catalog = company_catalog.stats()
+    yield 'punchly_catalog_hits_total', 'counter', 'Company catalog cache hits', [((), catalog['hits'])]
+    yield 'punchly_catalog_rebuilds_total', 'counter', 'Company catalog rebuilds', [((), catalog['rebuilds'])]
+
+    rollup = rollup_stage.stats()
+    yield 'punchly_rollup_events_total', 'counter', 'Scan events folded into rollups', [((), rollup['folded'])]
+    yield 'punchly_rollup_errors_total', 'counter', 'Rollup passes that failed', [((), rollup['errors'])]
+
+    if scan_writers:
+        writer = scan_writer_totals()
+        yield 'punchly_scan_writer_queue_depth', 'gauge', 'Scans waiting for the writer', [((), writer['queue_depth'])]
+        yield 'punchly_scan_writer_batches_total', 'counter', 'Group commits', [((), writer['batches'])]
+        yield 'punchly_scan_writer_scans_total', 'counter', 'Scans applied by the writer', [((), writer['scans'])]
+        yield 'punchly_scan_writer_failed_batches_total', 'counter', 'Group commits that failed', [((), writer['failed_batches'])]
+        yield 'punchly_scan_writer_timeouts_total', 'counter', 'Scans whose request stopped waiting for the writer', [((), writer['timeouts'])]
+
 def init_db():
-    """Initialize database with schema"""
-    conn = get_db()
-    with open('data/schema.sql', 'r') as f:
-        conn.executescript(f.read())
-    conn.commit()
-    conn.close()
+    """Initialize database with schema (and the shards, when SHARD_COUNT > 1)"""
+    shards.init_storage(DB_PATH)
     print("✅ Database initialized")
 
+def create_app():
+    """
+    Production entry point (gunicorn 'server:create_app()').
+    Requires a stable secret so sessions survive restarts and work across workers.
+    """
+    secret_key = load_secret_key()
+    if not secret_key:
+        raise RuntimeError('Set SECRET_KEY or SECRET_KEY_FILE before serving with multiple workers')
+    app.secret_key = secret_key
+    return app
+
+def after_fork():
+    """Reset per-process state in a freshly forked worker (called from gunicorn's post_fork)"""
+    for pool in [db_pool, read_pool, *shard_pools, *shard_read_pools]:
+        pool.reset_after_fork()
+    logconfig.after_fork()
+    dashboard_feed.after_fork()
+    rollup_stage.after_fork()
+    rollup_stage.ensure_running()
+    metrics.registry.after_fork()
+
 # Mobile Auth - Works with Supabase
 # Users authenticate via Supabase, then we link them by email in our DB
 
@@ -114,8 +483,6 @@ def sync_user():
             'phone': existing['phone'],
             'full_name': existing['full_name']
         }
-    finally:
-        conn.close()
     
     # Set session
     session.clear()
@@ -146,7 +513,6 @@ def mobile_register():
     # Check if user already exists
     existing = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
     if existing:
-        conn.close()
         return jsonify({'error': 'User already exists'}), 409
     
     # Hash the password
@@ -165,7 +531,6 @@ def mobile_register():
         'SELECT id, email, phone, full_name FROM users WHERE id = ?',
         (user_id,)
     ).fetchone()
-    conn.close()
     
     # Set session
     session.clear()
@@ -202,7 +567,6 @@ def mobile_login():
         'SELECT id, email, phone, full_name, password_hash FROM users WHERE email = ?',
         (email,)
     ).fetchone()
-    conn.close()
     
     if not user:
         return jsonify({'error': 'Invalid email or password'}), 401
@@ -211,7 +575,7 @@ def mobile_login():
     if not user['password_hash']:
         return jsonify({'error': 'Please register with a password'}), 401
     
-    if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+    if not password_verifier.check(password, user['password_hash']):
         return jsonify({'error': 'Invalid email or password'}), 401
 
     # Set mobile session
@@ -242,12 +606,11 @@ def mobile_get_session():
     if 'user_id' not in session:
         return jsonify({'authenticated': False})
     
-    conn = get_db()
+    conn = get_db(read=True)
     user = conn.execute(
         'SELECT id, email, phone, full_name FROM users WHERE id = ?',
         (session['user_id'],)
     ).fetchone()
-    conn.close()
     
     if not user:
         session.clear()
@@ -265,150 +628,54 @@ def mobile_get_session():
 
 @app.route('/api/mobile/user/cards', methods=['GET'])
 def mobile_user_cards():
-    """Get current user's loyalty cards"""
+    """
+    Get current user's loyalty cards.
+    Every response carries a cursor; ?since=<cursor> returns only cards changed since then
+    plus the ids of deleted cards. An unusable cursor gets a full wallet ("full": true).
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
     
     user_id = session['user_id']
+    conns = all_card_dbs(read=True)
+    since = request.args.get('since')
     
-    conn = get_db()
-    cards = conn.execute('''
-        SELECT 
-            r.id,
-            r.score,
-            r.target_score,
-            r.visits,
-            r.rewards_earned,
-            r.total_saved,
-            r.cash_per_redeem,
-            r.card_number,
-            r.last_scan_at,
-            r.created_at,
-            c.id as company_id,
-            c.name as company_name,
-            c.description as company_description,
-            c.program_description,
-            c.category,
-            c.color
-        FROM rewards r
-        JOIN companies c ON r.company_id = c.id
-        WHERE r.user_id = ? AND c.is_active = 1
-        ORDER BY r.updated_at DESC
-    ''', (user_id,)).fetchall()
-    conn.close()
-    
-    cards_data = []
-    for card in cards:
-        # Format memberSince from created_at
-        member_since = ''
-        if card['created_at']:
+    def build():
+        if since:
             try:
-                from datetime import datetime
-                dt = datetime.fromisoformat(card['created_at'].replace('Z', '+00:00'))
-                member_since = dt.strftime('%b %Y')
-            except:
-                member_since = card['created_at'][:7]  # fallback to YYYY-MM
-        
-        cards_data.append({
-            'id': card['id'],
-            'name': card['company_name'],
-            'punches': card['score'],  # score == punches
-            'maxPunches': card['target_score'],  # target_score == maxPunches
-            'color': card['color'] or '#6366F1',
-            'visits': card['visits'] or 0,
-            'rewards': card['rewards_earned'] or 0,
-            'saved': f"${card['total_saved']:.0f}" if card['total_saved'] else '$0',
-            'cash_per_redeem': card['cash_per_redeem'] or 5.0,
-            'memberSince': member_since,
-            'cardId': card['card_number'] or '',
-            'category': card['category'] or '',
-            'progress': (card['score'] / card['target_score']) * 100 if card['target_score'] > 0 else 0,
-            'last_scan_at': card['last_scan_at'],
-            'created_at': card['created_at'],
-            'company': {
-                'id': card['company_id'],
-                'name': card['company_name'],
-                'description': card['company_description'],
-                'programDescription': card['program_description'],
-                'category': card['category'],
-                'color': card['color']
-            }
-        })
+                cards_data, deleted, cursor = wallet.delta_sync(conns, user_id, since)
+                return json_response({'cards': cards_data, 'deleted': deleted, 'cursor': cursor, 'full': False})
+            except wallet.BadCursor:
+                pass
+        cards_data, cursor = wallet.full_sync(conns, user_id)
+        return json_response({'cards': cards_data, 'cursor': cursor, 'full': True})
     
-    return jsonify({'cards': cards_data})
+    return tagged(build, wallet.wallet_etag(conns, user_id, since), weak=True)
 
 @app.route('/api/mobile/user/cards/<int:card_id>', methods=['GET'])
 def mobile_user_card_by_id(card_id):
-    """Get a specific user's loyalty card by card ID"""
+    """Get a specific user's loyalty card by card ID (supports If-None-Match)"""
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
     
     user_id = session['user_id']
+    conn = card_db(card_id, read=True)
+    etag = conn and wallet.card_etag(conn, card_id, user_id)
     
-    conn = get_db()
-    card = conn.execute('''
-        SELECT 
-            r.id,
-            r.score,
-            r.target_score,
-            r.visits,
-            r.rewards_earned,
-            r.total_saved,
-            r.cash_per_redeem,
-            r.card_number,
-            r.last_scan_at,
-            r.created_at,
-            c.id as company_id,
-            c.name as company_name,
-            c.description as company_description,
-            c.program_description,
-            c.category,
-            c.color
-        FROM rewards r
-        JOIN companies c ON r.company_id = c.id
-        WHERE r.id = ? AND r.user_id = ? AND c.is_active = 1
-    ''', (card_id, user_id)).fetchone()
-    conn.close()
-    
-    if not card:
+    if not etag:
         return jsonify({'error': 'Card not found'}), 404
     
-    # Format memberSince from created_at
-    member_since = ''
-    if card['created_at']:
-        try:
-            dt = datetime.fromisoformat(card['created_at'].replace('Z', '+00:00'))
-            member_since = dt.strftime('%b %Y')
-        except:
-            member_since = card['created_at'][:7]
-    
-    card_data = {
-        'id': card['id'],
-        'name': card['company_name'],
-        'punches': card['score'],
-        'maxPunches': card['target_score'],
-        'color': card['color'] or '#6366F1',
-        'visits': card['visits'] or 0,
-        'rewards': card['rewards_earned'] or 0,
-        'saved': f"${card['total_saved']:.0f}" if card['total_saved'] else '$0',
-        'cash_per_redeem': card['cash_per_redeem'] or 5.0,
-        'memberSince': member_since,
-        'cardId': card['card_number'] or '',
-        'category': card['category'] or '',
-        'progress': (card['score'] / card['target_score']) * 100 if card['target_score'] > 0 else 0,
-        'last_scan_at': card['last_scan_at'],
-        'created_at': card['created_at'],
-        'company': {
-            'id': card['company_id'],
-            'name': card['company_name'],
-            'description': card['company_description'],
-            'programDescription': card['program_description'],
-            'category': card['category'],
-            'color': card['color']
-        }
-    }
+    def build():
+        card_data = fetch_card(
+            conn,
+            'WHERE r.id = ? AND r.user_id = ? AND c.is_active = 1',
+            (card_id, user_id)
+        )
+        if not card_data:
+            return jsonify({'error': 'Card not found'}), 404
+        return json_response({'card': card_data})
     
-    return jsonify({'card': card_data})
+    return tagged(build, etag)
 
 @app.route('/api/mobile/user/cards/<int:card_id>', methods=['PUT'])
 def update_user_card(card_id):
@@ -423,7 +690,9 @@ def update_user_card(card_id):
     if not isinstance(score_increment, (int, float)):
         return jsonify({'error': 'score_increment must be a number'}), 400
     
-    conn = get_db()
+    conn = card_db(card_id)
+    if conn is None:
+        return jsonify({'error': 'Card not found'}), 404
     
     # Verify card exists and belongs to user
     card = conn.execute('''
@@ -434,7 +703,6 @@ def update_user_card(card_id):
     ''', (card_id, user_id)).fetchone()
     
     if not card:
-        conn.close()
         return jsonify({'error': 'Card not found'}), 404
     
     # Update score
@@ -449,66 +717,9 @@ def update_user_card(card_id):
     conn.commit()
     
     # Fetch updated card
-    updated_card = conn.execute('''
-        SELECT 
-            r.id,
-            r.score,
-            r.target_score,
-            r.visits,
-            r.rewards_earned,
-            r.total_saved,
-            r.cash_per_redeem,
-            r.card_number,
-            r.last_scan_at,
-            r.created_at,
-            c.id as company_id,
-            c.name as company_name,
-            c.description as company_description,
-            c.program_description,
-            c.category,
-            c.color
-        FROM rewards r
-        JOIN companies c ON r.company_id = c.id
-        WHERE r.id = ?
-    ''', (card_id,)).fetchone()
-    conn.close()
-    
-    # Format memberSince from created_at
-    member_since = ''
-    if updated_card['created_at']:
-        try:
-            dt = datetime.fromisoformat(updated_card['created_at'].replace('Z', '+00:00'))
-            member_since = dt.strftime('%b %Y')
-        except:
-            member_since = updated_card['created_at'][:7]
-    
-    card_data = {
-        'id': updated_card['id'],
-        'name': updated_card['company_name'],
-        'punches': updated_card['score'],
-        'maxPunches': updated_card['target_score'],
-        'color': updated_card['color'] or '#6366F1',
-        'visits': updated_card['visits'] or 0,
-        'rewards': updated_card['rewards_earned'] or 0,
-        'saved': f"${updated_card['total_saved']:.0f}" if updated_card['total_saved'] else '$0',
-        'cash_per_redeem': updated_card['cash_per_redeem'] or 5.0,
-        'memberSince': member_since,
-        'cardId': updated_card['card_number'] or '',
-        'category': updated_card['category'] or '',
-        'progress': (updated_card['score'] / updated_card['target_score']) * 100 if updated_card['target_score'] > 0 else 0,
-        'last_scan_at': updated_card['last_scan_at'],
-        'created_at': updated_card['created_at'],
-        'company': {
-            'id': updated_card['company_id'],
-            'name': updated_card['company_name'],
-            'description': updated_card['company_description'],
-            'programDescription': updated_card['program_description'],
-            'category': updated_card['category'],
-            'color': updated_card['color']
-        }
-    }
+    card_data = fetch_card(conn, 'WHERE r.id = ?', (card_id,))
     
-    return jsonify({'card': card_data, 'message': f'Score updated by {score_increment}'})
+    return json_response({'card': card_data, 'message': f'Score updated by {score_increment}'})
 
 @app.route('/api/mobile/user/cards', methods=['POST'])
 def create_user_card():
@@ -523,17 +734,16 @@ def create_user_card():
     if not company_id:
         return jsonify({'error': 'company_id required'}), 400
     
-    conn = get_db()
+    conn = company_db(company_id)
     
     # Verify company exists and is active
     company = conn.execute('''
-        SELECT id, name, default_target_score, color, category, description, program_description
+        SELECT id, default_target_score
         FROM companies 
         WHERE id = ? AND is_active = 1
     ''', (company_id,)).fetchone()
     
     if not company:
-        conn.close()
         return jsonify({'error': 'Company not found or inactive'}), 404
     
     # Check if user already has a card for this company
@@ -543,7 +753,6 @@ def create_user_card():
     ''', (user_id, company_id)).fetchone()
     
     if existing:
-        conn.close()
         return jsonify({'error': 'Card already exists'}), 409
     
     # Create new card
@@ -564,36 +773,10 @@ def create_user_card():
     ))
     card_id = cursor.lastrowid
     conn.commit()
-    conn.close()
-    
-    # Format response
-    member_since = datetime.now().strftime('%b %Y')
-    
-    card_data = {
-        'id': card_id,
-        'name': company['name'],
-        'punches': 0,
-        'maxPunches': target_score,
-        'color': company['color'] or '#6366F1',
-        'visits': 0,
-        'rewards': 0,
-        'saved': '$0',
-        'cash_per_redeem': 5.0,
-        'memberSince': member_since,
-        'cardId': card_number,
-        'category': company['category'] or '',
-        'progress': 0,
-        'company': {
-            'id': company['id'],
-            'name': company['name'],
-            'description': company['description'],
-            'programDescription': company['program_description'],
-            'category': company['category'],
-            'color': company['color']
-        }
-    }
     
-    return jsonify({'card': card_data, 'message': 'Card added successfully'}), 201
+    card_data = fetch_card(conn, 'WHERE r.id = ?', (card_id,))
+    
+    return json_response({'card': card_data, 'message': 'Card added successfully'}, 201)
 
 @app.route('/api/mobile/user/cards/<int:card_id>', methods=['DELETE'])
 def delete_user_card(card_id):
@@ -603,7 +786,9 @@ def delete_user_card(card_id):
     
     user_id = session['user_id']
     
-    conn = get_db()
+    conn = card_db(card_id)
+    if conn is None:
+        return jsonify({'error': 'Card not found'}), 404
     
     # Verify card exists and belongs to user
     card = conn.execute('''
@@ -612,36 +797,26 @@ def delete_user_card(card_id):
     ''', (card_id, user_id)).fetchone()
     
     if not card:
-        conn.close()
         return jsonify({'error': 'Card not found'}), 404
     
     # Delete the card
     conn.execute('DELETE FROM rewards WHERE id = ?', (card_id,))
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True, 'message': 'Card deleted successfully'})
 
 @app.route('/api/mobile/companies', methods=['GET'])
 def mobile_companies():
-    """Get all active companies"""
-    conn = get_db()
-    companies = conn.execute(
-        'SELECT id, name, description, program_description, category, color, default_target_score FROM companies WHERE is_active = 1'
-    ).fetchall()
-    conn.close()
-    
-    companies_data = [{
-        'id': str(c['id']),  # Convert to string for consistency with frontend
-        'name': c['name'],
-        'category': c['category'] or '',
-        'color': c['color'] or '#6366F1',
-        'maxPunches': c['default_target_score'] or 10,
-        'companyDescription': c['description'] or '',
-        'programDescription': c['program_description'] or ''
-    } for c in companies]
-    
-    return jsonify({'companies': companies_data})
+    """Get all active companies (cached per catalog version, supports If-None-Match)"""
+    version, body, etag = company_catalog.get(get_db(read=True))
+    
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate, usually a 304
+    return response
 
 # Alias for programs (same as companies)
 @app.route('/api/mobile/programs', methods=['GET'])
@@ -656,107 +831,58 @@ def mobile_scan():
     Called when user scans NFC tag at a business
     """
     data = request.get_json(silent=True) or {}
-    print(f"DEBUG: Scan request data: {data}")
-    print(f"DEBUG: Current session: {dict(session)}")
-    
     user_id = data.get('user_id')
     company_id = data.get('company_id')
     
     # If company_id is not provided, try to get it from session (for admin dashboard)
     if not company_id and 'company_id' in session:
         company_id = session['company_id']
-        print(f"DEBUG: Using company_id from session: {company_id}")
     
-    print(f"DEBUG: user_id={user_id}, company_id={company_id}")
+    scan_log.debug('scan user_id=%s company_id=%s', user_id, company_id)
     
     if not user_id:
-        print("DEBUG: Missing user_id")
         return jsonify({'error': 'user_id required'}), 400
     if not company_id:
-        print("DEBUG: Missing company_id")
         return jsonify({'error': 'company_id required'}), 400
     
-    conn = get_db()
-    
-    # Verify user exists
-    user = conn.execute('SELECT id FROM users WHERE id = ?', (user_id,)).fetchone()
-    if not user:
-        conn.close()
-        return jsonify({'error': 'User not found'}), 404
-    
-    # Verify company exists and is active
-    company = conn.execute(
-        'SELECT id, name FROM companies WHERE id = ? AND is_active = 1',
-        (company_id,)
-    ).fetchone()
-    if not company:
-        conn.close()
-        return jsonify({'error': 'Company not found or inactive'}), 404
-    
-    # Get current reward status
-    existing = conn.execute(
-        'SELECT id, score, target_score FROM rewards WHERE user_id = ? AND company_id = ?',
-        (user_id, company_id)
-    ).fetchone()
+    try:
+        response = run_scan(user_id, company_id)
+    except ScanError as e:
+        return jsonify(e.body), e.status
     
-    now_iso = datetime.now().isoformat()
+    return jsonify(response)
+
+@app.route('/api/mobile/scan/batch', methods=['POST'])
+def mobile_scan_batch():
+    """
+    OFFLINE SYNC: replay queued NFC taps in one request
+    Body: { "user_id": <int>, "scans": [{ "idempotency_key": str, "company_id": int, "scanned_at": iso8601 }] }
+    Taps are applied in order in one transaction; keys already synced are skipped.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = session.get('user_id') or data.get('user_id')
+    scans = data.get('scans')
     
-    if existing:
-        previous_score = int(existing['score'] or 0)
-        target_score = int(existing['target_score'] or 10)
-        
-        # Check if already at max - don't increment past target
-        if previous_score >= target_score:
-            conn.close()
-            return jsonify({
-                'error': 'Card is full',
-                'message': f'Your card is already at maximum ({target_score}/{target_score}). Please redeem your reward first.',
-                'current_score': previous_score,
-                'target_score': target_score
-            }), 400
-        
-        new_score = min(previous_score + 1, target_score)  # Cap at target_score
-        
-        # Also increment visits counter
-        conn.execute(
-            'UPDATE rewards SET score = ?, visits = visits + 1, last_scan_at = ?, updated_at = ? WHERE id = ?',
-            (new_score, now_iso, now_iso, existing['id'])
-        )
-    else:
-        previous_score = 0
-        new_score = 1
-        target_score = 10
-        
-        conn.execute(
-            'INSERT INTO rewards (user_id, company_id, score, target_score, visits, last_scan_at) '
-            'VALUES (?, ?, ?, ?, ?, ?)',
-            (user_id, company_id, new_score, target_score, 1, now_iso)
-        )
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'scans must be a non-empty list'}), 400
+    if len(scans) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} scans per batch'}), 413
     
-    conn.commit()
-    conn.close()
+    if not get_db().execute('SELECT 1 FROM users WHERE id = ?', (user_id,)).fetchone():
+        return jsonify({'error': 'User not found'}), 404
     
-    reward_earned = new_score >= target_score
-    progress_percentage = int((new_score / target_score) * 100)
-    scans_until_reward = max(0, target_score - new_score)
+    results = run_batch(user_id, scans)
     
-    response = {
+    return json_response({
         'success': True,
         'user_id': user_id,
-        'company_id': company_id,
-        'company_name': company['name'],
-        'previous_score': previous_score,
-        'new_score': new_score,
-        'target_score': target_score,
-        'reward_earned': reward_earned,
-        'progress_percentage': progress_percentage,
-        'scans_until_reward': scans_until_reward
-    }
-    
-    if reward_earned:
-        response['reward_message'] = f"🎉 Congratulations! You earned a reward at {company['name']}!"
-    
-    return jsonify(response)
+        'applied': sum(1 for r in results if r['status'] == 200 and not r.get('duplicate')),
+        'duplicates': sum(1 for r in results if r.get('duplicate')),
+        'rejected': sum(1 for r in results if r['status'] != 200 and not r.get('duplicate')),
+        'results': results
+    })
 
 @app.route('/api/mobile/redeem', methods=['POST'])
 def mobile_redeem():
@@ -770,26 +896,25 @@ def mobile_redeem():
     if not card_id:
         return jsonify({'error': 'card_id required'}), 400
     
-    conn = get_db()
+    conn = card_db(card_id)
+    if conn is None:
+        return jsonify({'error': 'Card not found'}), 404
     
     # Get the reward card
     card = conn.execute(
-        'SELECT id, user_id, score, target_score, cash_per_redeem, rewards_earned, total_saved FROM rewards WHERE id = ?',
+        'SELECT id, user_id, company_id, score, target_score, cash_per_redeem, rewards_earned, total_saved FROM rewards WHERE id = ?',
         (card_id,)
     ).fetchone()
     
     if not card:
-        conn.close()
         return jsonify({'error': 'Card not found'}), 404
     
     # Verify ownership
     if card['user_id'] != session['user_id']:
-        conn.close()
         return jsonify({'error': 'Unauthorized'}), 403
     
     # Check if card is full
     if card['score'] < card['target_score']:
-        conn.close()
         return jsonify({'error': 'Card not full', 'message': 'You need to complete your punch card before redeeming'}), 400
     
     # Reset score, increment rewards_earned, and update total_saved
@@ -802,8 +927,8 @@ def mobile_redeem():
         'UPDATE rewards SET score = 0, rewards_earned = ?, total_saved = ?, updated_at = ? WHERE id = ?',
         (new_rewards_earned, new_total_saved, now_iso, card_id)
     )
+    events.record(conn, card['company_id'], card['user_id'], events.REDEEM, -card['score'])
     conn.commit()
-    conn.close()
     
     return jsonify({
         'success': True,
@@ -819,105 +944,45 @@ def admin_scan():
     """Admin dashboard scan endpoint - requires admin authentication"""
     # Check admin authentication
     if 'company_id' not in session:
-        print("DEBUG: Admin scan - no session found")
         return jsonify({'error': 'Unauthorized'}), 401
     
     company_id = session['company_id']
     data = request.get_json(silent=True) or {}
     user_id = data.get('user_id')
     
-    print(f"DEBUG: Admin scan - user_id={user_id}, company_id={company_id}")
+    scan_log.debug('admin scan user_id=%s company_id=%s', user_id, company_id)
     
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     
-    # Use the same logic as mobile_scan but with admin session
-    conn = get_db()
-    
-    # Check if user exists
-    user = conn.execute('SELECT id FROM users WHERE id = ?', (user_id,)).fetchone()
-    if not user:
-        conn.close()
-        return jsonify({'error': 'User not found'}), 404
-    
-    # Check if company exists
-    company = conn.execute('SELECT id, name FROM companies WHERE id = ?', (company_id,)).fetchone()
-    if not company:
-        conn.close()
-        return jsonify({'error': 'Company not found'}), 404
-    
-    # Check if user already has a reward record for this company
-    now_iso = datetime.now().isoformat()
-    existing = conn.execute(
-        'SELECT id, score, target_score FROM rewards WHERE user_id = ? AND company_id = ?',
-        (user_id, company_id)
-    ).fetchone()
-    
-    if existing:
-        previous_score = existing['score']
-        new_score = previous_score + 1
-        target_score = existing['target_score']
-        
-        conn.execute(
-            'UPDATE rewards SET score = ?, last_scan_at = ?, updated_at = ? WHERE id = ?',
-            (new_score, now_iso, now_iso, existing['id'])
-        )
-    else:
-        previous_score = 0
-        new_score = 1
-        target_score = 10
-        
-        conn.execute(
-            'INSERT INTO rewards (user_id, company_id, score, target_score, last_scan_at) '
-            'VALUES (?, ?, ?, ?, ?)',
-            (user_id, company_id, new_score, target_score, now_iso)
-        )
-    
-    conn.commit()
-    conn.close()
-    
-    reward_earned = new_score >= target_score
-    progress_percentage = int((new_score / target_score) * 100)
-    scans_until_reward = max(0, target_score - new_score)
-    
-    response = {
-        'success': True,
-        'user_id': user_id,
-        'company_id': company_id,
-        'company_name': company['name'],
-        'previous_score': previous_score,
-        'new_score': new_score,
-        'target_score': target_score,
-        'reward_earned': reward_earned,
-        'progress_percentage': progress_percentage,
-        'scans_until_reward': scans_until_reward
-    }
-    
-    if reward_earned:
-        response['reward_message'] = f"🎉 Congratulations! You earned a reward at {company['name']}!"
+    # Same engine as mobile_scan, with the company taken from the admin session
+    try:
+        response = run_scan(user_id, company_id)
+    except ScanError as e:
+        return jsonify(e.body), e.status
     
     return jsonify(response)
 
 @app.route('/api/mobile/rewards/<int:user_id>', methods=['GET'])
 def mobile_user_rewards(user_id):
     """Get all rewards for a user"""
-    conn = get_db()
-    
-    rewards = conn.execute('''
-        SELECT 
-            r.company_id,
-            c.name as company_name,
-            r.score,
-            r.target_score,
-            r.last_scan_at,
-            r.created_at
-        FROM rewards r
-        JOIN companies c ON r.company_id = c.id
-        WHERE r.user_id = ?
-        ORDER BY r.last_scan_at DESC
-    ''', (user_id,)).fetchall()
-    
-    conn.close()
+    rewards = []
+    for conn in all_card_dbs(read=True):
+        rewards += conn.execute('''
+            SELECT 
+                r.company_id,
+                c.name as company_name,
+                r.score,
+                r.target_score,
+                r.last_scan_at,
+                r.created_at
+            FROM rewards r
+            JOIN companies c ON r.company_id = c.id
+            WHERE r.user_id = ?
+            ORDER BY r.last_scan_at DESC
+        ''', (user_id,)).fetchall()
+    if shards.ENABLED:
+        rewards.sort(key=lambda r: r['last_scan_at'] or '', reverse=True)  # merge the shards' orderings
     
     return jsonify({
         'user_id': user_id,
@@ -949,39 +1014,27 @@ def login():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
 
-    import os
-    print("LOGIN hitting DB:", os.path.abspath(DB_PATH))
-    print("LOGIN attempt email:", repr(email))
-
     conn = get_db()
-    conn.row_factory = sqlite3.Row
     company = conn.execute(
         'SELECT id, name, description, login_email, password_hash '
         'FROM companies WHERE login_email = ? COLLATE NOCASE',
         (email,)
     ).fetchone()
-    conn.close()
-
-    # SAFE debug print
-    if company:
-        ph = company['password_hash']
-        d = dict(company)
-        d['password_hash'] = (ph[:10] + '…') if isinstance(ph, str) else '<non-str>'
-        print("LOGIN found:", d)
-    else:
-        print("LOGIN no row found for:", repr(email))
 
     if not company:
+        auth_log.info('admin login failed: unknown email')
         return jsonify({'error': 'Invalid email or password'}), 401
 
     try:
-        ok = bcrypt.checkpw(password.encode('utf-8'),
-                            company['password_hash'].encode('utf-8'))
+        ok = password_verifier.check(password, company['password_hash'])
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
-        print("bcrypt error:", e)
+        auth_log.error('bcrypt error for company_id=%s: %s', company['id'], e)
         return jsonify({'error': 'Server password check error'}), 500
 
     if not ok:
+        auth_log.info('admin login failed: bad password for company_id=%s', company['id'])
         return jsonify({'error': 'Invalid email or password'}), 401
 
     session.clear()
@@ -989,7 +1042,7 @@ def login():
     session['company_name'] = company['name']
     session.permanent = True
 
-    print("LOGIN OK → session:", dict(session))
+    auth_log.info('admin login ok company_id=%s', company['id'])
     return jsonify({
         'success': True,
         'company': {
@@ -1038,61 +1091,78 @@ def get_stats():
         return auth_error
     
     company_id = session['company_id']
-    conn = get_db()
-    
-    total_users = conn.execute(
-        'SELECT COUNT(DISTINCT user_id) as count FROM rewards WHERE company_id = ?',
-        (company_id,)
-    ).fetchone()['count']
-    
-    total_scans = conn.execute(
-        'SELECT COALESCE(SUM(score), 0) as total FROM rewards WHERE company_id = ?',
-        (company_id,)
-    ).fetchone()['total']
-    
-    close_to_reward = conn.execute(
-        'SELECT COUNT(*) as count FROM rewards WHERE company_id = ? AND score >= target_score * 0.8',
-        (company_id,)
-    ).fetchone()['count']
+    conn = company_db(company_id, read=True)
     
-    conn.close()
+    return jsonify(read_company_stats(conn, company_id))
+
+@app.route('/api/stream', methods=['GET'])
+def dashboard_stream():
+    """
+    Server-Sent Events for the logged-in company's dashboard.
+    ready: subscribed, fetch the full state now
+    change: {user_id, customer, stats} after any reward write, from any worker, within SSE_POLL_SECONDS
+            (customer is null once the card is deleted)
+    resync: events were dropped, fetch everything again
+    The stream ends after SSE_MAX_SECONDS and EventSource reconnects; 503 when this worker
+    already holds SSE_MAX_STREAMS streams.
+    """
+    auth_error = require_auth()
+    if auth_error:
+        return auth_error
     
-    return jsonify({
-        'total_users': total_users,
-        'total_scans': total_scans,
-        'close_to_reward': close_to_reward
-    })
+    # Subscribe before the feed takes its starting position, and both before ready is sent
+    sub = dashboard_events.subscribe(int(session['company_id']))
+    try:
+        dashboard_feed.ensure_running()
+        response = app.response_class(dashboard_events.stream(sub), mimetype='text/event-stream')
+        response.call_on_close(lambda: dashboard_events.unsubscribe(sub))
+    except BaseException:
+        dashboard_events.unsubscribe(sub)  # no response will ever close it, so free the slot now
+        raise
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # keep proxies from buffering events
+    return response
 
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    """Get all users with rewards at logged-in company"""
+    """
+    Get users with rewards at logged-in company, highest score first.
+    ?limit=N[&cursor=...] returns one keyset page: {"users": [...], "next_cursor": ...}
+    ?format=ndjson streams one customer per line.
+    Without either, the full list is streamed as a single JSON array.
+    """
     auth_error = require_auth()
     if auth_error:
         return auth_error
     
     company_id = session['company_id']
-    conn = get_db()
-    
-    query = '''
-        SELECT 
-            u.id,
-            u.email,
-            u.phone,
-            u.full_name,
-            r.score,
-            r.target_score,
-            r.last_scan_at,
-            r.created_at
-        FROM rewards r
-        JOIN users u ON r.user_id = u.id
-        WHERE r.company_id = ?
-        ORDER BY r.score DESC, r.last_scan_at DESC
-    '''
-    
-    users = conn.execute(query, (company_id,)).fetchall()
-    conn.close()
+    conn = company_db(company_id, read=True)
     
-    return jsonify([dict(u) for u in users])
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            users, next_cursor = fetch_page(
+                conn, company_id,
+                request.args.get('limit', PAGE_DEFAULT),
+                request.args.get('cursor')
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid limit or cursor'}), 400
+        return json_response({'users': users, 'next_cursor': next_cursor})
+    
+    if request.args.get('format') == 'ndjson':
+        def generate_lines():
+            for user in iter_customers(conn, company_id):
+                yield fastjson.dumps(user) + b'\n'
+        return app.response_class(stream_with_context(generate_lines()), mimetype='application/x-ndjson')
+    
+    def generate_array():
+        yield b'['
+        separator = b''
+        for user in iter_customers(conn, company_id):
+            yield separator + fastjson.dumps(user)
+            separator = b','
+        yield b']'
+    return app.response_class(stream_with_context(generate_array()), mimetype='application/json')
 
 # REMOVED: Duplicate of /api/rewards/increment - use that instead for admin scans
 
@@ -1110,35 +1180,31 @@ def reset_reward():
         return jsonify({'error': 'user_id required'}), 400
 
     now = datetime.now().isoformat()
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
+    conn = company_db(company_id)
 
     # Fetch current score and target
     row = conn.execute(
-        'SELECT id, score, target_score FROM rewards WHERE user_id=? AND company_id=?',
+        'SELECT id, user_id, score, target_score FROM rewards WHERE user_id=? AND company_id=?',
         (user_id, company_id)
     ).fetchone()
     if not row:
-        conn.close()
         return jsonify({'error': 'reward not found for user/company'}), 404
 
     # Normalize types defensively
     try:
         score = int(row['score'] or 0)
     except Exception:
-        print("CANNOT READ SCORE")
+        scan_log.warning('unreadable score on reward %s', row['id'])
         score = 0
     try:
         target = int(row['target_score'] or 0)
     except Exception:
-        print("CANNOT READ TARGET SCORE")
+        scan_log.warning('unreadable target_score on reward %s', row['id'])
         target = 0
 
     # Fallback if target is missing/invalid
-    # print(target)
     if target <= 0:
         target = 10  # sane default
-    # print(target)
 
     new_score = max(score - target, 0)
 
@@ -1147,8 +1213,8 @@ def reset_reward():
         'UPDATE rewards SET score=?, updated_at=? WHERE id=?',
         (new_score, now, row['id'])
     )
+    events.record(conn, company_id, row['user_id'], events.RESET, new_score - score)
     conn.commit()
-    conn.close()
 
     return jsonify({'success': True, 'score': new_score, 'target_score': target})
 
@@ -1178,13 +1244,11 @@ def increment_reward():
     company_id = session['company_id']
     now_iso = datetime.now().isoformat()
 
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
+    conn = company_db(company_id)
 
     # Ensure user exists (optional; remove if you allow free-form user_id)
     user_row = conn.execute('SELECT id FROM users WHERE id=?', (user_id,)).fetchone()
     if not user_row:
-        conn.close()
         return jsonify({'error': 'user not found'}), 404
 
     # Read current values (if any) for return payload
@@ -1208,6 +1272,7 @@ def increment_reward():
         ''',
         (user_id, company_id, amount, target, now_iso, now_iso)
     )
+    events.record(conn, company_id, user_row['id'], events.PUNCH, amount)
 
     # Fetch updated values
     after = conn.execute(
@@ -1215,7 +1280,6 @@ def increment_reward():
         (user_id, company_id)
     ).fetchone()
     conn.commit()
-    conn.close()
 
     new_score = int(after['score'])
     target = int(after['target_score'] or 10)
@@ -1232,6 +1296,134 @@ def increment_reward():
         'reward_earned': reward_earned
     })
 
+# ============================================
+# Analytics
+# ============================================
+
+@app.route('/api/analytics/scans', methods=['GET'])
+def scan_analytics():
+    """
+    Punch/redeem/reset counts over time for the logged-in company.
+    Query: granularity=hour|day (default hour), since/until as unix seconds
+    (default: last 7 days hourly, last 90 days daily).
+    """
+    auth_error = require_auth()
+    if auth_error:
+        return auth_error
+    
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    bucket_size = events.HOUR if granularity == 'hour' else events.DAY
+    
+    now = int(time.time())
+    default_span = 7 * events.DAY if granularity == 'hour' else 90 * events.DAY
+    try:
+        until = int(request.args.get('until', now + 1))
+        since = int(request.args.get('since', until - default_span))
+    except ValueError:
+        return jsonify({'error': 'since/until must be unix seconds'}), 400
+    
+    # Buckets are rolled up in the background; started here too for servers without post_fork
+    rollup_stage.ensure_running()
+    company_id = session['company_id']
+    rows = events.buckets(company_db(company_id, read=True), company_id, bucket_size, since, until)
+    return json_response({
+        'granularity': granularity,
+        'since': since,
+        'until': until,
+        'buckets': [{
+            'start': datetime.fromtimestamp(r[0], timezone.utc).isoformat(),
+            'punches': r[1],
+            'redeems': r[2],
+            'resets': r[3]
+        } for r in rows]
+    })
+
+# ============================================
+# Diagnostics
+# ============================================
+
+# Pool sizes, queue depths and per-route traffic are for operators only: the debug
+# endpoints are off unless DEBUG_ENDPOINTS=1 (and then need a dashboard login), and
+# /metrics is off unless METRICS_TOKEN is set (scrapers send it as a bearer token)
+DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS', '0') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+def require_debug():
+    """404 unless debug endpoints are enabled, then the same check as the dashboard"""
+    if not DEBUG_ENDPOINTS:
+        return jsonify({'error': 'Not found'}), 404
+    return require_auth()
+
+@app.route('/api/debug/db-pool', methods=['GET'])
+def db_pool_stats():
+    """Connection pool metrics for this worker (checkouts, waits, age)"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    stats = {**db_pool.stats(), 'readers': read_pool.stats()}
+    if shards.ENABLED:
+        stats['shards'] = [pool.stats() for pool in shard_pools]
+        stats['shard_readers'] = [pool.stats() for pool in shard_read_pools]
+    return jsonify(stats)
+
+@app.route('/api/debug/catalog', methods=['GET'])
+def catalog_stats():
+    """Company catalog cache metrics"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    return jsonify(company_catalog.stats())
+
+@app.route('/api/debug/compression', methods=['GET'])
+def compression_stats():
+    """Response compression metrics (bytes saved, precompressed cache hits)"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    return jsonify(response_compressor.stats())
+
+@app.route('/api/debug/passwords', methods=['GET'])
+def password_pool_stats():
+    """bcrypt pool metrics (hash latency, queue depth, rejections)"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    return jsonify(password_verifier.stats())
+
+@app.route('/api/debug/logging', methods=['GET'])
+def logging_stats():
+    """Log queue depth and records dropped under load"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    return jsonify(logconfig.stats())
+
+@app.route('/api/debug/scan-writer', methods=['GET'])
+def scan_writer_stats():
+    """Group-commit writer metrics (batch sizes, queue depth)"""
+    debug_error = require_debug()
+    if debug_error:
+        return debug_error
+    if not scan_writers:
+        return jsonify({'mode': SCAN_INGEST_MODE})
+    if len(scan_writers) == 1:
+        return jsonify({'mode': SCAN_INGEST_MODE, **scan_writers[0].stats()})
+    return jsonify({'mode': SCAN_INGEST_MODE, 'shards': [writer.stats() for writer in scan_writers]})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (every worker's metrics; needs METRICS_TOKEN)"""
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(supplied, f'Bearer {METRICS_TOKEN}'.encode('utf-8')):
+        response = jsonify({'error': 'Unauthorized'})
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response, 401
+    return app.response_class(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 # ============================================
 # Static file serving
 # ============================================
@@ -1253,8 +1445,7 @@ def serve_static(path):
 # ============================================
 
 if __name__ == '__main__':
-    # Initialize DB if it doesn't exist
-    if not os.path.exists(DB_PATH):
-        init_db()
+    # Create the DB if needed; the schema is idempotent so this also adds new tables to existing DBs
+    init_db()
     print("Starting app")
     app.run(debug=True, host="0.0.0.0", port=5001)
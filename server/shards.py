@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Optional company-sharded storage for write scaling (SHARD_COUNT > 1)
+
+Everything a tap writes (rewards, company_stats, scan_events and its
+rollups, scan_receipts, the wallet sync clock and tombstones) lives in one
+of N shard files picked by company_id; users and companies stay in the directory database (DB_PATH).
+Shard connections ATTACH the directory read-only, so the existing queries
+still resolve users/companies unqualified, while BEGIN IMMEDIATE only takes
+the shard's write lock. Taps at merchants on different shards commit in
+parallel on separate WAL files.
+
+Card ids carry their shard in the high bits (shard << 40, still exact as a
+JSON number), so a card id alone routes a request. The shard count is
+fixed once cards have been written.
+
+Environment:
+    SHARD_COUNT   number of shard files (default 0 = single database)
+    SHARD_DIR     where shard-<n>.db files live (default data/shards)
+
+Usage: python3 shards.py [--migrate] [--fresh] [--db PATH]
+"""
+import argparse
+import glob
+import os
+import sqlite3
+
+from db import add_missing_columns, apply_schema, open_connection
+
+DB_PATH = 'data/rewards.db'
+SCHEMA_PATH = 'data/schema.sql'
+
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0))
+SHARD_DIR = os.environ.get('SHARD_DIR', 'data/shards')
+ENABLED = SHARD_COUNT > 1
+
+CARD_ID_SHIFT = 40
+MAX_SHARDS = 1 << (53 - CARD_ID_SHIFT)  # card ids must stay below 2**53 for JavaScript clients
+
+# Only ever read from the directory; dropped from shard files after the shared schema runs
+DIRECTORY_TABLES = ('catalog_version', 'companies', 'users')
+
+# Card-side tables moved out of the directory by migrate()
+SHARDED_TABLES = ('rewards', 'company_stats', 'scan_events', 'scan_rollups', 'scan_receipts', 'card_tombstones')
+
+
+def shard_path(index):
+    return os.path.join(SHARD_DIR, f'shard-{index}.db')
+
+
+def all_paths(db_path=DB_PATH):
+    """Every database holding cards and scan events: the shards, or db_path when not sharding"""
+    if not ENABLED:
+        return [db_path]
+    return [shard_path(index) for index in range(SHARD_COUNT)]
+
+
+def company_shard(company_id):
+    """Shard holding a company's cards (ids that aren't integers go to shard 0 and fail there)"""
+    try:
+        return int(company_id) % SHARD_COUNT
+    except (TypeError, ValueError):
+        return 0
+
+
+def card_shard(card_id):
+    """Shard a card id was issued by, or None if no shard could have issued it"""
+    try:
+        index = int(card_id) >> CARD_ID_SHIFT
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index < SHARD_COUNT else None
+
+
+def group_by_shard(items):
+    """Positions of batch scan items grouped by the shard of their company_id"""
+    groups = {}
+    for position, item in enumerate(items):
+        company_id = item.get('company_id') if isinstance(item, dict) else None
+        groups.setdefault(company_shard(company_id), []).append(position)
+    return groups
+
+
+def apply_shard_schema(path, index, schema_path=SCHEMA_PATH):
+    """Card-side half of schema.sql in a shard file, with rewards ids starting at index << 40"""
+    conn = open_connection(path)
+    add_missing_columns(conn)
+    with open(schema_path, 'r') as f:
+        conn.executescript(f.read())
+    conn.execute('PRAGMA foreign_keys = OFF')
+    for table in DIRECTORY_TABLES:
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'rewards', ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'rewards')",
+        (index << CARD_ID_SHIFT,)
+    )
+    conn.commit()
+    conn.close()
+
+
+def init_shards(schema_path=SCHEMA_PATH):
+    """Create or update every shard file"""
+    if SHARD_COUNT > MAX_SHARDS:
+        raise RuntimeError(f'SHARD_COUNT must be at most {MAX_SHARDS}')
+    existing = glob.glob(os.path.join(SHARD_DIR, 'shard-*.db'))
+    if existing and len(existing) != SHARD_COUNT:
+        raise RuntimeError(
+            f'{SHARD_DIR} holds {len(existing)} shard(s) but SHARD_COUNT={SHARD_COUNT}; '
+            'cards are routed by company_id % SHARD_COUNT, so the count cannot change'
+        )
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    for index in range(SHARD_COUNT):
+        apply_shard_schema(shard_path(index), index, schema_path)
+
+
+def stranded_cards(db_path=DB_PATH):
+    """True if the directory database still holds cards (sharding enabled before migrating)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT EXISTS (SELECT 1 FROM rewards)').fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def init_storage(db_path=DB_PATH, schema_path=SCHEMA_PATH):
+    """Bring the directory database (and every shard, when sharding) up to date"""
+    apply_schema(db_path, schema_path)
+    if not ENABLED:
+        return
+    init_shards(schema_path)
+    if stranded_cards(db_path):
+        print(f"⚠️  {db_path} still holds cards; run `python3 shards.py --migrate` to move them into the shards")
+
+
+def migrate(db_path=DB_PATH):
+    """
+    Move card data from the directory database into the (empty) shards.
+    Card ids become id + (shard << 40). Returns the number of cards moved.
+    """
+    for index in range(SHARD_COUNT):
+        conn = sqlite3.connect(shard_path(index))
+        try:
+            if conn.execute('SELECT EXISTS (SELECT 1 FROM rewards)').fetchone()[0]:
+                raise RuntimeError(f'{shard_path(index)} already holds cards; migrate into fresh shards (--fresh)')
+        finally:
+            conn.close()
+
+    moved = 0
+    for index in range(SHARD_COUNT):
+        conn = sqlite3.connect(shard_path(index))
+        conn.execute('ATTACH DATABASE ? AS legacy', (db_path,))
+        columns = [row[1] for row in conn.execute('PRAGMA main.table_info(rewards)') if row[1] != 'id']
+        column_list = ', '.join(columns)
+        where = {'count': SHARD_COUNT, 'index': index}
+        conn.execute('BEGIN')
+        # company_stats is rebuilt by the shard's insert trigger as the cards land
+        moved += conn.execute(
+            f'INSERT INTO main.rewards (id, {column_list}) '
+            f'SELECT id + :offset, {column_list} FROM legacy.rewards '
+            'WHERE company_id % :count = :index',
+            {**where, 'offset': index << CARD_ID_SHIFT}
+        ).rowcount
+        conn.execute(
+            'INSERT INTO main.scan_events (company_id, user_id, kind, delta, ts) '
+            'SELECT company_id, user_id, kind, delta, ts FROM legacy.scan_events '
+            'WHERE company_id % :count = :index ORDER BY id',
+            where
+        )
+        # Receipts don't record a company, so every shard gets a copy
+        conn.execute('INSERT OR IGNORE INTO main.scan_receipts SELECT * FROM legacy.scan_receipts')
+        conn.commit()
+        conn.close()
+
+    conn = sqlite3.connect(db_path)
+    for table in SHARDED_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute('UPDATE rollup_watermark SET last_event_id = 0 WHERE id = 1')
+    conn.commit()
+    conn.close()
+    return moved
+
+
+def remove_shards():
+    """Delete every shard file (server must be stopped)"""
+    for path in glob.glob(os.path.join(SHARD_DIR, 'shard-*.db*')):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create (and optionally fill) the company shards')
+    parser.add_argument('--db', default=DB_PATH, help='directory database')
+    parser.add_argument('--migrate', action='store_true', help="move the directory's cards into the shards")
+    parser.add_argument('--fresh', action='store_true', help='delete existing shard files first (server must be stopped)')
+    args = parser.parse_args()
+
+    if not ENABLED:
+        print("❌ Set SHARD_COUNT to 2 or more")
+        raise SystemExit(1)
+    if args.fresh:
+        remove_shards()
+        print(f"🗑️  Removed shard files in {SHARD_DIR}")
+    apply_schema(args.db)
+    init_shards()
+    if args.migrate:
+        print(f"✅ Moved {migrate(args.db)} card(s) into {SHARD_COUNT} shards")
+    else:
+        print(f"✅ {SHARD_COUNT} shards ready in {SHARD_DIR}")
+        if stranded_cards(args.db):
+            print(f"⚠️  {args.db} still holds cards; rerun with --migrate to move them")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Cached template databases for fast resets
+
+Replaying schema.sql and seed.sql on every reset is most of the cost of a
+test or demo reset. Instead, build the database once into
+data/templates/<name>-<hash>.db, where the hash covers the schema and seed
+files, and restore it with the sqlite3 backup API (or a plain file copy).
+The template is rebuilt automatically when either file changes.
+
+Usage: python3 snapshot.py [--seed] [--copy] [--db PATH]
+"""
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+DB_PATH = 'data/rewards.db'
+SCHEMA_PATH = 'data/schema.sql'
+SEED_PATH = 'data/seed.sql'
+TEMPLATE_DIR = 'data/templates'
+
+
+def template_key(*paths):
+    """Short content hash of the files a template is built from"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def ensure_template(schema_path=SCHEMA_PATH, seed_path=None):
+    """Path to an up-to-date template, building it if the schema/seed hash changed"""
+    name = 'seeded' if seed_path else 'schema'
+    sources = [schema_path] + ([seed_path] if seed_path else [])
+    path = os.path.join(TEMPLATE_DIR, f'{name}-{template_key(*sources)}.db')
+    if os.path.exists(path):
+        return path, False
+
+    os.makedirs(TEMPLATE_DIR, exist_ok=True)
+    building = f'{path}.{os.getpid()}.tmp'
+    conn = sqlite3.connect(building)
+    for source in sources:
+        with open(source, 'r') as f:
+            conn.executescript(f.read())
+    conn.commit()
+    # Rollback journal + VACUUM so the template is one compact, self-contained file
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.execute('VACUUM')
+    conn.close()
+    os.replace(building, path)
+
+    # Drop templates built from older versions of the same files
+    for stale in glob.glob(os.path.join(TEMPLATE_DIR, f'{name}-*.db')):
+        if stale != path:
+            os.remove(stale)
+    return path, True
+
+
+def _remove_sidecars(db_path):
+    for ext in ('-wal', '-shm', '-journal'):
+        if os.path.exists(db_path + ext):
+            os.remove(db_path + ext)
+
+
+def restore(template_path, db_path=DB_PATH, method='backup'):
+    """
+    Overwrite db_path with the template.
+    'backup' copies pages through SQLite's locks, so it is safe while the server has
+    the database open; 'copy' replaces the file and needs the server stopped.
+    """
+    if method == 'copy':
+        _remove_sidecars(db_path)
+        shutil.copyfile(template_path, db_path)
+        return
+
+    source = sqlite3.connect(f'file:{template_path}?mode=ro', uri=True)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+        target.execute('PRAGMA journal_mode=WAL')
+    finally:
+        target.close()
+        source.close()
+
+
+def reset_from_template(db_path=DB_PATH, seed=True, method='backup'):
+    """Restore db_path from the (cached) schema or schema+seed template; returns seconds taken"""
+    started = time.perf_counter()
+    template, built = ensure_template(SCHEMA_PATH, SEED_PATH if seed else None)
+    if built:
+        print(f"🏗️  Built template {template}")
+    restore(template, db_path, method)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reset the database from a cached template')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--seed', action='store_true', help='include seed.sql data')
+    parser.add_argument('--copy', action='store_true', help='file copy instead of the backup API (server must be stopped)')
+    args = parser.parse_args()
+
+    elapsed = reset_from_template(args.db, seed=args.seed, method='copy' if args.copy else 'backup')
+    print(f"✅ {args.db} restored from template in {elapsed * 1000:.1f} ms")
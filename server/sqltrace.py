@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-request SQL tracing (SQL_TRACE=1)
+
+With tracing on, pooled connections are opened as TracedConnection, whose
+execute/executemany/executescript/commit/rollback and cursor fetches are
+timed with the wall clock. A statement's time is its execute (including
+any wait for a lock) plus every fetch of its rows, so Python work between
+fetches isn't charged to SQL. With tracing off connections are plain
+sqlite3.Connection and cost nothing extra.
+
+Statements slower than SQL_SLOW_MS are logged with their EXPLAIN QUERY PLAN
+once the request is done with the connection. The log shows the statement
+as written (placeholders, not bound values) and its parameter count, so
+customer data never reaches the log.
+"""
+import logging
+import os
+import sqlite3
+import time
+
+ENABLED = os.environ.get('SQL_TRACE', '0') == '1'
+SLOW_MS = float(os.environ.get('SQL_SLOW_MS', 50))
+
+TRANSACTION_VERBS = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+SCRIPT = '-- executescript'  # recorded in place of a multi-statement script
+
+log = logging.getLogger('punchly.sql')
+
+
+class Statement:
+    """Wall time of one traced statement"""
+    __slots__ = ('sql', 'params', 'seconds')
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params  # placeholder shape only: a count, or the names of named parameters
+        self.seconds = 0.0
+
+
+def _param_shape(parameters):
+    if isinstance(parameters, dict):
+        return tuple(parameters)
+    try:
+        return len(parameters)
+    except TypeError:
+        return 0
+
+
+class RequestTrace:
+    """Statement count and SQL time for one request"""
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.slow = []  # Statements over SQL_SLOW_MS, collected by finish()
+        self._timed = []
+
+    def start(self, sql, parameters=()):
+        self.statements += 1
+        statement = Statement(sql, _param_shape(parameters))
+        self._timed.append(statement)
+        return statement
+
+    def add(self, statement, seconds):
+        statement.seconds += seconds
+        self.seconds += seconds
+
+    def finish(self):
+        """Collect the statements over SQL_SLOW_MS (again later for statements run since)"""
+        self.slow += [s for s in self._timed if s.seconds * 1000 >= SLOW_MS]
+        self._timed = []
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that charges its execute and fetch time to the connection's trace"""
+
+    _statement = None
+
+    def _timed(self, method, *args):
+        trace = self.connection.trace
+        if trace is None or self._statement is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            trace.add(self._statement, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        trace = self.connection.trace
+        if trace is None:
+            return super().execute(sql, parameters)
+        self._statement = trace.start(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = self.connection.trace
+        if trace is None:
+            return super().executemany(sql, seq_of_parameters)
+        self._statement = trace.start(sql)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        trace = self.connection.trace
+        if trace is None:
+            return super().executescript(sql_script)
+        self._statement = trace.start(SCRIPT)
+        return self._timed(super().executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed(super().fetchmany)
+        return self._timed(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose statements are timed while a request trace is attached"""
+
+    trace = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def _timed_end(self, verb, method):
+        # COMMIT can wait on fsync and the checkpoint; count it like a statement
+        trace = self.trace
+        if trace is None:
+            return method()
+        statement = trace.start(verb)
+        started = time.perf_counter()
+        try:
+            return method()
+        finally:
+            trace.add(statement, time.perf_counter() - started)
+
+    def commit(self):
+        return self._timed_end('COMMIT', super().commit)
+
+    def rollback(self):
+        return self._timed_end('ROLLBACK', super().rollback)
+
+
+# db.open_connection uses this, so untraced servers keep plain connections
+CONNECTION_FACTORY = TracedConnection if ENABLED else sqlite3.Connection
+
+
+def attach(conn, trace=None):
+    """Start tracing a connection for the current request (into trace, when it already has one)"""
+    trace = trace or RequestTrace()
+    if isinstance(conn, TracedConnection):
+        conn.trace = trace
+    return trace
+
+
+def unhook(conn):
+    """Stop tracing a connection"""
+    if isinstance(conn, TracedConnection):
+        conn.trace = None
+
+
+def detach(conn, trace, route):
+    """Unhook the connection and log slow statements with their query plans"""
+    unhook(conn)
+    trace.finish()
+    for statement in trace.slow:
+        params = statement.params
+        count = len(params) if isinstance(params, tuple) else params
+        log.warning('slow query (%.1f ms) on %s: %s [%d parameter(s)]\n%s', statement.seconds * 1000, route,
+                    statement.sql, count, explain(conn, statement))
+
+
+def explain(conn, statement):
+    """EXPLAIN QUERY PLAN for a traced statement (parameters bound as NULL), as indented text"""
+    sql = statement.sql
+    if sql.lstrip().upper().startswith(TRANSACTION_VERBS) or sql == SCRIPT:
+        return '  (no plan for transaction control or scripts)'
+    params = statement.params
+    bound = dict.fromkeys(params) if isinstance(params, tuple) else (None,) * params
+    try:
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, bound).fetchall()
+    except Exception as e:
+        return f'  (no plan: {e})'
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def server_timing(trace, total_seconds=None):
+    """Server-Timing header value for a finished trace"""
+    parts = [f'db;dur={trace.seconds * 1000:.2f};desc="{trace.statements} queries"']
+    if total_seconds is not None:
+        parts.append(f'app;dur={total_seconds * 1000:.2f}')
+    return ', '.join(parts)
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Production server: one gunicorn worker per core (see gunicorn.conf.py)
+# Needs a stable session key shared by every worker, e.g.
+#   python3 -c "import secrets; print(secrets.token_hex(32))" > data/.secret_key
+cd "$(dirname "$0")"
+
+if [ -z "$SECRET_KEY" ] && [ -z "$SECRET_KEY_FILE" ]; then
+    if [ -f data/.secret_key ]; then
+        export SECRET_KEY_FILE=data/.secret_key
+    else
+        echo "❌ Set SECRET_KEY or SECRET_KEY_FILE (or create data/.secret_key)"
+        exit 1
+    fi
+fi
+
+exec gunicorn -c gunicorn.conf.py 'server:create_app()'
@@ -3,6 +3,10 @@ let currentCompanyId = null;
 let currentCompanyName = '';
 let allUsers = [];
 
+// Live updates over Server-Sent Events (/api/stream); our own actions still refetch
+let loading = false;
+let pendingChanges = [];
+
 // Initialize - check auth and load company
 async function init() {
   try {
@@ -22,8 +26,10 @@ async function init() {
     currentCompanyName = data.company.name;
     document.getElementById('companyName').textContent = `🎯 ${data.company.name}`;
 
-    // Load data
+    // Load now: the stream may be refused (503) or unsupported. Its ready
+    // event refetches on every (re)connect, so no change is missed in between.
     loadData();
+    connectStream();
   } catch (err) {
     console.error('Auth error:', err);
     location.replace('/');
@@ -51,30 +57,81 @@ window.logout = async () => {
 //     });
 // };
 
+// Subscribe to this company's change stream (if the browser can)
+function connectStream() {
+  if (!window.EventSource) return;
+
+  const source = new EventSource('/api/stream', { withCredentials: true });
+
+  // Sent on every (re)connect: fetch the full state once, then apply deltas
+  source.addEventListener('ready', () => loadData());
+
+  source.addEventListener('change', (e) => {
+    const change = JSON.parse(e.data);
+    if (loading) pendingChanges.push(change);
+    else applyChange(change);
+  });
+
+  // Events were dropped on the server: start over from a full fetch
+  source.addEventListener('resync', () => loadData());
+
+  source.onerror = () => {
+    // EventSource retries dropped connections on its own, but gives up on an
+    // error response (503 when the server has too many open dashboards)
+    if (source.readyState === EventSource.CLOSED) {
+      setTimeout(connectStream, 30000);
+    }
+  };
+}
+
+function renderStats(stats) {
+  document.getElementById('totalUsers').textContent = stats.total_users;
+  document.getElementById('totalScans').textContent = stats.total_scans;
+  document.getElementById('closeToReward').textContent = stats.close_to_reward;
+}
+
+// Same order as /api/users: highest score, then most recent scan
+function compareUsers(a, b) {
+  return (b.score - a.score) || (b.last_scan_at || '').localeCompare(a.last_scan_at || '');
+}
+
+// Apply one streamed delta: replace (or drop) the customer's row and update the stats
+function applyChange(change) {
+  renderStats(change.stats);
+  allUsers = allUsers.filter(u => u.id !== change.user_id);
+  if (change.customer) {
+    allUsers.push(change.customer);
+    allUsers.sort(compareUsers);
+  }
+  renderUsers(filterUsers(allUsers));
+}
+
 // Load stats and users for current company
 async function loadData() {
   if (!currentCompanyId) return;
   
+  loading = true;
   try {
     // Load stats
     const statsRes = await fetch('/api/stats', {
       credentials: 'include'
     });
-    const stats = await statsRes.json();
-    
-    document.getElementById('totalUsers').textContent = stats.total_users;
-    document.getElementById('totalScans').textContent = stats.total_scans;
-    document.getElementById('closeToReward').textContent = stats.close_to_reward;
+    renderStats(await statsRes.json());
     
     // Load users
     const usersRes = await fetch('/api/users', {
       credentials: 'include'
     });
     allUsers = await usersRes.json();
-    
-    renderUsers(allUsers);
   } catch (err) {
     console.error('Error loading data:', err);
+  } finally {
+    // Changes that streamed in while fetching are newer than (or already in) what we got
+    loading = false;
+    const changes = pendingChanges;
+    pendingChanges = [];
+    changes.forEach(applyChange);
+    renderUsers(filterUsers(allUsers));
   }
 }
 
@@ -123,14 +180,18 @@ function renderUsers(users) {
 }
 
 // Search users
-document.getElementById('searchUsers').addEventListener('input', (e) => {
-  const query = e.target.value.toLowerCase();
-  const filtered = allUsers.filter(u => 
+function filterUsers(users) {
+  const query = document.getElementById('searchUsers').value.toLowerCase();
+  if (!query) return users;
+  return users.filter(u => 
     (u.full_name || '').toLowerCase().includes(query) ||
     u.email.toLowerCase().includes(query) ||
     (u.phone || '').toLowerCase().includes(query)
   );
-  renderUsers(filtered);
+}
+
+document.getElementById('searchUsers').addEventListener('input', () => {
+  renderUsers(filterUsers(allUsers));
 });
 
 // Add a scan (increment punch count)
@@ -0,0 +1,40 @@
+"""Operator endpoints stay closed unless explicitly enabled"""
+import pytest
+
+import server
+
+DEBUG_PATHS = [
+    '/api/debug/db-pool',
+    '/api/debug/catalog',
+    '/api/debug/compression',
+    '/api/debug/passwords',
+    '/api/debug/logging',
+    '/api/debug/scan-writer',
+]
+
+
+@pytest.mark.parametrize('path', DEBUG_PATHS)
+def test_debug_endpoints_are_off_by_default(admin, path):
+    assert admin.get(path).status_code == 404
+
+
+@pytest.mark.parametrize('path', DEBUG_PATHS)
+def test_enabled_debug_endpoints_need_a_dashboard_login(monkeypatch, client, path):
+    monkeypatch.setattr(server, 'DEBUG_ENDPOINTS', True)
+    assert client.get(path).status_code == 401
+    client.post('/api/auth/login', json={'email': 'greatdane@example.com', 'password': 'password123'})
+    assert client.get(path).status_code == 200
+
+
+def test_metrics_are_off_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_need_the_bearer_token(monkeypatch, client):
+    monkeypatch.setattr(server, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert b'punchly_http_requests_total' in response.data
@@ -0,0 +1,82 @@
+"""Conditional GETs: the cached company catalog and per-user card resources"""
+
+
+def rename_company(db, company_id, name):
+    db.execute('UPDATE companies SET name = ? WHERE id = ?', (name, company_id))
+    db.commit()
+
+
+def test_catalog_revalidates_with_304(client):
+    first = client.get('/api/mobile/companies')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/mobile/companies', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+
+def test_catalog_etag_moves_with_the_catalog(client, db):
+    etag = client.get('/api/mobile/companies').headers['ETag']
+    rename_company(db, 1, 'Great Dane Roasters')
+
+    changed = client.get('/api/mobile/companies', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert 'Great Dane Roasters' in [c['name'] for c in changed.get_json()['companies']]
+
+
+def test_catalog_ignores_writes_it_doesnt_show(client, db):
+    etag = client.get('/api/mobile/companies').headers['ETag']
+    db.execute("UPDATE companies SET password_hash = 'x' WHERE id = 1")
+    db.commit()
+    assert client.get('/api/mobile/companies', headers={'If-None-Match': etag}).status_code == 304
+
+
+def card_id(db, user_id, company_id):
+    return db.execute(
+        'SELECT id FROM rewards WHERE user_id = ? AND company_id = ?', (user_id, company_id)
+    ).fetchone()[0]
+
+
+def test_card_revalidates_until_it_is_punched(mobile, client, db):
+    user = mobile(1)
+    url = f'/api/mobile/user/cards/{card_id(db, 1, 1)}'
+    first = user.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert user.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    punched = user.get(url, headers={'If-None-Match': etag})
+    assert punched.status_code == 200
+    assert punched.headers['ETag'] != etag
+    assert punched.get_json()['card']['punches'] == first.get_json()['card']['punches'] + 1
+
+
+def test_card_etag_follows_its_company(mobile, db):
+    user = mobile(1)
+    url = f'/api/mobile/user/cards/{card_id(db, 1, 1)}'
+    etag = user.get(url).headers['ETag']
+    rename_company(db, 1, 'Great Dane Roasters')
+    assert user.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_card_of_another_user_is_not_found(mobile, db):
+    assert mobile(2).get(f'/api/mobile/user/cards/{card_id(db, 1, 1)}').status_code == 404
+
+
+def test_wallet_revalidates_until_a_card_changes(mobile, client):
+    user = mobile(1)
+    etag = user.get('/api/mobile/user/cards').headers['ETag']
+    assert user.get('/api/mobile/user/cards', headers={'If-None-Match': etag}).status_code == 304
+
+    # Someone else's punch doesn't touch Alice's wallet
+    client.post('/api/mobile/scan', json={'user_id': 2, 'company_id': 1})
+    assert user.get('/api/mobile/user/cards', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    assert user.get('/api/mobile/user/cards', headers={'If-None-Match': etag}).status_code == 200
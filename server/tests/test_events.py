@@ -0,0 +1,52 @@
+"""Scan event ledger and its hourly/daily rollups (/api/analytics/scans)"""
+import time
+
+import events
+from conftest import DB_PATH
+
+
+def totals(admin, granularity):
+    response = admin.get(f'/api/analytics/scans?granularity={granularity}')
+    assert response.status_code == 200
+    buckets = response.get_json()['buckets']
+    return tuple(sum(b[kind] for b in buckets) for kind in ('punches', 'redeems', 'resets'))
+
+
+def test_background_stage_feeds_read_only_analytics(admin, client, db):
+    events.roll_up_all(db)  # whatever the seed left behind
+    baseline = totals(admin, 'hour')
+    client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1})  # 9 -> 10
+    admin.post('/api/rewards/reset', json={'user_id': 3})
+
+    # The GET only reads; new events wait for the rollup stage
+    assert totals(admin, 'hour') == baseline
+    assert events.pending(db)
+
+    stage = events.RollupStage([DB_PATH], interval=3600)  # one pass, then it sleeps
+    stage.ensure_running()
+    while stage.stats()['passes'] == 0:
+        time.sleep(0.01)
+    assert stage.stats()['folded'] == 3
+    assert stage.stats()['errors'] == 0
+
+    expected = (baseline[0] + 2, baseline[1], baseline[2] + 1)
+    assert totals(admin, 'hour') == expected
+    assert totals(admin, 'day') == expected
+    assert not events.pending(db)
+
+
+def test_roll_up_moves_the_watermark_in_batches(client, db):
+    events.roll_up(db)  # whatever the seed left behind
+    assert events.roll_up(db) == 0
+
+    for _ in range(3):
+        client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    assert events.roll_up(db, batch=2) == 2
+    assert events.pending(db)
+    assert events.roll_up(db, batch=2) == 1
+    assert not events.pending(db)
+
+
+def test_bad_granularity_is_rejected(admin):
+    assert admin.get('/api/analytics/scans?granularity=week').status_code == 400
@@ -0,0 +1,86 @@
+"""Per-thread metric shards and the Prometheus /metrics endpoint"""
+import os
+import threading
+
+import metrics
+import server
+from metrics import Registry
+
+
+def sample(text, line_prefix):
+    """Value of the first exposition line starting with line_prefix, or 0"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_shards_of_finished_threads_are_kept():
+    registry = Registry()
+    registry.counter('hits_total', 'Hits')
+    registry.histogram('wait_seconds', 'Waits', (0.1, 1.0))
+
+    def work():
+        for value in (0.05, 0.5, 5.0):
+            registry.inc('hits_total')
+            registry.observe('wait_seconds', (), value)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.render()
+    assert sample(text, 'hits_total') == 12
+    assert sample(text, 'wait_seconds_bucket{le="0.1"}') == 4
+    assert sample(text, 'wait_seconds_bucket{le="1"}') == 8
+    assert sample(text, 'wait_seconds_bucket{le="+Inf"}') == 12
+    assert sample(text, 'wait_seconds_count') == 12
+    assert registry.render() == text  # folding retired shards doesn't double count
+
+
+def test_exited_threads_are_folded_without_a_scrape():
+    registry = Registry()
+    registry.counter('hits_total', 'Hits')
+    for _ in range(200):  # one thread per request, like the dev server
+        thread = threading.Thread(target=registry.inc, args=('hits_total',))
+        thread.start()
+        thread.join()
+
+    assert len(registry._shards) <= 1
+    assert sample(registry.render(), 'hits_total') == 200
+
+
+def test_requests_are_counted_by_route_template(monkeypatch, mobile, client):
+    monkeypatch.setattr(server, 'METRICS_TOKEN', 's3cret')
+    scrape = {'Authorization': 'Bearer s3cret'}
+    line = 'punchly_http_requests_total{route="/api/mobile/user/cards/<int:card_id>",method="GET",status="404"}'
+    before = sample(client.get('/metrics', headers=scrape).data.decode(), line)
+    user = mobile(1)
+    for card_id in (999998, 999999):
+        assert user.get(f'/api/mobile/user/cards/{card_id}').status_code == 404
+
+    response = client.get('/metrics', headers=scrape)
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert sample(response.data.decode(), line) == before + 2
+
+
+def test_workers_share_totals_through_the_metrics_dir(tmp_path):
+    def worker(hits, busy):
+        registry = Registry(str(tmp_path))
+        registry.counter('hits_total', 'Hits')
+        registry.gauge('busy', 'Busy')
+        registry.inc('hits_total', value=hits)
+        registry.inc('busy', value=busy)
+        registry.write_snapshot()
+        return registry
+
+    worker(3, 1)
+    text = worker(4, 2).render()
+    assert (sample(text, 'hits_total'), sample(text, 'busy')) == (7, 3)
+
+    # Both "workers" exit: counters survive in retired.json, gauges go
+    metrics.retire_worker(str(tmp_path), os.getpid())
+    text = worker(1, 0).render()
+    assert (sample(text, 'hits_total'), sample(text, 'busy')) == (8, 0)
@@ -0,0 +1,40 @@
+"""bcrypt checks on the bounded password pool"""
+import threading
+import time
+
+import server
+from conftest import ADMIN_EMAIL, ADMIN_PASSWORD
+from passwords import RETRY_AFTER, PasswordVerifier
+
+
+def login(client, password):
+    return client.post('/api/auth/login', json={'email': ADMIN_EMAIL, 'password': password})
+
+
+def test_login_checks_the_password(client):
+    assert login(client, 'wrong').status_code == 401
+    assert login(client, ADMIN_PASSWORD).status_code == 200
+    assert server.password_verifier.stats()['checks'] >= 2
+
+
+def test_saturated_pool_answers_503_at_once(monkeypatch, client, db):
+    verifier = PasswordVerifier(workers=1, max_in_flight=1)
+    monkeypatch.setattr(server, 'password_verifier', verifier)
+    password_hash = db.execute('SELECT password_hash FROM companies WHERE id = 1').fetchone()[0]
+    busy = threading.Thread(target=verifier.check, args=(ADMIN_PASSWORD, password_hash))
+    busy.start()
+    while verifier.stats()['in_flight'] == 0:
+        time.sleep(0.001)
+
+    response = login(client, ADMIN_PASSWORD)
+    busy.join()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(RETRY_AFTER)
+    assert verifier.stats()['rejected'] == 1
+    assert login(client, ADMIN_PASSWORD).status_code == 200
+
+
+def test_in_flight_cap_bounds_the_hash_workers():
+    verifier = PasswordVerifier(workers=8, max_in_flight=2)
+    assert verifier.workers == 2
+    assert verifier.stats()['max_in_flight'] == 2
@@ -0,0 +1,59 @@
+"""Per-worker connection pool behind get_db()"""
+import sqlite3
+
+import pytest
+
+import db as dbmod
+import server
+from conftest import DB_PATH
+
+
+def test_requests_hand_their_connection_back(client, db):
+    db.execute('UPDATE rewards SET target_score = 1000 WHERE user_id = 1 AND company_id = 2')
+    db.commit()
+    before = server.db_pool.stats()['checkouts']
+    for _ in range(5):
+        assert client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 2}).status_code == 200
+    stats = server.db_pool.stats()
+    assert stats['checkouts'] - before == 5
+    assert stats['in_use'] == 0
+    assert stats['open'] <= stats['size']
+
+
+def test_exhausted_pool_answers_503(monkeypatch, client):
+    pool = dbmod.ConnectionPool(DB_PATH, size=1, timeout=0.05)
+    monkeypatch.setattr(server, 'db_pool', pool)
+    held = pool.acquire()
+    try:
+        response = client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 2})
+    finally:
+        pool.release(held)
+    assert response.status_code == 503
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_release_rolls_back_and_reuses_the_connection(db):
+    pool = dbmod.ConnectionPool(DB_PATH, size=2)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO users (email, full_name) VALUES ('stray@example.com', 'Stray')")
+    pool.release(conn)
+    assert db.execute("SELECT COUNT(*) FROM users WHERE email = 'stray@example.com'").fetchone()[0] == 0
+    assert pool.acquire() is conn
+
+
+def test_old_connections_are_recycled():
+    pool = dbmod.ConnectionPool(DB_PATH, size=1)
+    first = pool.acquire()
+    pool.release(first)
+    pool.max_age = 0
+    assert pool.acquire() is not first
+    assert pool.stats()['recycled'] == 1
+
+
+def test_read_pool_connections_refuse_writes():
+    conn = server.read_pool.acquire()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO users (email, full_name) VALUES ('stray@example.com', 'Stray')")
+    finally:
+        server.read_pool.release(conn)
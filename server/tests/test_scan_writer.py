@@ -0,0 +1,114 @@
+"""Write-behind group commit (SCAN_INGEST_MODE=batched)"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import db as dbmod
+import server
+from conftest import DB_PATH
+from scan_writer import ScanWriter
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """Route the app's scans through a batched writer for one test"""
+    writer = ScanWriter(DB_PATH)
+    monkeypatch.setattr(server, 'scan_writers', [writer])
+    yield writer
+    writer.close()
+
+
+def score(db, user_id, company_id):
+    return db.execute(
+        'SELECT score FROM rewards WHERE user_id = ? AND company_id = ?', (user_id, company_id)
+    ).fetchone()[0]
+
+
+def test_batched_scans_answer_like_direct_ones(writer, client):
+    # Charlie is at 9/10 at Great Dane (seed.sql)
+    body = client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1}).get_json()
+    assert (body['new_score'], body['reward_earned']) == (10, True)
+
+    full = client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1})
+    assert (full.status_code, full.get_json()['error']) == (400, 'Card is full')
+    assert client.post('/api/mobile/scan', json={'user_id': 999, 'company_id': 1}).status_code == 404
+    assert writer.stats()['scans'] == 3
+
+
+def test_concurrent_scans_share_commits(writer, db):
+    db.execute('UPDATE rewards SET target_score = 1000 WHERE user_id = 1 AND company_id = 1')
+    db.commit()
+    before = score(db, 1, 1)
+    threads, per_thread = 8, 25
+
+    def tap():
+        for _ in range(per_thread):
+            writer.submit(1, 1).result(timeout=5)
+
+    workers = [threading.Thread(target=tap) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert score(db, 1, 1) == before + threads * per_thread
+    stats = writer.stats()
+    assert stats['scans'] == threads * per_thread
+    assert stats['failed_batches'] == 0
+
+
+def test_unopenable_database_fails_the_batch_then_recovers(monkeypatch, client, tmp_path):
+    writer = ScanWriter(str(tmp_path / 'missing' / 'rewards.db'))
+    monkeypatch.setattr(server, 'scan_writers', [writer])
+    response = client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert writer.stats()['writer_errors'] == 1
+
+    writer.path = DB_PATH  # the next batch reconnects
+    assert client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1}).status_code == 200
+    writer.close()
+
+
+def test_timed_out_scan_is_withdrawn_from_the_queue(monkeypatch, client, db):
+    writer = ScanWriter(DB_PATH, policy='eager')  # batches close as soon as the queue is empty
+    monkeypatch.setattr(server, 'scan_writers', [writer])
+    monkeypatch.setattr(dbmod, 'BUSY_TIMEOUT_MS', 5000)
+    monkeypatch.setattr(server, 'RESULT_TIMEOUT', 0.2)
+    before = score(db, 2, 1)
+    blocker = sqlite3.connect(DB_PATH)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        stuck = writer.submit(1, 1)  # the writer waits on the lock with this batch
+        while writer.stats()['queue_depth']:
+            time.sleep(0.001)
+        response = client.post('/api/mobile/scan', json={'user_id': 2, 'company_id': 1})
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    assert response.status_code == 503
+    assert stuck.result(timeout=5)['new_score'] > 0
+    assert writer.stats()['timeouts'] == 1
+    assert score(db, 2, 1) == before  # the client's retry is the only punch
+    writer.close()
+
+
+def test_batch_failing_inside_its_transaction_answers_503(monkeypatch, writer, client, db):
+    monkeypatch.setattr(dbmod, 'BUSY_TIMEOUT_MS', 50)  # the writer gives up on the lock quickly
+    before = score(db, 1, 1)
+    blocker = sqlite3.connect(DB_PATH)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        response = client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert writer.stats()['failed_batches'] == 1
+    assert score(db, 1, 1) == before
+    assert client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1}).status_code == 200
@@ -0,0 +1,126 @@
+"""Scan engine: one-statement punches, the reward threshold, and offline batch idempotency"""
+import threading
+
+import pytest
+
+import scans
+from conftest import DB_PATH
+from db import open_connection
+
+
+def card(conn, user_id, company_id):
+    return conn.execute(
+        'SELECT score, target_score, visits FROM rewards WHERE user_id = ? AND company_id = ?',
+        (user_id, company_id)
+    ).fetchone()
+
+
+def test_concurrent_punches_are_never_lost(db):
+    db.execute('UPDATE rewards SET target_score = 1000 WHERE user_id = 1 AND company_id = 1')
+    db.commit()
+    before = card(db, 1, 1)
+    threads, per_thread = 8, 25
+    errors = []
+
+    def tap():
+        conn = open_connection(DB_PATH)
+        try:
+            for _ in range(per_thread):
+                scans.apply_scan(conn, 1, 1)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=tap) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    after = card(db, 1, 1)
+    assert after['score'] == before['score'] + threads * per_thread
+    assert after['visits'] == before['visits'] + threads * per_thread
+    punches = db.execute(
+        'SELECT COUNT(*) FROM scan_events WHERE user_id = 1 AND company_id = 1 AND kind = 1'
+    ).fetchone()[0]
+    assert punches == threads * per_thread
+
+
+def test_punch_reaching_target_earns_reward_then_card_is_full(client, db):
+    # Charlie is at 9/10 at Great Dane (seed.sql)
+    response = client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['previous_score'], body['new_score'], body['target_score']) == (9, 10, 10)
+    assert body['reward_earned'] is True
+    assert body['scans_until_reward'] == 0
+    assert 'reward_message' in body
+
+    full = client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1})
+    assert full.status_code == 400
+    assert full.get_json()['error'] == 'Card is full'
+    assert card(db, 3, 1)['score'] == 10
+
+
+def test_first_punch_creates_card_with_company_target(client, db):
+    # Alice has no card at Fujiya yet
+    assert card(db, 1, 3) is None
+    body = client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 3}).get_json()
+    assert body['new_score'] == 1
+    assert card(db, 1, 3)['target_score'] == body['target_score']
+
+
+@pytest.mark.parametrize('payload, status', [
+    ({'user_id': 999, 'company_id': 1}, 404),
+    ({'user_id': 1, 'company_id': 999}, 404),
+    ({'company_id': 1}, 400),
+])
+def test_rejected_scans(client, payload, status):
+    assert client.post('/api/mobile/scan', json=payload).status_code == status
+
+
+def test_dashboard_scan_uses_the_same_engine(admin, db):
+    # Bob's Great Dane card (seed.sql); the company comes from the session
+    before = card(db, 2, 1)
+    body = admin.post('/api/rewards/scan', json={'user_id': 2}).get_json()
+    assert body['new_score'] == before['score'] + 1
+    assert card(db, 2, 1)['visits'] == before['visits'] + 1
+    assert admin.post('/api/rewards/scan', json={'user_id': 999}).status_code == 404
+
+
+def test_batch_replay_is_idempotent(mobile, db):
+    user = mobile(1)
+    taps = [
+        {'idempotency_key': 'tap-1', 'company_id': 1},
+        {'idempotency_key': 'tap-2', 'company_id': 1},
+    ]
+    first = user.post('/api/mobile/scan/batch', json={'scans': taps}).get_json()
+    assert (first['applied'], first['duplicates'], first['rejected']) == (2, 0, 0)
+    score = card(db, 1, 1)['score']
+
+    # The app retries after a dropped response: same keys, nothing punched twice
+    replay = user.post('/api/mobile/scan/batch', json={'scans': taps}).get_json()
+    assert (replay['applied'], replay['duplicates']) == (0, 2)
+    assert [r['result'] for r in replay['results']] == [r['result'] for r in first['results']]
+    assert card(db, 1, 1)['score'] == score
+    assert db.execute('SELECT COUNT(*) FROM scan_receipts WHERE user_id = 1').fetchone()[0] == 2
+
+
+def test_batch_repeated_key_within_one_request(mobile, db):
+    before = card(db, 1, 1)['score']
+    body = mobile(1).post('/api/mobile/scan/batch', json={'scans': [
+        {'idempotency_key': 'same', 'company_id': 1},
+        {'idempotency_key': 'same', 'company_id': 1},
+        {'company_id': 1},
+    ]}).get_json()
+    assert [r['status'] for r in body['results']] == [200, 200, 400]
+    assert [r.get('duplicate') for r in body['results'][:2]] == [False, True]
+    assert card(db, 1, 1)['score'] == before + 1
+
+
+def test_batch_keys_are_per_user(mobile, db):
+    taps = {'scans': [{'idempotency_key': 'shared', 'company_id': 1}]}
+    assert mobile(1).post('/api/mobile/scan/batch', json=taps).get_json()['applied'] == 1
+    assert mobile(2).post('/api/mobile/scan/batch', json=taps).get_json()['applied'] == 1
@@ -0,0 +1,77 @@
+"""Company shards: card ids carry their shard in the high bits"""
+import os
+import sqlite3
+
+import pytest
+
+import server
+import shards
+from conftest import DB_PATH, SERVER_DIR
+from db import ConnectionPool
+from reconcile_stats import reconcile
+
+SCHEMA_PATH = os.path.join(SERVER_DIR, 'data', 'schema.sql')
+COUNT = 3
+
+
+@pytest.fixture
+def sharded(monkeypatch, tmp_path):
+    """Run the app on three shards migrated from the seeded database"""
+    monkeypatch.setattr(shards, 'SHARD_COUNT', COUNT)
+    monkeypatch.setattr(shards, 'ENABLED', True)
+    monkeypatch.setattr(shards, 'SHARD_DIR', str(tmp_path))
+    shards.init_shards(SCHEMA_PATH)
+    moved = shards.migrate(DB_PATH)
+    paths = [shards.shard_path(index) for index in range(COUNT)]
+    monkeypatch.setattr(server, 'shard_pools', [ConnectionPool(path, attach=DB_PATH) for path in paths])
+    monkeypatch.setattr(server, 'shard_read_pools', [
+        ConnectionPool(path, attach=DB_PATH, query_only=True) for path in paths
+    ])
+    return moved
+
+
+def shard_conn(index):
+    conn = sqlite3.connect(shards.shard_path(index))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def test_card_shard_decodes_the_high_bits(monkeypatch):
+    monkeypatch.setattr(shards, 'SHARD_COUNT', COUNT)
+    assert shards.card_shard(7) == 0
+    assert shards.card_shard((2 << shards.CARD_ID_SHIFT) + 7) == 2
+    assert shards.card_shard(COUNT << shards.CARD_ID_SHIFT) is None
+    assert shards.card_shard(-1) is None
+    assert shards.card_shard('abc') is None
+    assert shards.company_shard(5) == 5 % COUNT
+
+
+def test_migrated_cards_are_renumbered_into_their_shard(sharded, db):
+    assert db.execute('SELECT COUNT(*) FROM rewards').fetchone()[0] == 0
+    total = 0
+    for index in range(COUNT):
+        conn = shard_conn(index)
+        for card in conn.execute('SELECT id, company_id FROM rewards'):
+            assert card['company_id'] % COUNT == index
+            assert shards.card_shard(card['id']) == index
+            total += 1
+        assert reconcile(conn, fix=False) == []
+        conn.close()
+    assert total == sharded
+
+
+def test_cards_route_by_id_alone(sharded, mobile, client):
+    user = mobile(3)
+    card = user.post('/api/mobile/user/cards', json={'company_id': 2}).get_json()['card']
+    assert shards.card_shard(card['id']) == 2
+    assert user.get(f"/api/mobile/user/cards/{card['id']}").status_code == 200
+
+    local_id = card['id'] & ((1 << shards.CARD_ID_SHIFT) - 1)
+    assert user.get(f'/api/mobile/user/cards/{local_id + (1 << shards.CARD_ID_SHIFT)}').status_code == 404
+    assert user.get(f'/api/mobile/user/cards/{local_id + (COUNT << shards.CARD_ID_SHIFT)}').status_code == 404
+
+    body = client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 2}).get_json()
+    assert body['new_score'] == card['punches'] + 1
+    conn = shard_conn(2)
+    assert conn.execute('SELECT score FROM rewards WHERE id = ?', (card['id'],)).fetchone()[0] == body['new_score']
+    conn.close()
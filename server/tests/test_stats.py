@@ -0,0 +1,60 @@
+"""Trigger-maintained company_stats behind /api/stats"""
+import subprocess
+import sys
+
+from conftest import DB_PATH, SERVER_DIR
+from reconcile_stats import reconcile
+
+
+def stats(admin):
+    response = admin.get('/api/stats')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_triggers_keep_the_rollup_exact(admin, mobile, client, db):
+    before = stats(admin)
+
+    client.post('/api/mobile/scan', json={'user_id': 1, 'company_id': 1})   # punch
+    client.post('/api/mobile/scan', json={'user_id': 3, 'company_id': 1})   # 9 -> 10 reaches the target
+    admin.post('/api/rewards/increment', json={'user_id': 4, 'amount': 8})   # new card at 8/10
+    admin.post('/api/rewards/reset', json={'user_id': 3})
+    created = mobile(1).post('/api/mobile/user/cards', json={'company_id': 3}).get_json()['card']
+    mobile(1).delete(f"/api/mobile/user/cards/{created['id']}")
+    db.execute('DELETE FROM rewards WHERE user_id = 2 AND company_id = 1')    # out-of-band SQL
+    db.commit()
+
+    assert reconcile(db, fix=False) == []
+    after = stats(admin)
+    assert after != before
+    assert after['total_scans'] == db.execute(
+        'SELECT SUM(score) FROM rewards WHERE company_id = 1'
+    ).fetchone()[0]
+
+
+def test_check_reports_drift_and_fix_repairs_it(admin, db):
+    expected = stats(admin)['total_scans']
+    db.execute('UPDATE company_stats SET total_scans = total_scans + 5 WHERE company_id = 1')
+    db.commit()
+
+    assert reconcile(db, fix=False) == [(1, 'total_scans', expected + 5, expected)]
+    assert stats(admin)['total_scans'] == expected + 5  # --check leaves it alone
+
+    assert reconcile(db) == [(1, 'total_scans', expected + 5, expected)]
+    assert reconcile(db, fix=False) == []
+    assert stats(admin)['total_scans'] == expected
+
+
+def test_check_command_exit_status(db):
+    def check():
+        return subprocess.run(
+            [sys.executable, 'reconcile_stats.py', '--check', '--db', DB_PATH],
+            cwd=SERVER_DIR, capture_output=True, text=True
+        )
+
+    assert check().returncode == 0
+    db.execute('UPDATE company_stats SET close_to_reward = close_to_reward + 1 WHERE company_id = 2')
+    db.commit()
+    result = check()
+    assert result.returncode == 1
+    assert 'company 2: close_to_reward' in result.stdout
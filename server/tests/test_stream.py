@@ -0,0 +1,22 @@
+"""Dashboard Server-Sent Events (/api/stream) stream slots"""
+import pytest
+
+import server
+
+
+def test_full_worker_answers_503(monkeypatch, admin):
+    monkeypatch.setattr(server.dashboard_events, 'max_streams', 0)
+    response = admin.get('/api/stream')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+
+
+def test_failed_setup_gives_the_slot_back(monkeypatch, admin):
+    def broken():
+        raise RuntimeError('feed thread could not start')
+
+    monkeypatch.setattr(server.dashboard_feed, 'ensure_running', broken)
+    monkeypatch.setattr(server.app, 'testing', True)  # let the error reach the test
+    with pytest.raises(RuntimeError):
+        admin.get('/api/stream')
+    assert not server.dashboard_events.has_subscribers()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Delta sync for the mobile wallet (/api/mobile/user/cards?since=<cursor>)
+
+Every insert, update and delete on rewards takes the next value of the
+database's sync_clock and stamps it on the row, or on a card_tombstones
+row for a delete (see schema.sql). A cursor records the clock of each card
+database (one, or one per shard) as of the last sync, so a resume reads
+only the user's cards and tombstones stamped after it: usually nothing, or
+the one card that was just punched.
+
+Company edits don't touch card rows, but every card embeds its company and
+cards of a deactivated company must disappear. The cursor therefore also
+records catalog_version, and a delta across a catalog change is refused
+(StaleCursor) so the client gets a full wallet instead.
+
+Each database is read in a single snapshot so the clock in the new cursor
+covers exactly the rows returned.
+
+The same stamps give cheap ETags (wallet_etag, card_etag): the newest
+version among the user's cards and tombstones plus the catalog version
+changes whenever anything in the response could, and is read from the
+(user_id, version) indexes before any JOIN runs.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from cards import fetch_card_rows, merge_newest_first, serialize_card
+
+WALLET_WHERE = 'WHERE r.user_id = ? AND c.is_active = 1 ORDER BY r.updated_at DESC'
+CHANGED_WHERE = 'WHERE r.user_id = ? AND r.version > ? AND c.is_active = 1 ORDER BY r.updated_at DESC'
+DELETED_SQL = 'SELECT card_id FROM card_tombstones WHERE user_id = ? AND version > ? ORDER BY version'
+
+# catalog_version resolves through the attached directory on shard connections
+CATALOG_VERSION_SQL = '(SELECT version FROM catalog_version WHERE id = 1)'
+USER_VERSION_SQL = (
+    'SELECT (SELECT max(version) FROM rewards WHERE user_id = ?), '
+    '(SELECT max(version) FROM card_tombstones WHERE user_id = ?), ' + CATALOG_VERSION_SQL
+)
+CARD_VERSION_SQL = 'SELECT version, ' + CATALOG_VERSION_SQL + ' FROM rewards WHERE id = ? AND user_id = ?'
+
+
+class BadCursor(ValueError):
+    """A cursor we didn't issue, or one from a different storage layout"""
+
+
+class StaleCursor(BadCursor):
+    """The company catalog changed since the cursor was issued"""
+
+
+def encode_cursor(catalog, versions):
+    values = [catalog] + versions
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, count):
+    """(catalog version, clock values for count databases); raises BadCursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise BadCursor(cursor)
+    if (not isinstance(values, list) or len(values) != count + 1
+            or not all(isinstance(v, int) and v >= 0 for v in values)):
+        raise BadCursor(cursor)
+    return values[0], values[1:]
+
+
+def read_clock(conn):
+    return conn.execute('SELECT version FROM sync_clock WHERE id = 1').fetchone()[0]
+
+
+def read_catalog_version(conn):
+    return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+
+
+def full_sync(conns, user_id):
+    """Every active card for the user; returns (cards, cursor)"""
+    row_lists, versions, catalog = [], [], None
+    for conn in conns:
+        conn.execute('BEGIN')
+        try:
+            if catalog is None:
+                catalog = read_catalog_version(conn)  # same snapshot as the companies joined below
+            versions.append(read_clock(conn))
+            row_lists.append(fetch_card_rows(conn, WALLET_WHERE, (user_id,)))
+        finally:
+            conn.rollback()
+    return [serialize_card(row) for row in merge_newest_first(row_lists)], encode_cursor(catalog, versions)
+
+
+def delta_sync(conns, user_id, cursor):
+    """
+    Cards changed and card ids deleted since cursor; returns (cards, deleted, new cursor).
+    Raises BadCursor if the cursor can't be used (the client should do a full sync).
+    """
+    catalog, since = decode_cursor(cursor, len(conns))
+    row_lists, deleted, versions = [], [], []
+    for index, (conn, version) in enumerate(zip(conns, since)):
+        conn.execute('BEGIN')
+        try:
+            if index == 0 and read_catalog_version(conn) != catalog:
+                raise StaleCursor(cursor)
+            clock = read_clock(conn)
+            if version > clock:
+                raise BadCursor(cursor)  # issued by a database that has since been reset
+            versions.append(clock)
+            if version == clock:
+                continue  # nothing written to this database since the last sync
+            row_lists.append(fetch_card_rows(conn, CHANGED_WHERE, (user_id, version)))
+            deleted += [row[0] for row in conn.execute(DELETED_SQL, (user_id, version))]
+        finally:
+            conn.rollback()
+    rows = merge_newest_first(row_lists) if row_lists else []
+    return [serialize_card(row) for row in rows], deleted, encode_cursor(catalog, versions)
+
+
+def _etag(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def wallet_etag(conns, user_id, since=None):
+    """
+    Validator for the user's card list (or a delta from since). Weak: a
+    cursor minted later by other users' writes doesn't change the cards.
+    """
+    return _etag(user_id, since, [tuple(conn.execute(USER_VERSION_SQL, (user_id, user_id)).fetchone()) for conn in conns])
+
+
+def card_etag(conn, card_id, user_id):
+    """Validator for one card, or None if the user has no card with that id"""
+    row = conn.execute(CARD_VERSION_SQL, (card_id, user_id)).fetchone()
+    return row and _etag(card_id, tuple(row))